@@ -6,7 +6,20 @@ from bets.forms import (
     QuotaForm,
     TransactionForm,
 )
-from bets.models import Affair, Bet, Event, Prize, Quota, Transaction
+from bets.models import (
+    Account,
+    Affair,
+    Bet,
+    Event,
+    EventExposure,
+    OddsFormula,
+    Prize,
+    Quota,
+    QuotaExposure,
+    SettlementJob,
+    Transaction,
+    UserExposure,
+)
 from django.contrib import admin
 
 
@@ -91,3 +104,92 @@ class PrizeAdmin(admin.ModelAdmin):
     """
 
     form = PrizeForm
+
+
+@admin.register(SettlementJob)
+class SettlementJobAdmin(admin.ModelAdmin):
+    """
+    Admin class for SettlementJob model
+    """
+
+    list_display = (
+        "event",
+        "completed",
+        "status",
+        "settled_bets",
+        "total_bets",
+        "creation_date",
+    )
+    readonly_fields = ("last_bet_id", "settled_bets", "total_bets", "error")
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    """
+    Admin class for Account model
+    """
+
+    list_display = (
+        "user",
+        "balance",
+        "modification_date",
+    )
+    readonly_fields = ("balance",)
+
+
+@admin.register(OddsFormula)
+class OddsFormulaAdmin(admin.ModelAdmin):
+    """
+    Admin class for OddsFormula model
+    """
+
+    list_display = (
+        "name",
+        "method",
+        "parameter",
+        "active",
+    )
+
+
+class ExposureAdmin(admin.ModelAdmin):
+    """
+    Admin class for the exposure models, whose totals are only changed by
+    placements and settlements
+    """
+
+    list_display = (
+        "bets",
+        "stake",
+        "liability",
+        "max_stake",
+        "max_liability",
+        "modification_date",
+    )
+    readonly_fields = ("bets", "stake", "liability")
+
+
+@admin.register(QuotaExposure)
+class QuotaExposureAdmin(ExposureAdmin):
+    """
+    Admin class for QuotaExposure model
+    """
+
+    list_display = ("quota",) + ExposureAdmin.list_display
+
+
+@admin.register(EventExposure)
+class EventExposureAdmin(ExposureAdmin):
+    """
+    Admin class for EventExposure model
+    """
+
+    list_display = ("event",) + ExposureAdmin.list_display
+
+
+@admin.register(UserExposure)
+class UserExposureAdmin(ExposureAdmin):
+    """
+    Admin class for UserExposure model
+    """
+
+    list_display = ("user",) + ExposureAdmin.list_display
@@ -1,6 +1,30 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class BetsConfig(AppConfig):
     name = "bets"
     verbose_name = "Apuestas"
+
+    def ready(self):
+        from bets.models import Affair, Event, OddsFormula, Quota, Tag
+        from bets.odds import invalidate_pricer
+        from bets.pubsub import publish_event, publish_quota
+        from bets.response_cache import (
+            invalidate_responses,
+            invalidate_tag_responses,
+        )
+        from bets.tags import invalidate_tags
+
+        post_save.connect(invalidate_pricer, sender=OddsFormula)
+        post_delete.connect(invalidate_pricer, sender=OddsFormula)
+        post_save.connect(publish_quota, sender=Quota)
+        post_save.connect(publish_event, sender=Event)
+        for model in (Tag, Affair, Event, Quota):
+            post_save.connect(invalidate_responses, sender=model)
+            post_delete.connect(invalidate_responses, sender=model)
+        post_save.connect(invalidate_tags, sender=Tag)
+        post_delete.connect(invalidate_tags, sender=Tag)
+        m2m_changed.connect(
+            invalidate_tag_responses, sender=Affair.tags.through
+        )
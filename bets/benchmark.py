@@ -0,0 +1,640 @@
+import random
+import re
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bets.exposure import exposure_ctes
+from bets.ledger import BET_PLACEMENT, PRIZE_PAYOUT, table_name
+from bets.models import (
+    Account,
+    Affair,
+    Bet,
+    Event,
+    EventExposure,
+    LedgerEntry,
+    Prize,
+    Quota,
+    QuotaExposure,
+    Tag,
+    Transaction,
+    UserExposure,
+)
+from bets.odds import get_pricer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.utils import timezone
+from j8bet_backend.constants import BET_CONSUMER, BET_MANAGER
+
+EXECUTION_TIME_RE = re.compile(r"Execution Time: ([\d.]+) ms")
+
+# Date on which datasets are generated unless another one is given, so the
+# same seed always generates the same dates
+SEED_DATE = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+# Sequence number and ID of each User and Quota of a load, from which the
+# generated Bets pick their owners
+SEED_LOAD_TABLES_SQL = """
+    CREATE TEMPORARY TABLE seed_user (
+        n integer PRIMARY KEY,
+        id integer NOT NULL
+    );
+    CREATE TEMPORARY TABLE seed_quota (
+        n integer PRIMARY KEY,
+        id integer NOT NULL,
+        event_id integer NOT NULL,
+        coeficient numeric NOT NULL,
+        outcome boolean,
+        settlement_date timestamp with time zone
+    )
+"""
+
+# Creates a batch of Users, along with their Group and their empty Account.
+# IDs are taken from the sequence beforehand, so the sequence numbers can be
+# kept without relying on the insertion order.
+SEED_USERS_SQL = """
+    WITH numbered AS (
+        INSERT INTO seed_user (n, id)
+        SELECT n, nextval(pg_get_serial_sequence(%(user_table)s, 'id'))
+        FROM generate_series(%(start)s, %(stop)s - 1) AS n
+        RETURNING n, id
+    ),
+    users AS (
+        INSERT INTO {user}
+            (id, password, is_superuser, username, first_name, last_name,
+            email, is_staff, is_active, date_joined)
+        SELECT id, '!', FALSE, %(prefix)s || '-' || n, '', '',
+            %(prefix)s || '-' || n || '@example.com', FALSE, TRUE,
+            %(now)s - random() * interval '730 days'
+        FROM numbered
+    ),
+    groups AS (
+        INSERT INTO {user_groups} (user_id, group_id)
+        SELECT id,
+            CASE
+                WHEN n < %(managers)s THEN %(manager_group)s
+                ELSE %(consumer_group)s
+            END
+        FROM numbered
+    )
+    INSERT INTO {account} (user_id, balance, modification_date)
+    SELECT id, 0, %(now)s FROM numbered
+"""
+
+# Creates a batch of Events along with their Quotas, the last of which is
+# the active one on open Events. Quotas are found by the unique name of
+# their Event and numbered in order of creation.
+SEED_EVENTS_SQL = """
+    WITH events AS (
+        INSERT INTO {event}
+            (manager_id, affair_id, name, description, expiration_date,
+            active, completed, creation_date, modification_date)
+        SELECT event.*, %(now)s, %(now)s
+        FROM unnest(
+            %(manager_ids)s::integer[],
+            %(affair_ids)s::integer[],
+            %(names)s::varchar[],
+            %(descriptions)s::text[],
+            %(expiration_dates)s::timestamp with time zone[],
+            %(active)s::boolean[],
+            %(completed)s::boolean[]
+        ) AS event
+        RETURNING id, name, manager_id, expiration_date, active, completed
+    ),
+    quotas AS (
+        INSERT INTO {quota}
+            (manager_id, event_id, probability, coeficient, expiration_date,
+            active, creation_date, modification_date)
+        SELECT events.manager_id, events.id, quota.probability,
+            quota.coeficient, events.expiration_date,
+            events.active AND quota.number = %(quotas_per_event)s - 1,
+            %(now)s, %(now)s
+        FROM unnest(
+            %(event_names)s::varchar[],
+            %(numbers)s::integer[],
+            %(probabilities)s::numeric[],
+            %(coeficients)s::numeric[]
+        ) AS quota (event_name, number, probability, coeficient)
+        INNER JOIN events ON events.name = quota.event_name
+        ORDER BY events.id, quota.number
+        RETURNING id, event_id, coeficient
+    )
+    INSERT INTO seed_quota
+        (n, id, event_id, coeficient, outcome, settlement_date)
+    SELECT %(first_quota)s + row_number() OVER (ORDER BY quotas.id) - 1,
+        quotas.id, quotas.event_id, quotas.coeficient, events.completed,
+        CASE WHEN events.active THEN NULL ELSE events.expiration_date END
+    FROM quotas
+    INNER JOIN events ON events.id = quotas.event_id
+"""
+
+# Creates a batch of Transactions and Bets placed by random bettors on
+# random Quotas, at the coeficient of the Quota. Bets on settled Events are
+# won or lost following the Event, and won ones get their Prize. Placements
+# and payouts are posted to the ledger, whose balances are added up later.
+SEED_LOAD_BETS_SQL = """
+    WITH picks AS (
+        SELECT
+            nextval(pg_get_serial_sequence(%(transaction_table)s, 'id'))
+                AS transaction_id,
+            nextval(pg_get_serial_sequence(%(bet_table)s, 'id')) AS bet_id,
+            %(managers)s + floor(random() * %(bettors)s)::integer AS user_n,
+            floor(random() * %(quotas)s)::integer AS quota_n,
+            round((1 + random() * 99)::numeric, 2) AS amount,
+            random() AS age
+        FROM generate_series(%(start)s, %(stop)s - 1)
+    ),
+    placed AS (
+        SELECT picks.transaction_id, picks.bet_id, picks.amount,
+            seed_user.id AS user_id, seed_quota.id AS quota_id,
+            seed_quota.coeficient, seed_quota.outcome AS won,
+            seed_quota.settlement_date,
+            round(picks.amount * seed_quota.coeficient, 2)
+                AS potential_earnings,
+            COALESCE(seed_quota.settlement_date, %(now)s)
+                - picks.age * interval '90 days' AS creation_date
+        FROM picks
+        INNER JOIN seed_user ON seed_user.n = picks.user_n
+        INNER JOIN seed_quota ON seed_quota.n = picks.quota_n
+    ),
+    transactions AS (
+        INSERT INTO {transaction}
+            (id, user_id, amount, description, creation_date,
+            modification_date)
+        SELECT transaction_id, user_id, amount, %(placement)s,
+            creation_date, creation_date
+        FROM placed
+    ),
+    bets AS (
+        INSERT INTO {bet}
+            (id, transaction_id, quota_id, user_id, coeficient,
+            potential_earnings, won, active, creation_date,
+            modification_date)
+        SELECT bet_id, transaction_id, quota_id, user_id, coeficient,
+            potential_earnings, won, won IS NULL, creation_date,
+            COALESCE(settlement_date, creation_date)
+        FROM placed
+    ),
+    prizes AS (
+        INSERT INTO {prize} (bet_id, user_id, reward, creation_date)
+        SELECT bet_id, user_id, potential_earnings, settlement_date
+        FROM placed
+        WHERE won
+        RETURNING id, user_id, reward, creation_date
+    ),
+    charges AS (
+        INSERT INTO {entry}
+            (account_id, amount, description, transaction_id, creation_date)
+        SELECT account.id, -placed.amount, %(placement)s,
+            placed.transaction_id, placed.creation_date
+        FROM placed
+        INNER JOIN {account} AS account ON account.user_id = placed.user_id
+    )
+    INSERT INTO {entry}
+        (account_id, amount, description, prize_id, creation_date)
+    SELECT account.id, prizes.reward, %(payout)s, prizes.id,
+        prizes.creation_date
+    FROM prizes
+    INNER JOIN {account} AS account ON account.user_id = prizes.user_id
+"""
+
+SEED_BALANCES_SQL = """
+    UPDATE {account} AS account
+    SET balance = totals.balance, modification_date = %(now)s
+    FROM (
+        SELECT entry.account_id, SUM(entry.amount) AS balance
+        FROM {entry} AS entry
+        INNER JOIN {account} AS account ON account.id = entry.account_id
+        INNER JOIN seed_user ON seed_user.id = account.user_id
+        GROUP BY entry.account_id
+    ) AS totals
+    WHERE account.id = totals.account_id
+"""
+
+# Adds the open Bets of a load to the exposures of their owners
+SEED_EXPOSURES_SQL = """
+    WITH placed AS (
+        SELECT bet.quota_id, seed_quota.event_id, bet.user_id,
+            COUNT(*) AS bets, SUM(trx.amount) AS stake,
+            SUM(bet.potential_earnings) AS liability
+        FROM {bet} AS bet
+        INNER JOIN seed_quota ON seed_quota.id = bet.quota_id
+        INNER JOIN {transaction} AS trx ON trx.id = bet.transaction_id
+        WHERE bet.won IS NULL
+        GROUP BY bet.quota_id, seed_quota.event_id, bet.user_id
+    ),
+    {ctes}
+    SELECT COUNT(*) FROM placed
+"""
+
+# Words from which the descriptions of a load are made up, so that searches
+# find a realistic share of them
+SEED_WORDS = (
+    "football",
+    "tennis",
+    "basketball",
+    "election",
+    "final",
+    "league",
+    "champion",
+    "goals",
+    "match",
+    "season",
+    "tournament",
+    "winner",
+    "record",
+    "derby",
+    "playoff",
+    "cup",
+)
+
+
+class QueryCounter:
+    """
+    Database execute wrapper which counts the statements sent to the server.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(latencies, fraction):
+    """
+    Returns a percentile of sorted latencies in milliseconds, or None.
+    """
+
+    if not latencies:
+        return None
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)] * 1000
+
+
+def unique_prefix():
+    """
+    Returns a prefix for the names of a dataset which is deleted after a
+    benchmark, so it never clashes with a loaded one.
+    """
+
+    return "benchmark-{}".format(uuid.uuid4().hex[:8])
+
+
+class LoadSeeder:
+    """
+    Generator of a large, consistent dataset for benchmarks on PostgreSQL.
+    The catalog is generated in Python, with Quotas priced by the active
+    OddsFormula: Tags and Affairs are saved with bulk_create, and Events
+    with their Quotas by a single statement per batch. Users, Transactions,
+    Bets, Prizes and the ledger are generated by the database in batches.
+    Every Event is either open, with a single active Quota and open Bets,
+    or settled, with its Bets won or lost and the Prizes paid.
+    The same seed and sizes always generate the same data.
+
+    :cvar users: Amount of Users, the first managers of which manage the
+        catalog while the rest place Bets
+    :cvar tags: Amount of Tags
+    :cvar affairs: Amount of Affairs
+    :cvar events: Amount of Events, spread evenly across the Affairs
+    :cvar quotas_per_event: Amount of Quotas of each Event
+    :cvar bets: Amount of Bets
+    :cvar settled: Share of settled Events
+    :cvar batch_size: Amount of rows created per statement
+    :cvar now: Date on which the dataset is generated
+    :cvar prefix: Prefix of the names of Users, Tags and Events, load-<seed>
+        by default
+    """
+
+    def __init__(
+        self,
+        users,
+        tags,
+        affairs,
+        events,
+        quotas_per_event,
+        bets,
+        managers=10,
+        settled=0.5,
+        seed=0,
+        batch_size=10000,
+        now=SEED_DATE,
+        prefix=None,
+    ):
+        self.users = users
+        self.managers = managers
+        self.tags = tags
+        self.affairs = affairs
+        self.events = events
+        self.quotas_per_event = quotas_per_event
+        self.bets = bets
+        self.settled = settled
+        self.seed = seed
+        self.batch_size = batch_size
+        self.prefix = prefix or "load-{}".format(seed)
+        self.rng = random.Random(seed)
+        self.now = now
+        self.manager_ids = list()
+        self.tag_ids = list()
+        self.affair_ids = list()
+        self.quotas = 0
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    def create_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute(SEED_LOAD_TABLES_SQL)
+
+    def drop_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE seed_user, seed_quota")
+
+    def seed_users(self):
+        User = get_user_model()
+        # Groups are created by a migration, and gone after a flush
+        groups = {
+            name: Group.objects.get_or_create(name=name)[0].id
+            for name in (BET_MANAGER, BET_CONSUMER)
+        }
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setseed(%s)", [self.rng.uniform(-1, 1)])
+            for start, stop in self.batches(self.users):
+                cursor.execute(
+                    SEED_USERS_SQL.format(
+                        user=table_name(User),
+                        user_groups=table_name(User.groups.through),
+                        account=table_name(Account),
+                    ),
+                    {
+                        "user_table": User._meta.db_table,
+                        "start": start,
+                        "stop": stop,
+                        "prefix": self.prefix,
+                        "managers": self.managers,
+                        "manager_group": groups[BET_MANAGER],
+                        "consumer_group": groups[BET_CONSUMER],
+                        "now": self.now,
+                    },
+                )
+            cursor.execute(
+                "SELECT id FROM seed_user WHERE n < %s ORDER BY n",
+                [self.managers],
+            )
+            self.manager_ids = [row[0] for row in cursor.fetchall()]
+
+    def description(self, number):
+        return "{} {}".format(" ".join(self.rng.sample(SEED_WORDS, 3)), number)
+
+    def seed_tags(self):
+        for start, stop in self.batches(self.tags):
+            names = [
+                "{} {} {}".format(
+                    self.prefix, SEED_WORDS[number % len(SEED_WORDS)], number
+                )
+                for number in range(start, stop)
+            ]
+            self.tag_ids.extend(
+                tag.id
+                for tag in Tag.objects.bulk_create(
+                    Tag(name=name, normalized_name=Tag.normalize(name))
+                    for name in names
+                )
+            )
+
+    def seed_affairs(self):
+        AffairTag = Affair.tags.through
+        for start, stop in self.batches(self.affairs):
+            affairs = Affair.objects.bulk_create(
+                Affair(
+                    manager_id=self.rng.choice(self.manager_ids),
+                    description=self.description(number),
+                )
+                for number in range(start, stop)
+            )
+            AffairTag.objects.bulk_create(
+                AffairTag(affair_id=affair.id, tag_id=tag_id)
+                for affair in affairs
+                for tag_id in self.rng.sample(
+                    self.tag_ids,
+                    min(self.rng.randint(1, 3), len(self.tag_ids)),
+                )
+            )
+            self.affair_ids.extend(affair.id for affair in affairs)
+
+    def seed_events(self):
+        pricer = get_pricer()
+        for start, stop in self.batches(self.events):
+            events = {
+                "manager_ids": list(),
+                "affair_ids": list(),
+                "names": list(),
+                "descriptions": list(),
+                "expiration_dates": list(),
+                "active": list(),
+                "completed": list(),
+            }
+            for number in range(start, stop):
+                settled = self.rng.random() < self.settled
+                days = timedelta(days=self.rng.uniform(1, 365))
+                events["manager_ids"].append(self.rng.choice(self.manager_ids))
+                events["affair_ids"].append(
+                    self.affair_ids[number % len(self.affair_ids)]
+                )
+                events["names"].append(
+                    "{} event {}".format(self.prefix, number)
+                )
+                events["descriptions"].append(self.description(number))
+                events["expiration_dates"].append(
+                    self.now - days if settled else self.now + days
+                )
+                events["active"].append(not settled)
+                events["completed"].append(
+                    self.rng.random() < 0.5 if settled else None
+                )
+            probabilities = [
+                Decimal("{:.5f}".format(self.rng.uniform(0.01, 0.99)))
+                for _ in range(len(events["names"]) * self.quotas_per_event)
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    SEED_EVENTS_SQL.format(
+                        event=table_name(Event), quota=table_name(Quota)
+                    ),
+                    dict(
+                        events,
+                        event_names=[
+                            name
+                            for name in events["names"]
+                            for _ in range(self.quotas_per_event)
+                        ],
+                        numbers=list(range(self.quotas_per_event))
+                        * len(events["names"]),
+                        probabilities=probabilities,
+                        coeficients=pricer(probabilities),
+                        quotas_per_event=self.quotas_per_event,
+                        first_quota=self.quotas,
+                        now=self.now,
+                    ),
+                )
+            self.quotas += len(probabilities)
+
+    def seed_bets(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setseed(%s)", [self.rng.uniform(-1, 1)])
+            for start, stop in self.batches(self.bets):
+                cursor.execute(
+                    SEED_LOAD_BETS_SQL.format(
+                        transaction=table_name(Transaction),
+                        bet=table_name(Bet),
+                        prize=table_name(Prize),
+                        account=table_name(Account),
+                        entry=table_name(LedgerEntry),
+                    ),
+                    {
+                        "transaction_table": Transaction._meta.db_table,
+                        "bet_table": Bet._meta.db_table,
+                        "managers": self.managers,
+                        "bettors": self.users - self.managers,
+                        "quotas": self.quotas,
+                        "start": start,
+                        "stop": stop,
+                        "now": self.now,
+                        "placement": BET_PLACEMENT,
+                        "payout": PRIZE_PAYOUT,
+                    },
+                )
+
+    def seed_balances(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SEED_BALANCES_SQL.format(
+                    account=table_name(Account), entry=table_name(LedgerEntry)
+                ),
+                {"now": self.now},
+            )
+            cursor.execute(
+                SEED_EXPOSURES_SQL.format(
+                    bet=table_name(Bet),
+                    transaction=table_name(Transaction),
+                    ctes=exposure_ctes("placed"),
+                ),
+                {"now": self.now},
+            )
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            for model in (
+                get_user_model(),
+                Account,
+                Tag,
+                Affair,
+                Event,
+                Quota,
+                Transaction,
+                Bet,
+                Prize,
+                LedgerEntry,
+                QuotaExposure,
+                EventExposure,
+                UserExposure,
+            ):
+                cursor.execute("ANALYZE {}".format(table_name(model)))
+
+    def steps(self):
+        """
+        Returns the steps of the load in order, with their names. They must
+        run on the same transaction.
+        """
+
+        return [
+            ("tables", self.create_tables),
+            ("users", self.seed_users),
+            ("tags", self.seed_tags),
+            ("affairs", self.seed_affairs),
+            ("events", self.seed_events),
+            ("bets", self.seed_bets),
+            ("balances", self.seed_balances),
+            ("cleanup", self.drop_tables),
+            ("analyze", self.analyze),
+        ]
+
+    def load(self):
+        """
+        Runs every step of the load. It must run on a transaction.
+        """
+
+        for _, step in self.steps():
+            step()
+
+    def users_queryset(self):
+        return get_user_model().objects.filter(
+            username__startswith=self.prefix + "-"
+        )
+
+    def loaded(self):
+        """
+        Returns whether a dataset with the prefix of this one is loaded.
+        """
+
+        return self.users_queryset().exists()
+
+    def seeded(self):
+        """
+        Returns the IDs of the loaded objects, in order of creation.
+
+        :return: Dictionary with the IDs of the managers, the bettors, the
+            Events and their Quotas
+        """
+
+        users = self.users_queryset().order_by("id")
+        events = list(
+            Event.objects.filter(name__startswith=self.prefix + " event ")
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return {
+            "managers": list(
+                users.filter(groups__name=BET_MANAGER).values_list(
+                    "id", flat=True
+                )
+            ),
+            "bettors": list(
+                users.filter(groups__name=BET_CONSUMER).values_list(
+                    "id", flat=True
+                )
+            ),
+            "events": events,
+            "quotas": list(
+                Quota.objects.filter(event_id__in=events)
+                .order_by("id")
+                .values_list("id", flat=True)
+            ),
+        }
+
+    def delete(self):
+        """
+        Deletes the loaded dataset.
+        """
+
+        # Seeded objects cascade from their users
+        self.users_queryset().delete()
+        Tag.objects.filter(name__startswith=self.prefix + " ").delete()
+
+
+def explain_analyze(queryset):
+    """
+    Runs EXPLAIN ANALYZE for a queryset.
+
+    :param queryset: Queryset to explain
+    :return: Dictionary with the plan and the execution time in milliseconds
+    """
+
+    plan = queryset.explain(analyze=True)
+    match = EXECUTION_TIME_RE.search(plan)
+    return {
+        "plan": plan,
+        "execution_time": float(match.group(1)) if match else None,
+    }
@@ -0,0 +1,315 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from bets.ledger import table_name
+from bets.models import (
+    Bet,
+    Event,
+    EventExposure,
+    Quota,
+    QuotaExposure,
+    Transaction,
+    UserExposure,
+)
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+Totals = namedtuple("Totals", ["bets", "stake", "liability"])
+ExposureMismatch = namedtuple(
+    "ExposureMismatch", ["scope", "object_id", "stored", "expected"]
+)
+
+EMPTY_TOTALS = Totals(0, Decimal(0), Decimal(0))
+
+# Exposure model of each scope, with its owner column and the lookup from
+# Bets to the owner
+SCOPES = {
+    "quota": (QuotaExposure, "quota_id", "quota_id"),
+    "event": (EventExposure, "event_id", "quota__event_id"),
+    "user": (UserExposure, "user_id", "user_id"),
+}
+
+# Adds the totals of the deltas of a source to the exposures of one scope,
+# creating them on the first Bet. Rows are upserted in a fixed order, as
+# Accounts are on the ledger, to avoid deadlocks between statements.
+EXPOSURE_CTE = """
+    {name} AS (
+        INSERT INTO {table} AS exposure
+            ({column}, bets, stake, liability, modification_date)
+        SELECT {column}, SUM(bets), SUM(stake), SUM(liability), %(now)s
+        FROM {source}
+        GROUP BY {column}{having}
+        ORDER BY {column}
+        ON CONFLICT ({column}) DO UPDATE
+        SET bets = exposure.bets + EXCLUDED.bets,
+            stake = exposure.stake + EXCLUDED.stake,
+            liability = exposure.liability + EXCLUDED.liability,
+            modification_date = EXCLUDED.modification_date{where}
+        RETURNING {column}
+    )"""
+
+# Conditions which skip the new and the updated exposures exceeding their
+# limits, each exposure being checked by one of them. New exposures can not
+# have limits of their own yet, so they are checked against the limits of
+# their scope, while existing ones are checked on the update, with their
+# own limits if they have any. The conflicting row is locked and read again
+# before the update is evaluated, so concurrent statements are checked
+# against each other's totals. A NULL limit is not enforced.
+LIMIT_HAVING = """
+        HAVING EXISTS (
+            SELECT 1 FROM {table} AS current
+            WHERE current.{column} = {source}.{column}
+        ) OR (
+            (SUM(stake) <= %({scope}_stake)s) IS NOT FALSE
+            AND (SUM(liability) <= %({scope}_liability)s) IS NOT FALSE
+        )"""
+LIMIT_WHERE = """
+        WHERE (
+            exposure.stake + EXCLUDED.stake
+            <= COALESCE(exposure.max_stake, %({scope}_stake)s)
+        ) IS NOT FALSE AND (
+            exposure.liability + EXCLUDED.liability
+            <= COALESCE(exposure.max_liability, %({scope}_liability)s)
+        ) IS NOT FALSE"""
+
+# Adds the stored amounts of some Bets to every exposure. Reading them back
+# from the database keeps the totals equal to the rounded stored values.
+PLACEMENT_EXPOSURE_SQL = """
+    WITH placed AS (
+        SELECT bet.quota_id, quota.event_id, bet.user_id, 1 AS bets,
+            trx.amount AS stake, bet.potential_earnings AS liability
+        FROM {bet} AS bet
+        INNER JOIN {quota} AS quota ON quota.id = bet.quota_id
+        INNER JOIN {transaction} AS trx ON trx.id = bet.transaction_id
+        WHERE bet.id = ANY(%(bet_ids)s)
+    ),
+    {ctes}
+    SELECT {exceeded}
+"""
+
+# Whether some exposure of a scope was skipped for exceeding its limits
+EXCEEDED_SQL = """
+        (SELECT COUNT(*) FROM {name})
+        < (SELECT COUNT(DISTINCT {column}) FROM placed)"""
+
+
+class LimitExceeded(Exception):
+    """
+    Raised when placed Bets exceed the limits of an exposure. The statement
+    which raised it has changed some exposures, so its transaction must be
+    rolled back.
+    """
+
+    def __init__(self, scope):
+        super().__init__(
+            "The open bets exceed the limits of the {}.".format(scope)
+        )
+        self.scope = scope
+
+
+def exposure_ctes(source, limits=None):
+    """
+    Returns the common table expressions which add the deltas of a source
+    to the exposures of every scope. The source must have the quota_id,
+    event_id, user_id, bets, stake and liability columns, and the %(now)s
+    parameter must be given, along with the parameters of limit_params if
+    limits are enforced.
+
+    :param source: Name of the source table expression
+    :param limits: Whether exposures exceeding their limits are skipped
+    """
+
+    return ",".join(
+        EXPOSURE_CTE.format(
+            name="{}_exposures".format(scope),
+            table=table_name(model),
+            column=column,
+            source=source,
+            having=(
+                LIMIT_HAVING.format(
+                    table=table_name(model),
+                    column=column,
+                    source=source,
+                    scope=scope,
+                )
+                if limits
+                else ""
+            ),
+            where=LIMIT_WHERE.format(scope=scope) if limits else "",
+        )
+        for scope, (model, column, _) in SCOPES.items()
+    )
+
+
+def limit_params(limits):
+    """
+    Returns the query parameters of the limits of every scope.
+
+    :param limits: Dictionary with the "stake" and "liability" limits of
+        each scope, like EXPOSURE_LIMITS. Missing limits are not enforced
+    """
+
+    return {
+        "{}_{}".format(scope, total): limits.get(scope, dict()).get(total)
+        for scope in SCOPES
+        for total in ("stake", "liability")
+    }
+
+
+def add_placed_bets(bet_ids, limits=None):
+    """
+    Adds placed Bets to the exposures of their Quotas, Events and Users
+    with a single statement, which must run on the placement transaction.
+    Limits are checked by the same statement against the stored totals,
+    without reading any other row.
+
+    :param bet_ids: IDs of the saved Bets
+    :param limits: Limits of each scope, like EXPOSURE_LIMITS, which the
+        exposures can not exceed. The max_stake and max_liability of an
+        exposure replace the ones of its scope
+    :raise LimitExceeded: If the Bets exceed some limit
+    """
+
+    if not bet_ids:
+        return
+    params = {"bet_ids": list(bet_ids), "now": timezone.now()}
+    if limits is not None:
+        params.update(limit_params(limits))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            PLACEMENT_EXPOSURE_SQL.format(
+                bet=table_name(Bet),
+                quota=table_name(Quota),
+                transaction=table_name(Transaction),
+                ctes=exposure_ctes("placed", limits is not None),
+                exceeded=",".join(
+                    EXCEEDED_SQL.format(
+                        name="{}_exposures".format(scope), column=column
+                    )
+                    for scope, (_, column, _) in SCOPES.items()
+                ),
+            ),
+            params,
+        )
+        exceeded = cursor.fetchone()
+    for scope, scope_exceeded in zip(SCOPES, exceeded):
+        if scope_exceeded:
+            raise LimitExceeded(scope)
+
+
+def get_exposure(scope, object_id):
+    """
+    Returns the totals of the open Bets of an object with a single indexed
+    read.
+
+    :param scope: "quota", "event" or "user"
+    :param object_id: ID of the Quota, Event or User
+    :return: Totals, empty if no Bet was ever placed on the object
+    """
+
+    model, column, _ = SCOPES[scope]
+    totals = (
+        model.objects.filter(**{column: object_id})
+        .values_list("bets", "stake", "liability")
+        .first()
+    )
+    return EMPTY_TOTALS if totals is None else Totals(*totals)
+
+
+def open_bet_totals(scope, object_ids):
+    """
+    Aggregates the open Bets of some objects from scratch.
+
+    :return: Dictionary with the Totals of each object with open Bets
+    """
+
+    _, _, lookup = SCOPES[scope]
+    rows = (
+        Bet.objects.filter(
+            won__isnull=True, **{"{}__in".format(lookup): object_ids}
+        )
+        .order_by()
+        .values(lookup)
+        .annotate(
+            count=Count("id"),
+            stake=Sum("transaction__amount"),
+            liability=Sum("potential_earnings"),
+        )
+        .values_list(lookup, "count", "stake", "liability")
+    )
+    return {row[0]: Totals(*row[1:]) for row in rows}
+
+
+def _owner_model(scope):
+    return {"quota": Quota, "event": Event, "user": get_user_model()}[scope]
+
+
+def reconcile_exposures(scope, chunk_size, after_id=0):
+    """
+    Compares the stored exposures of a scope with the totals of the open
+    Bets, rebuilt from scratch. Owners are streamed in chunks, so memory
+    use does not depend on the amount of Bets, and owners missing their
+    exposure are verified too.
+
+    :param scope: "quota", "event" or "user"
+    :param chunk_size: Amount of owners verified per chunk
+    :param after_id: Only owners with a greater ID are verified
+    :return: Generator of tuples with the amount of verified owners and the
+        list of ExposureMismatch of each chunk
+    """
+
+    model, column, _ = SCOPES[scope]
+    owners = _owner_model(scope).objects.order_by("id")
+    while True:
+        object_ids = list(
+            owners.filter(id__gt=after_id).values_list("id", flat=True)[
+                :chunk_size
+            ]
+        )
+        if not object_ids:
+            return
+        after_id = object_ids[-1]
+        stored = {
+            row[0]: Totals(*row[1:])
+            for row in model.objects.filter(
+                **{"{}__in".format(column): object_ids}
+            ).values_list(column, "bets", "stake", "liability")
+        }
+        expected = open_bet_totals(scope, object_ids)
+        yield len(object_ids), [
+            ExposureMismatch(
+                scope,
+                object_id,
+                stored.get(object_id, EMPTY_TOTALS),
+                expected.get(object_id, EMPTY_TOTALS),
+            )
+            for object_id in object_ids
+            if stored.get(object_id, EMPTY_TOTALS)
+            != expected.get(object_id, EMPTY_TOTALS)
+        ]
+
+
+def fix_exposure(scope, object_id):
+    """
+    Sets an exposure to the totals of the open Bets of its owner. The
+    exposure is locked first, so placements and settlements of the owner
+    wait until it is rebuilt and then apply their own changes.
+
+    :param scope: "quota", "event" or "user"
+    :param object_id: ID of the Quota, Event or User
+    :return: The new Totals
+    """
+
+    model, column, _ = SCOPES[scope]
+    with transaction.atomic():
+        exposure, _ = model.objects.select_for_update().get_or_create(
+            **{column: object_id}
+        )
+        totals = open_bet_totals(scope, [object_id]).get(
+            object_id, EMPTY_TOTALS
+        )
+        exposure.bets, exposure.stake, exposure.liability = totals
+        exposure.save()
+    return totals
@@ -0,0 +1,220 @@
+import json
+
+from bets.graphql.loaders import RelatedPage
+from bets.graphql.optimizer import optimize_queryset
+from django.db.models import Manager, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from graphene import Int
+from graphene.relay import Connection, PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+from graphql_relay.connection.arrayconnection import connection_from_list_slice
+from graphql_relay.utils import base64, unbase64
+
+KEYSET_PREFIX = "keyset:"
+
+
+class OptimizedConnectionField(DjangoFilterConnectionField):
+    """
+    Connection field whose queryset is optimized for the selection set of
+    the request: related objects are joined or prefetched, and columns which
+    were not requested are not fetched. Unordered querysets are ordered by
+    primary key, so offset cursors always point to the same nodes.
+
+    :cvar required_fields: Field names loaded even if they were not requested
+    """
+
+    required_fields = ()
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        queryset = super().resolve_queryset(
+            connection,
+            iterable,
+            info,
+            args,
+            filtering_args=filtering_args,
+            filterset_class=filterset_class,
+        )
+        queryset = optimize_queryset(
+            queryset, info, required=cls.required_fields
+        )
+        if not queryset.ordered:
+            queryset = queryset.order_by("pk")
+        return queryset
+
+
+class BatchedConnectionField(OptimizedConnectionField):
+    """
+    Connection field for relations resolved through DataLoaders.
+    Lists (or promises of lists) returned by the resolver are paginated as
+    they are, or as a slice of the relation if they are a RelatedPage,
+    while querysets are filtered and optimized as usual.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not isinstance(iterable, RelatedPage):
+            return super().resolve_connection(
+                connection, args, iterable, max_limit=max_limit
+            )
+        if max_limit is not None and "first" not in args:
+            args["first"] = max_limit
+        resolved = connection_from_list_slice(
+            iterable,
+            args,
+            slice_start=iterable.start,
+            list_length=iterable.total,
+            list_slice_length=len(iterable),
+            connection_type=connection,
+            edge_type=connection.Edge,
+            pageinfo_type=PageInfo,
+        )
+        resolved.iterable = iterable
+        resolved.length = iterable.total
+        return resolved
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        if not isinstance(iterable, (Manager, QuerySet)):
+            return iterable
+        return super().resolve_queryset(
+            connection,
+            iterable,
+            info,
+            args,
+            filtering_args=filtering_args,
+            filterset_class=filterset_class,
+        )
+
+
+class CountableConnection(Connection):
+    """
+    Connection which exposes the amount of objects it pages through.
+    Keyset connections only count them when totalCount is selected.
+    """
+
+    class Meta:
+        abstract = True
+
+    total_count = Int()
+
+    def resolve_total_count(self, info):
+        if getattr(self, "length", None) is None:
+            self.length = self.iterable.count()
+        return self.length
+
+
+def keyset_cursor(node):
+    """
+    Returns the cursor of a node, made of its creation date and its ID.
+    """
+
+    return base64(
+        KEYSET_PREFIX + json.dumps([node.creation_date.isoformat(), node.pk])
+    )
+
+
+def keyset_position(cursor):
+    """
+    Returns the creation date and the ID encoded in a cursor.
+
+    :raise GraphQLError: If the cursor was not made by keyset_cursor
+    """
+
+    try:
+        value = unbase64(cursor)
+        if not value.startswith(KEYSET_PREFIX):
+            raise ValueError(value)
+        creation_date, pk = json.loads(value[len(KEYSET_PREFIX) :])
+        creation_date = parse_datetime(creation_date)
+        if creation_date is None or not isinstance(pk, int):
+            raise ValueError(value)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise GraphQLError("Invalid cursor: {}".format(cursor))
+    return creation_date, pk
+
+
+def _after(position):
+    creation_date, pk = position
+    # The first condition alone lets an index on both columns bound the scan
+    return Q(creation_date__gte=creation_date) & (
+        Q(creation_date__gt=creation_date) | Q(pk__gt=pk)
+    )
+
+
+def _before(position):
+    creation_date, pk = position
+    return Q(creation_date__lte=creation_date) & (
+        Q(creation_date__lt=creation_date) | Q(pk__lt=pk)
+    )
+
+
+class KeysetConnectionField(OptimizedConnectionField):
+    """
+    Connection field ordered by creation date and ID, whose cursors hold the
+    position of their node instead of an offset. Every page is fetched
+    with a single query bounded by the cursors, which costs the same at any
+    depth, and objects are only counted when totalCount is selected.
+    The node type must use CountableConnection as its connection class.
+    """
+
+    required_fields = ("creation_date",)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return super().resolve_connection(
+                connection, args, iterable, max_limit=max_limit
+            )
+        first = args.get("first")
+        last = args.get("last")
+        if (first is not None and first < 0) or (last is not None and last < 0):
+            raise GraphQLError("Arguments first and last can not be negative.")
+        if max_limit is not None and first is None and last is None:
+            first = max_limit
+        queryset = iterable
+        if args.get("after"):
+            queryset = queryset.filter(_after(keyset_position(args["after"])))
+        if args.get("before"):
+            queryset = queryset.filter(_before(keyset_position(args["before"])))
+
+        has_previous_page = bool(args.get("after"))
+        has_next_page = bool(args.get("before"))
+        if first is not None:
+            # One more node tells whether there is a next page
+            nodes = list(queryset.order_by("creation_date", "pk")[: first + 1])
+            has_next_page = len(nodes) > first
+            nodes = nodes[:first]
+            if last is not None and len(nodes) > last:
+                has_previous_page = True
+                nodes = nodes[-last:]
+        elif last is not None:
+            nodes = list(queryset.order_by("-creation_date", "-pk")[: last + 1])
+            has_previous_page = len(nodes) > last
+            nodes = nodes[:last][::-1]
+        else:
+            nodes = list(queryset.order_by("creation_date", "pk"))
+
+        edges = [
+            connection.Edge(node=node, cursor=keyset_cursor(node))
+            for node in nodes
+        ]
+        resolved = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        resolved.iterable = iterable
+        resolved.length = None
+        return resolved
@@ -82,3 +82,12 @@ class QuotaUpdateInput(InputObjectType):
     id = ID()
     expiration_date = DateTime()
     active = Boolean()
+
+
+class BetSlipEntryInput(InputObjectType):
+    """
+    Input class for an entry of a bet slip.
+    """
+
+    quota_id = ID(required=True)
+    amount = Decimal(required=True)
@@ -0,0 +1,245 @@
+from django.db import connection
+from django.db.models import ManyToManyField, ManyToOneRel
+from graphene_django.settings import graphene_settings
+from promise import Promise
+from promise.dataloader import DataLoader
+
+# Arguments of a connection field which do not filter its queryset
+PAGINATION_ARGS = {"first", "last", "before", "after"}
+
+
+class ForeignKeyLoader(DataLoader):
+    """
+    DataLoader for objects targeted by forward relations, which loads every
+    key requested on the same execution level with a single query.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def batch_load_fn(self, keys):
+        objects = self.model._default_manager.in_bulk(keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+# Pages of the related objects of many parents, numbered per parent
+RELATED_PAGE_SQL = """
+SELECT page.* FROM (
+    SELECT
+        related.*,
+        {parent} AS page_parent,
+        ROW_NUMBER() OVER (
+            PARTITION BY {parent} ORDER BY related.{pk}
+        ) - 1 AS page_offset,
+        COUNT(*) OVER (PARTITION BY {parent}) AS page_total
+    FROM {source}
+    WHERE {parent} = ANY(%(keys)s)
+) AS page
+WHERE page.page_offset < LEAST(
+    page.page_total, COALESCE(%(first)s, page.page_total)
+)
+AND page.page_offset >= LEAST(
+    page.page_total, COALESCE(%(first)s, page.page_total)
+) - COALESCE(%(last)s, page.page_total)
+ORDER BY page.page_parent, page.page_offset
+"""
+
+
+class RelatedPage(list):
+    """
+    Related objects of a parent sliced by first and last, which knows the
+    offset of its first object and the amount of objects of the parent, so
+    it can be paginated as a slice of the whole relation.
+    """
+
+    def __init__(self, objects=(), start=0, total=0):
+        super().__init__(objects)
+        self.start = start
+        self.total = total
+
+
+class RelatedPageLoader(DataLoader):
+    """
+    Base DataLoader for relations which load the related objects of every
+    requested parent with a single query. Only the page of each parent
+    selected by first and last is fetched, numbered by a window function.
+
+    :cvar model: Related model
+    :cvar parent: Column of the parent key
+    :cvar source: FROM clause, with the related table aliased as related
+    """
+
+    model = None
+    parent = None
+    source = None
+
+    def __init__(self, first=None, last=None):
+        super().__init__()
+        self.first = first
+        self.last = last
+
+    def batch_load_fn(self, keys):
+        sql = RELATED_PAGE_SQL.format(
+            parent=self.parent,
+            pk=connection.ops.quote_name(self.model._meta.pk.column),
+            source=self.source,
+        )
+        params = dict(keys=list(keys), first=self.first, last=self.last)
+        pages = dict()
+        for obj in self.model._default_manager.raw(sql, params):
+            page = pages.setdefault(
+                obj.page_parent,
+                RelatedPage(start=obj.page_offset, total=obj.page_total),
+            )
+            page.append(obj)
+        return Promise.resolve([pages.get(key, RelatedPage()) for key in keys])
+
+
+class ReverseForeignKeyLoader(RelatedPageLoader):
+    """
+    DataLoader for reverse foreign key relations, which loads the related
+    objects of every requested parent with a single query.
+    """
+
+    def __init__(self, relation, first=None, last=None):
+        super().__init__(first, last)
+        self.model = relation.related_model
+        quote_name = connection.ops.quote_name
+        self.parent = "related." + quote_name(relation.field.column)
+        self.source = "{} AS related".format(
+            quote_name(self.model._meta.db_table)
+        )
+
+
+class ManyToManyLoader(RelatedPageLoader):
+    """
+    DataLoader for many to many relations, which loads the related objects of
+    every requested parent with a single query over the intermediate table.
+    """
+
+    def __init__(self, field, first=None, last=None):
+        super().__init__(first, last)
+        through = field.remote_field.through._meta
+        source = through.get_field(field.m2m_field_name())
+        target = through.get_field(field.m2m_reverse_field_name())
+        self.model = target.related_model
+        quote_name = connection.ops.quote_name
+        self.parent = "through." + quote_name(source.column)
+        self.source = (
+            "{through} AS through JOIN {table} AS related "
+            "ON related.{pk} = through.{target}"
+        ).format(
+            through=quote_name(through.db_table),
+            table=quote_name(self.model._meta.db_table),
+            pk=quote_name(target.target_field.column),
+            target=quote_name(target.column),
+        )
+
+
+class Loaders:
+    """
+    Container of the DataLoaders used during a single GraphQL execution.
+    Forward relations share a loader per target model, so every lookup of
+    the same model on an execution level is grouped in one query.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+
+    def get(self, key, loader_class, *args):
+        if key not in self._loaders:
+            self._loaders[key] = loader_class(*args)
+        return self._loaders[key]
+
+    def for_field(self, field, first=None, last=None):
+        """
+        Returns the DataLoader for a model field or relation.
+
+        :param field: Forward, reverse or many to many relation
+        :param first: Amount of related objects from the start of each page
+        :param last: Amount of related objects from the end of each page
+        """
+
+        if isinstance(field, ManyToOneRel):
+            return self.get(
+                (field, first, last),
+                ReverseForeignKeyLoader,
+                field,
+                first,
+                last,
+            )
+        if isinstance(field, ManyToManyField):
+            return self.get(
+                (field, first, last), ManyToManyLoader, field, first, last
+            )
+        model = field.related_model
+        return self.get(model, ForeignKeyLoader, model)
+
+
+def get_loaders(info):
+    """
+    Returns the DataLoaders bound to the request of a GraphQL execution.
+
+    :param info: Request information
+    """
+
+    context = info.context
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = context.loaders = Loaders()
+    return loaders
+
+
+def related_resolver(name):
+    """
+    Builds a resolver which batches a forward relation through DataLoaders.
+    Objects already fetched by select_related are returned right away.
+
+    :param name: Name of the forward relation
+    """
+
+    def resolver(root, info):
+        field = root._meta.get_field(name)
+        if field.is_cached(root):
+            return getattr(root, name)
+        key = getattr(root, field.attname)
+        if key is None:
+            return None
+        loader = get_loaders(info).for_field(field)
+        return loader.load(field.target_field.to_python(key))
+
+    return resolver
+
+
+def related_connection_resolver(name):
+    """
+    Builds a connection resolver which batches a reverse or many to many
+    relation through DataLoaders, which only fetch the page of each parent
+    selected by first and last. Filtered connections and connections paged
+    by cursors are resolved with a queryset, and objects already fetched by
+    prefetch_related are reused.
+
+    :param name: Name of the relation
+    """
+
+    def resolver(root, info, **args):
+        manager = getattr(root, name)
+        if (
+            set(args) - PAGINATION_ARGS
+            or args.get("after")
+            or args.get("before")
+        ):
+            return manager.all()
+        if name in getattr(root, "_prefetched_objects_cache", {}):
+            return list(manager.all())
+        field = root._meta.get_field(name)
+        # Connections without first are limited like graphene-django does
+        first = args.get("first", graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        loader = get_loaders(info).for_field(field, first, args.get("last"))
+        # Primary keys set from user input might not be normalized yet
+        return loader.load(root._meta.pk.to_python(root.pk))
+
+    return resolver
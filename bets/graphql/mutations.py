@@ -1,14 +1,31 @@
 from bets.graphql.input import (
     AffairCreationInput,
     AffairUpdateInput,
+    BetSlipEntryInput,
     EventCreationInput,
     EventUpdateInput,
     QuotaCreationInput,
     QuotaUpdateInput,
 )
-from bets.graphql.types import AffairType, BetType, EventType, QuotaType
-from bets.models import Affair, Bet, Event, Quota, Tag, Transaction
-from graphene import ID, Boolean, Decimal, Field, Mutation
+from bets.graphql.types import (
+    AffairType,
+    BetSlipEntryResultType,
+    BetType,
+    EventType,
+    QuotaType,
+    SettlementJobType,
+)
+from bets.models import Affair, Event, Quota
+from bets.placement import (
+    PlacementError,
+    place_bet_by_event,
+    place_bet_by_quota,
+    place_bets,
+)
+from bets.tags import TagError, resolve_tags
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from graphene import ID, Boolean, Decimal, Field, List, Mutation
 from graphql import GraphQLError
 from j8bet_backend.decorators import bet_consumer, bet_manager
 
@@ -40,18 +57,10 @@ class CreateAffairMutation(Mutation):
         """
 
         affair_input["manager"] = info.context.user
-        tags = list()
-        for tag_entry in affair_input.tags:
-            try:
-                tags.append(Tag.objects.get(id=int(tag_entry)))
-            except ValueError:
-                tag, _ = Tag.objects.get_or_create(name=tag_entry)
-                tags.append(tag)
-            except Tag.DoesNotExist:
-                raise GraphQLError(
-                    f"The tag with ID {tag_entry} does not exist."
-                )
-        affair_input.pop("tags")
+        try:
+            tags = resolve_tags(affair_input.pop("tags", None) or ())
+        except TagError as error:
+            raise GraphQLError(str(error))
         affair = Affair.objects.create(**affair_input)
         affair.tags.set(tags)
         return CreateAffairMutation(affair=affair)
@@ -148,19 +157,10 @@ class UpdateAffairMutation(Mutation):
             id=affair_input.id, manager=info.context.user
         ).count():
             raise GraphQLError("The affair must belong to the bet manager.")
-        tags = list()
-        if affair_input.tags:
-            for tag_entry in affair_input.tags:
-                try:
-                    tags.append(Tag.objects.get(id=int(tag_entry)))
-                except ValueError:
-                    tag, _ = Tag.objects.get_or_create(name=tag_entry)
-                    tags.append(tag)
-                except Tag.DoesNotExist:
-                    raise GraphQLError(
-                        f"The tag with ID {tag_entry} does not exist."
-                    )
-        affair_input.pop("tags")
+        try:
+            tags = resolve_tags(affair_input.pop("tags", None) or ())
+        except TagError as error:
+            raise GraphQLError(str(error))
         affair, _ = Affair.objects.update_or_create(
             id=affair_input.id, manager=info.context.user, defaults=affair_input,
         )
@@ -170,12 +170,16 @@ class UpdateAffairMutation(Mutation):
 
 class UpdateEventMutation(Mutation):
     """
-    Mutation for Event update
+    Mutation for Event update.
+    Setting 'completed' closes the Event and schedules the settlement of its
+    Bets, which is tracked through the returned SettlementJob.
 
     :cvar event: EventType field
+    :cvar settlement_job: SettlementJobType field
     """
 
     event = Field(EventType)
+    settlement_job = Field(SettlementJobType)
 
     class Arguments:
         """
@@ -197,10 +201,20 @@ class UpdateEventMutation(Mutation):
             id=event_input.id, manager=info.context.user
         ).count():
             raise GraphQLError("The event must belong to the bet manager.")
-        event, _ = Event.objects.update_or_create(
-            id=event_input.id, manager=info.context.user, defaults=event_input,
-        )
-        return UpdateEventMutation(event=event)
+        completed = event_input.pop("completed", None)
+        try:
+            with transaction.atomic():
+                event, _ = Event.objects.update_or_create(
+                    id=event_input.id,
+                    manager=info.context.user,
+                    defaults=event_input,
+                )
+                settlement_job = None
+                if completed is not None:
+                    settlement_job = event.schedule_settlement(completed)
+        except ValidationError as error:
+            raise GraphQLError(error.messages[0])
+        return UpdateEventMutation(event=event, settlement_job=settlement_job)
 
 
 class UpdateQuotaMutation(Mutation):
@@ -311,19 +325,10 @@ class BetPlacementByQuotaMutation(Mutation):
 
     @bet_consumer
     def mutate(self, info, quota_id, amount):
-        if not Quota.objects.filter(
-            id=quota_id, active=True, event__active=True,
-        ).exists():
-            raise GraphQLError("Not a valid quota.")
-        quota = Quota.objects.filter(id=quota_id).first()
-
-        # TODO change the way Transactions are managed when the time comes
-        transaction = Transaction.objects.create(
-            amount=amount, description="Bet placement", user=info.context.user,
-        )
-        bet = Bet.objects.create(
-            transaction=transaction, quota=quota, user=info.context.user,
-        )
+        try:
+            bet = place_bet_by_quota(info.context.user, quota_id, amount)
+        except PlacementError as error:
+            raise GraphQLError(str(error))
 
         return BetPlacementByQuotaMutation(bet=bet)
 
@@ -341,22 +346,38 @@ class BetPlacementByEventMutation(Mutation):
 
     @bet_consumer
     def mutate(self, info, event_id, amount):
-        if not Event.objects.filter(id=event_id, active=True).exists():
-            raise GraphQLError("Not a valid event.")
-        if not Quota.objects.filter(event__id=event_id, active=True).exists():
-            raise GraphQLError("Event does not have any valid Quotas.")
-        quota = (
-            Quota.objects.filter(event__id=event_id, active=True,)
-            .order_by("creation_date")
-            .first()
-        )
-
-        # TODO change the way Transactions are managed when the time comes
-        transaction = Transaction.objects.create(
-            amount=amount, description="Bet placement", user=info.context.user,
-        )
-        bet = Bet.objects.create(
-            transaction=transaction, quota=quota, user=info.context.user,
-        )
+        try:
+            bet = place_bet_by_event(info.context.user, event_id, amount)
+        except PlacementError as error:
+            raise GraphQLError(str(error))
 
         return BetPlacementByEventMutation(bet=bet)
+
+
+class PlaceBetsMutation(Mutation):
+    """
+    Mutation which places a bet slip of many Bets in a single transaction
+
+    :cvar results: List of BetSlipEntryResultType, one per entry
+    """
+
+    results = List(BetSlipEntryResultType)
+
+    class Arguments:
+        """
+        Arguments for bet slip placement
+        """
+
+        entries = List(BetSlipEntryInput, required=True)
+
+    @bet_consumer
+    def mutate(self, info, entries):
+        try:
+            results = place_bets(
+                info.context.user,
+                [(entry.quota_id, entry.amount) for entry in entries],
+            )
+        except PlacementError as error:
+            raise GraphQLError(str(error))
+
+        return PlaceBetsMutation(results=results)
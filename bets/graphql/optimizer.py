@@ -0,0 +1,152 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language.ast import FragmentSpread, InlineFragment
+
+
+def get_selections(info, field_asts):
+    """
+    Returns the selected sub-fields of a set of GraphQL field nodes, with
+    fragments expanded.
+
+    :param info: Request information
+    :param field_asts: Field nodes being resolved
+    :return: Dictionary of field nodes grouped by field name
+    """
+
+    selections = dict()
+
+    def collect(selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpread):
+                collect(info.fragments[selection.name.value].selection_set)
+            elif isinstance(selection, InlineFragment):
+                collect(selection.selection_set)
+            else:
+                selections.setdefault(selection.name.value, []).append(
+                    selection
+                )
+
+    for field_ast in field_asts:
+        collect(field_ast.selection_set)
+    return selections
+
+
+def get_node_selections(info, field_asts):
+    """
+    Returns the selected sub-fields of the nodes of a connection.
+
+    :param info: Request information
+    :param field_asts: Connection field nodes being resolved
+    """
+
+    edges = get_selections(info, field_asts).get("edges", [])
+    return get_selections(info, get_selections(info, edges).get("node", []))
+
+
+def has_arguments(field_asts):
+    """
+    Returns whether any of the field nodes has arguments, either filters or
+    pagination ones.
+    """
+
+    return any(field_ast.arguments for field_ast in field_asts)
+
+
+class QueryPlan:
+    """
+    Collects the select_related, prefetch_related and only() arguments
+    needed to resolve a GraphQL selection set.
+    """
+
+    def __init__(self):
+        self.only = list()
+        self.select_related = list()
+        self.prefetch_related = list()
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset.only(*self.only)
+
+
+def plan_model(info, model, selections, plan, prefix="", required=()):
+    """
+    Adds to a QueryPlan what is needed to resolve the selections of a model.
+    Selections which are not model fields (e.g. custom resolvers) might use
+    any attribute, so every column of the model is loaded in that case.
+
+    :param info: Request information
+    :param model: Model being resolved
+    :param selections: Selected sub-fields grouped by field name
+    :param plan: QueryPlan being built
+    :param prefix: Lookup path from the queryset model to this model
+    :param required: Field names which must always be loaded
+    """
+
+    only = {model._meta.pk.name, *required}
+    load_all = False
+    for name, field_asts in selections.items():
+        if name in ("id", "__typename"):
+            continue
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            load_all = True
+            continue
+        if not field.is_relation:
+            only.add(field.name)
+        elif field.concrete and (field.many_to_one or field.one_to_one):
+            only.add(field.name)
+            path = prefix + field.name
+            plan.select_related.append(path)
+            plan_model(
+                info,
+                field.related_model,
+                get_selections(info, field_asts),
+                plan,
+                prefix=path + "__",
+            )
+        elif (field.one_to_many or field.many_to_many) and not has_arguments(
+            field_asts
+        ):
+            # Filtered relations are resolved with their own queryset, and
+            # paged ones by DataLoaders which only fetch each page
+            related_required = list()
+            if field.one_to_many:
+                related_required.append(field.field.name)
+            queryset = optimize_queryset(
+                field.related_model._default_manager.order_by("pk"),
+                info,
+                get_node_selections(info, field_asts),
+                required=related_required,
+            )
+            plan.prefetch_related.append(
+                Prefetch(prefix + field.name, queryset=queryset)
+            )
+    if load_all:
+        only.update(field.name for field in model._meta.concrete_fields)
+    plan.only.extend(prefix + name for name in only)
+
+
+def optimize_queryset(queryset, info, selections=None, required=()):
+    """
+    Optimizes a queryset for the GraphQL selection set being resolved:
+    forward relations are joined with select_related, reverse and many to
+    many relations without arguments are fetched with narrowed Prefetch
+    querysets, and columns which were not requested are left out with only().
+
+    :param queryset: Queryset to optimize
+    :param info: Request information
+    :param selections: Selected sub-fields of each node, taken from the
+        connection being resolved if None
+    :param required: Field names which must always be loaded
+    """
+
+    if selections is None:
+        selections = get_node_selections(info, info.field_asts)
+    plan = QueryPlan()
+    plan_model(info, queryset.model, selections, plan, required=required)
+    return plan.apply(queryset)
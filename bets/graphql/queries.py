@@ -1,16 +1,25 @@
+from bets.exposure import get_exposure
+from bets.graphql.fields import KeysetConnectionField, OptimizedConnectionField
 from bets.graphql.types import (
     AffairType,
     BetType,
     EventType,
     PrizeType,
     QuotaType,
+    RiskExposureType,
+    SearchResultType,
+    SettlementJobType,
     TagType,
     TransactionType,
 )
-from graphene import ObjectType, String
+from bets.ledger import get_balance
+from bets.models import SettlementJob
+from bets.search import SearchTimeout, search
+from graphene import ID, Decimal, Field, Int, List, NonNull, ObjectType, String
 from graphene.relay import Node
-from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError
 from graphql_jwt.decorators import login_required
+from j8bet_backend.decorators import bet_manager
 
 
 class TagQuery(ObjectType):
@@ -18,7 +27,7 @@ class TagQuery(ObjectType):
     Query for Tag objects
     """
 
-    all_tags = DjangoFilterConnectionField(TagType)
+    all_tags = OptimizedConnectionField(TagType)
     tag_by_id = Node.Field(TagType)
 
 
@@ -27,16 +36,33 @@ class AffairQuery(ObjectType):
     Query for Affair objects
     """
 
-    all_affairs = DjangoFilterConnectionField(AffairType)
+    all_affairs = OptimizedConnectionField(AffairType)
     affair_by_id = Node.Field(AffairType)
 
 
+class SearchQuery(ObjectType):
+    """
+    Full text search over Affairs and Events
+    """
+
+    search = List(
+        NonNull(SearchResultType), query=String(required=True), first=Int()
+    )
+
+    def resolve_search(self, info, query, first=None):
+        try:
+            hits = search(query, first)
+        except SearchTimeout as error:
+            raise GraphQLError(str(error))
+        return [SearchResultType(rank=hit.rank, node=hit.node) for hit in hits]
+
+
 class EventQuery(ObjectType):
     """
     Query for Event objects
     """
 
-    all_events = DjangoFilterConnectionField(EventType)
+    all_events = OptimizedConnectionField(EventType)
     event_by_id = Node.Field(EventType)
 
 
@@ -45,7 +71,7 @@ class TransactionQuery(ObjectType):
     Query for Transaction objects
     """
 
-    all_transactions = DjangoFilterConnectionField(TransactionType)
+    all_transactions = KeysetConnectionField(TransactionType)
     transaction_by_id = Node.Field(TransactionType)
 
 
@@ -54,7 +80,7 @@ class QuotaQuery(ObjectType):
     Query for Quota objects
     """
 
-    all_quotas = DjangoFilterConnectionField(QuotaType)
+    all_quotas = OptimizedConnectionField(QuotaType)
     quota_by_id = Node.Field(QuotaType)
 
 
@@ -63,7 +89,7 @@ class BetQuery(ObjectType):
     Quota for Bet objects
     """
 
-    all_bets = DjangoFilterConnectionField(BetType)
+    all_bets = KeysetConnectionField(BetType)
     bet_by_id = Node.Field(BetType)
 
 
@@ -72,10 +98,67 @@ class PrizeQuery(ObjectType):
     Quota for Prize objects
     """
 
-    all_prizes = DjangoFilterConnectionField(PrizeType)
+    all_prizes = OptimizedConnectionField(PrizeType)
     prize_by_id = Node.Field(PrizeType)
 
 
+class SettlementJobQuery(ObjectType):
+    """
+    Query for SettlementJob objects
+    """
+
+    all_settlement_jobs = OptimizedConnectionField(SettlementJobType)
+    settlement_job_by_id = Node.Field(SettlementJobType)
+
+    @bet_manager
+    def resolve_all_settlement_jobs(self, info, **kwargs):
+        return SettlementJob.objects.all()
+
+
+class BalanceQuery(ObjectType):
+    """
+    Query for the balance of the current User
+    """
+
+    my_balance = Decimal()
+
+    @login_required
+    def resolve_my_balance(self, info):
+        return get_balance(info.context.user)
+
+
+class RiskExposureQuery(ObjectType):
+    """
+    Query for the exposure of a Quota, an Event or a User to its open Bets
+    """
+
+    risk_exposure = Field(
+        RiskExposureType, quota_id=ID(), event_id=ID(), user_id=ID()
+    )
+
+    @bet_manager
+    def resolve_risk_exposure(self, info, **kwargs):
+        scopes = [
+            (scope, kwargs[argument])
+            for scope, argument in (
+                ("quota", "quota_id"),
+                ("event", "event_id"),
+                ("user", "user_id"),
+            )
+            if kwargs.get(argument) is not None
+        ]
+        if len(scopes) != 1:
+            raise GraphQLError(
+                "Exactly one of quotaId, eventId or userId must be given."
+            )
+        scope, object_id = scopes[0]
+        try:
+            object_id = int(object_id)
+        except ValueError:
+            raise GraphQLError(f"Invalid {scope} ID {object_id}.")
+        return RiskExposureType(**get_exposure(scope, object_id)._asdict())
+
+
 class HelloQuery(ObjectType):
     """
     Sample Hello Query
@@ -7,29 +7,39 @@ from bets.graphql.mutations import (
     DeleteAffairMutation,
     DeleteEventMutation,
     DeleteQuotaMutation,
+    PlaceBetsMutation,
     UpdateAffairMutation,
     UpdateEventMutation,
     UpdateQuotaMutation,
 )
 from bets.graphql.queries import (
     AffairQuery,
+    BalanceQuery,
     BetQuery,
     EventQuery,
     HelloQuery,
     PrizeQuery,
     QuotaQuery,
+    RiskExposureQuery,
+    SearchQuery,
+    SettlementJobQuery,
     TagQuery,
     TransactionQuery,
 )
+from bets.graphql.subscriptions import EventSubscription, QuotaSubscription
 from graphene import ObjectType
 
 
 class Queries(
     AffairQuery,
+    BalanceQuery,
     BetQuery,
     EventQuery,
     PrizeQuery,
     QuotaQuery,
+    RiskExposureQuery,
+    SearchQuery,
+    SettlementJobQuery,
     TagQuery,
     TransactionQuery,
     HelloQuery,
@@ -57,3 +67,12 @@ class Mutations(ObjectType):
     delete_quota = DeleteQuotaMutation.Field()
     place_bet_by_event = BetPlacementByEventMutation.Field()
     place_bet_by_quota = BetPlacementByQuotaMutation.Field()
+    place_bets = PlaceBetsMutation.Field()
+
+
+class Subscriptions(EventSubscription, QuotaSubscription):
+    """
+    Class joining all Subscriptions from Bets application
+    """
+
+    pass
@@ -0,0 +1,75 @@
+from bets.graphql.types import EventType, QuotaType
+from bets.models import Event, Quota
+from bets.pubsub import (
+    EVENT_CHANNEL,
+    QUOTA_CHANNEL,
+    deserialize_instance,
+    get_pubsub,
+)
+from graphene import ID, Field, ObjectType
+from rx import Observable
+
+
+def channel_observable(info, channel, model, **filters):
+    """
+    Builds an Observable of the instances published on a channel which match
+    the given field values. Filters with a None value are ignored. Messages
+    are handed to the dispatch of the context if it has one, so they are
+    resolved by the connection instead of on the thread publishing them.
+
+    :param info: Request information
+    :param channel: Name of the channel
+    :param model: Model of the published instances
+    :param filters: Attribute names and the values they must have
+    """
+
+    filters = {
+        attname: model._meta.get_field(attname).to_python(value)
+        for attname, value in filters.items()
+        if value is not None
+    }
+
+    def subscribe(observer):
+        def on_message(message):
+            instance = deserialize_instance(model, message)
+            if any(
+                getattr(instance, attname) != value
+                for attname, value in filters.items()
+            ):
+                return
+            # Every message is resolved with DataLoaders of its own, so
+            # related objects are never served from a previous message
+            if info.context is not None:
+                info.context.loaders = None
+            observer.on_next(instance)
+
+        dispatch = getattr(info.context, "dispatch", None)
+        if dispatch is None:
+            return get_pubsub().subscribe(channel, on_message)
+        return get_pubsub().subscribe(
+            channel, lambda message: dispatch(on_message, message)
+        )
+
+    return Observable.create(subscribe)
+
+
+class QuotaSubscription(ObjectType):
+    """
+    Subscription to Quota changes
+    """
+
+    quota_changed = Field(QuotaType, event_id=ID())
+
+    def resolve_quota_changed(self, info, event_id=None):
+        return channel_observable(info, QUOTA_CHANNEL, Quota, event_id=event_id)
+
+
+class EventSubscription(ObjectType):
+    """
+    Subscription to Event state changes
+    """
+
+    event_changed = Field(EventType, id=ID())
+
+    def resolve_event_changed(self, info, id=None):
+        return channel_observable(info, EVENT_CHANNEL, Event, id=id)
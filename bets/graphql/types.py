@@ -1,7 +1,20 @@
-from bets.models import Affair, Bet, Event, Prize, Quota, Tag, Transaction
+from bets.graphql.fields import BatchedConnectionField, CountableConnection
+from bets.graphql.loaders import related_connection_resolver, related_resolver
+from bets.models import (
+    Affair,
+    Bet,
+    Event,
+    Prize,
+    Quota,
+    SettlementJob,
+    Tag,
+    Transaction,
+)
+from graphene import ID, Decimal, Field, Float, Int, ObjectType, String
 from graphene.relay import Node
 from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
+from j8bet_backend.decorators import bet_manager
 
 
 @login_required
@@ -21,6 +34,7 @@ class TagType(DjangoObjectType):
     class Meta:
         model = Tag
         filter_fields = ["name"]
+        exclude = ["normalized_name"]
         interfaces = (Node,)
 
 
@@ -29,19 +43,29 @@ class AffairType(DjangoObjectType):
     Relay Node for Affair
     """
 
+    tags = BatchedConnectionField(TagType, required=True)
+    events = BatchedConnectionField(lambda: EventType, required=True)
+
     class Meta:
         model = Affair
         filter_fields = {
             "description": ["exact", "icontains", "istartswith"],
         }
+        exclude = ["search_vector"]
         interfaces = (Node,)
 
+    resolve_manager = related_resolver("manager")
+    resolve_tags = related_connection_resolver("tags")
+    resolve_events = related_connection_resolver("events")
+
 
 class EventType(DjangoObjectType):
     """
     Relay Node for Event
     """
 
+    quotas = BatchedConnectionField(lambda: QuotaType, required=True)
+
     class Meta:
         model = Event
         filter_fields = {
@@ -51,43 +75,68 @@ class EventType(DjangoObjectType):
             "active": ["exact"],
             "completed": ["exact"],
         }
+        exclude = ["search_vector"]
         interfaces = (Node,)
 
+    resolve_manager = related_resolver("manager")
+    resolve_affair = related_resolver("affair")
+    resolve_quotas = related_connection_resolver("quotas")
+
 
 class TransactionType(DjangoObjectType):
     """
     Relay Node for Transaction
     """
 
+    bets = BatchedConnectionField(lambda: BetType, required=True)
+
     class Meta:
         model = Transaction
         filter_fields = ["description"]
         interfaces = (Node,)
+        connection_class = CountableConnection
         default_resolver = login_required_resolver
 
+    resolve_user = login_required(related_resolver("user"))
+    resolve_bets = login_required(related_connection_resolver("bets"))
+
 
 class QuotaType(DjangoObjectType):
     """
     Relay Node for Quota model
     """
 
+    bets = BatchedConnectionField(lambda: BetType, required=True)
+
     class Meta:
         model = Quota
         filter_fields = ["active"]
         interfaces = (Node,)
 
+    resolve_manager = related_resolver("manager")
+    resolve_event = related_resolver("event")
+    resolve_bets = related_connection_resolver("bets")
+
 
 class BetType(DjangoObjectType):
     """
     Relay Node for Bet model
     """
 
+    prizes = BatchedConnectionField(lambda: PrizeType, required=True)
+
     class Meta:
         model = Bet
         filter_fields = ["won", "active"]
         interfaces = (Node,)
+        connection_class = CountableConnection
         default_resolver = login_required_resolver
 
+    resolve_transaction = login_required(related_resolver("transaction"))
+    resolve_quota = login_required(related_resolver("quota"))
+    resolve_user = login_required(related_resolver("user"))
+    resolve_prizes = login_required(related_connection_resolver("prizes"))
+
 
 class PrizeType(DjangoObjectType):
     """
@@ -99,3 +148,56 @@ class PrizeType(DjangoObjectType):
         filter_fields = ["creation_date"]
         interfaces = (Node,)
         default_resolver = login_required_resolver
+
+    resolve_bet = login_required(related_resolver("bet"))
+    resolve_user = login_required(related_resolver("user"))
+
+
+class SettlementJobType(DjangoObjectType):
+    """
+    Relay Node for SettlementJob model
+    """
+
+    progress = Float()
+
+    class Meta:
+        model = SettlementJob
+        filter_fields = ["status"]
+        interfaces = (Node,)
+        default_resolver = login_required_resolver
+
+    @classmethod
+    @bet_manager
+    def get_node(cls, info, id):
+        return super().get_node(info, id)
+
+
+class BetSlipEntryResultType(ObjectType):
+    """
+    Result of placing an entry of a bet slip.
+    Either the placed Bet or the reason why it was not placed is given.
+    """
+
+    quota_id = ID()
+    amount = Decimal()
+    bet = Field(BetType)
+    error = String()
+
+
+class SearchResultType(ObjectType):
+    """
+    Affair or Event found by a search, along with its relevance.
+    """
+
+    rank = Float(required=True)
+    node = Field(Node, required=True)
+
+
+class RiskExposureType(ObjectType):
+    """
+    Totals of the open Bets of a Quota, an Event or a User.
+    """
+
+    bets = Int(required=True)
+    stake = Decimal(required=True)
+    liability = Decimal(required=True)
@@ -0,0 +1,172 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from bets.models import Account, LedgerEntry
+from django.db import connection, transaction
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+Posting = namedtuple(
+    "Posting", ["user_id", "amount", "description", "transaction_id"]
+)
+Mismatch = namedtuple("Mismatch", ["account_id", "balance", "total"])
+
+BET_PLACEMENT = "Bet placement"
+PRIZE_PAYOUT = "Prize payout"
+
+# Upserting the Account of each User locks its row until the end of the
+# transaction, so concurrent postings are serialized per Account and the
+# balance always equals the sum of the appended entries. Accounts are
+# upserted in a fixed order to avoid deadlocks between postings.
+POSTING_SQL = """
+    WITH posting AS (
+        SELECT *
+        FROM unnest(
+            %(user_ids)s::integer[],
+            %(amounts)s::numeric[],
+            %(descriptions)s::varchar[],
+            %(transaction_ids)s::integer[]
+        ) AS posting (user_id, amount, description, transaction_id)
+    ),
+    accounts AS (
+        INSERT INTO {account} AS account (user_id, balance, modification_date)
+        SELECT user_id, SUM(amount), %(now)s
+        FROM posting
+        GROUP BY user_id
+        ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET balance = account.balance + EXCLUDED.balance,
+            modification_date = EXCLUDED.modification_date
+        RETURNING id, user_id
+    )
+    INSERT INTO {entry}
+        (account_id, amount, description, transaction_id, creation_date)
+    SELECT accounts.id, posting.amount, posting.description,
+        posting.transaction_id, %(now)s
+    FROM posting
+    INNER JOIN accounts ON accounts.user_id = posting.user_id
+"""
+
+
+def table_name(model):
+    """
+    Returns the quoted database table name of a model.
+    """
+
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def post_entries(postings):
+    """
+    Appends LedgerEntries and updates the balances of their Accounts with a
+    single statement. Accounts are created on their first posting.
+
+    :param postings: List of Posting
+    """
+
+    if not postings:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            POSTING_SQL.format(
+                account=table_name(Account), entry=table_name(LedgerEntry)
+            ),
+            {
+                "user_ids": [posting.user_id for posting in postings],
+                "amounts": [posting.amount for posting in postings],
+                "descriptions": [posting.description for posting in postings],
+                "transaction_ids": [
+                    posting.transaction_id for posting in postings
+                ],
+                "now": timezone.now(),
+            },
+        )
+
+
+def bet_postings(bets):
+    """
+    Returns the Postings which charge the Transactions of placed Bets.
+
+    :param bets: Saved Bets
+    :return: List of Posting
+    """
+
+    return [
+        Posting(
+            bet.user_id,
+            -bet.transaction.amount,
+            BET_PLACEMENT,
+            bet.transaction_id,
+        )
+        for bet in bets
+    ]
+
+
+def get_balance(user):
+    """
+    Returns the balance of a User with a single indexed read.
+
+    :param user: User whose balance is read
+    :return: Balance, zero if the User has no Account yet
+    """
+
+    balance = (
+        Account.objects.filter(user=user)
+        .values_list("balance", flat=True)
+        .first()
+    )
+    return Decimal(0) if balance is None else balance
+
+
+def reconcile_accounts(chunk_size, after_id=0):
+    """
+    Compares the balance of each Account with the sum of its LedgerEntries,
+    streaming Accounts in chunks so memory use does not depend on the size
+    of the ledger.
+
+    :param chunk_size: Amount of Accounts verified per query
+    :param after_id: Only Accounts with a greater ID are verified
+    :return: Generator of tuples with the amount of verified Accounts and
+        the list of Mismatch of each chunk
+    """
+
+    while True:
+        accounts = list(
+            Account.objects.filter(id__gt=after_id)
+            .order_by("id")
+            .annotate(
+                total=Coalesce(
+                    Sum("entries__amount"),
+                    Value(0),
+                    output_field=DecimalField(),
+                )
+            )
+            .values_list("id", "balance", "total")[:chunk_size]
+        )
+        if not accounts:
+            return
+        after_id = accounts[-1][0]
+        yield len(accounts), [
+            Mismatch(*account)
+            for account in accounts
+            if account[1] != account[2]
+        ]
+
+
+def fix_account(account_id):
+    """
+    Sets the balance of an Account to the sum of its LedgerEntries. The
+    Account is locked first, so no posting can happen in between.
+
+    :param account_id: ID of the Account
+    :return: The new balance
+    """
+
+    with transaction.atomic():
+        account = Account.objects.select_for_update().get(id=account_id)
+        account.balance = account.entries.aggregate(
+            total=Coalesce(Sum("amount"), Value(0), output_field=DecimalField())
+        )["total"]
+        account.save()
+    return account.balance
@@ -0,0 +1,175 @@
+import json
+import logging
+import time
+
+from bets.benchmark import LoadSeeder, QueryCounter, percentile, unique_prefix
+from bets.models import Event
+from bets.response_cache import response_cache
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from j8bet_backend.graphql.views import PersistedQueryGraphQLView
+
+logger = logging.getLogger("commands_log")
+
+CATALOG_QUERIES = {
+    "allTags": """
+        query allTags {
+            allTags(first: 100) { edges { node { id name } } }
+        }
+    """,
+    "allAffairs": """
+        query allAffairs($description: String) {
+            allAffairs(description: $description) {
+                edges { node {
+                    id description
+                    events { edges { node { id name active } } }
+                } }
+            }
+        }
+    """,
+    "allEvents": """
+        query allEvents($description: String) {
+            allEvents(description: $description, active: true) {
+                edges { node {
+                    id name expirationDate
+                    quotas(active: true) {
+                        edges { node { id probability coeficient } }
+                    }
+                } }
+            }
+        }
+    """,
+    "allQuotas": """
+        query allQuotas {
+            allQuotas(active: true, first: 100) {
+                edges { node {
+                    id probability coeficient event { id name }
+                } }
+            }
+        }
+    """,
+}
+
+
+class Command(BaseCommand):
+    """
+    Benchmark of the response cache of catalog queries. Every catalog query
+    is sent to the GraphQL view with the response cache disabled, which
+    resolves it against the database, and then with the response cache
+    enabled, which serves it from the cache after the first request.
+    Seeded data is deleted afterwards.
+    """
+
+    help = "Compares catalog query latencies with and without response cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Amount of requests of each query on each path",
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=200,
+            help="Amount of events seeded",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def measure(self, view, query, variables, requests):
+        """
+        Sends a query to the view repeatedly.
+
+        :return: Tuple with the sorted latencies in seconds and the amount
+            of database queries per request
+        """
+
+        factory = RequestFactory()
+        body = json.dumps({"query": query, "variables": variables})
+        counter = QueryCounter()
+        latencies = list()
+        with connection.execute_wrapper(counter):
+            for _ in range(requests):
+                request = factory.post(
+                    "/graphql", body, content_type="application/json"
+                )
+                request.user = AnonymousUser()
+                start = time.perf_counter()
+                response = view(request)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(response.content.decode())
+        return sorted(latencies), counter.count / requests
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL")
+        if options["requests"] < 1:
+            raise CommandError("At least one request is required")
+        seeder = LoadSeeder(
+            users=2,
+            tags=max(options["events"] // 10, 1),
+            affairs=max(options["events"] // 10, 1),
+            events=options["events"],
+            quotas_per_event=2,
+            bets=0,
+            managers=1,
+            seed=options["seed"],
+            prefix=unique_prefix(),
+        )
+        with transaction.atomic():
+            seeder.load()
+        description = Event.objects.get(
+            id=seeder.seeded()["events"][0]
+        ).description
+        view = PersistedQueryGraphQLView.as_view()
+        enabled = response_cache.enabled
+        report = dict()
+        try:
+            for name, query in CATALOG_QUERIES.items():
+                variables = {"description": description}
+                response_cache.enabled = False
+                db_latencies, db_queries = self.measure(
+                    view, query, variables, options["requests"]
+                )
+                response_cache.enabled = True
+                # The first request fills the cache
+                self.measure(view, query, variables, 1)
+                hit_latencies, hit_queries = self.measure(
+                    view, query, variables, options["requests"]
+                )
+                report[name] = {
+                    "db_p50": percentile(db_latencies, 0.5),
+                    "db_p95": percentile(db_latencies, 0.95),
+                    "db_queries_per_request": db_queries,
+                    "hit_p50": percentile(hit_latencies, 0.5),
+                    "hit_p95": percentile(hit_latencies, 0.95),
+                    "hit_queries_per_request": hit_queries,
+                    "speedup": percentile(db_latencies, 0.5)
+                    / percentile(hit_latencies, 0.5),
+                }
+                message = (
+                    "{name}: {db_p50:.2f} ms from the database, {hit_p50:.2f} "
+                    "ms from the cache ({speedup:.1f}x)"
+                ).format(name=name, **report[name])
+                logger.info(message)
+                self.stdout.write(message)
+        finally:
+            response_cache.enabled = enabled
+            seeder.delete()
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {"requests": options["requests"], "queries": report},
+                    output,
+                    indent=2,
+                )
@@ -0,0 +1,461 @@
+import json
+import logging
+import random
+import time
+
+from bets.benchmark import LoadSeeder, QueryCounter, percentile
+from bets.models import Event, Quota, Tag
+from bets.response_cache import response_cache
+from bets.settlement import run_settlement_job
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from graphene.relay import Node
+from j8bet_backend.constants import BET_CONSUMER, BET_MANAGER
+from j8bet_backend.graphql.views import PersistedQueryGraphQLView
+
+logger = logging.getLogger("commands_log")
+
+# Queries sent at every page size
+LIST_QUERIES = {
+    "allEvents": """
+        query allEvents($first: Int) {
+            allEvents(first: $first) {
+                edges { node { id name expirationDate active } }
+            }
+        }
+    """,
+    "allQuotas": """
+        query allQuotas($first: Int) {
+            allQuotas(first: $first) {
+                edges { node { id probability coeficient active } }
+            }
+        }
+    """,
+    "allBets": """
+        query allBets($first: Int) {
+            allBets(first: $first) {
+                edges { node { id potentialEarnings won creationDate } }
+            }
+        }
+    """,
+    "allTransactions": """
+        query allTransactions($first: Int) {
+            allTransactions(first: $first) {
+                edges { node { id amount description creationDate } }
+            }
+        }
+    """,
+    "allEventsNested": """
+        query allEventsNested($first: Int) {
+            allEvents(first: $first, active: true) {
+                edges { node {
+                    id name
+                    affair {
+                        id description
+                        tags(first: 5) { edges { node { id name } } }
+                    }
+                    quotas(first: 5) {
+                        edges { node { id coeficient active } }
+                    }
+                } }
+            }
+        }
+    """,
+    "allBetsNested": """
+        query allBetsNested($first: Int) {
+            allBets(first: $first) {
+                edges { node {
+                    id won
+                    transaction { amount }
+                    user { username }
+                    quota {
+                        coeficient
+                        event { name affair { description } }
+                    }
+                } }
+            }
+        }
+    """,
+}
+
+PLACE_BET_BY_QUOTA = """
+    mutation placeBetByQuota($quotaId: ID!, $amount: Decimal!) {
+        placeBetByQuota(quotaId: $quotaId, amount: $amount) {
+            bet { id potentialEarnings }
+        }
+    }
+"""
+
+PLACE_BET_BY_EVENT = """
+    mutation placeBetByEvent($eventId: ID!, $amount: Decimal!) {
+        placeBetByEvent(eventId: $eventId, amount: $amount) {
+            bet { id potentialEarnings }
+        }
+    }
+"""
+
+CREATE_AFFAIR = """
+    mutation createAffair($affairInput: AffairCreationInput!) {
+        createAffair(affairInput: $affairInput) {
+            affair { id description tags { edges { node { id name } } } }
+        }
+    }
+"""
+
+SETTLE_EVENT = """
+    mutation settleEvent($eventInput: EventUpdateInput!) {
+        updateEvent(eventInput: $eventInput) {
+            event { id active completed }
+            settlementJob { id totalBets }
+        }
+    }
+"""
+
+
+class Command(BaseCommand):
+    """
+    End to end benchmark of the GraphQL API. Every operation is sent to the
+    GraphQL view in process, through the same documents, cost analysis and
+    middlewares as real requests: list queries at several page sizes, nested
+    relation queries, both bet placement mutations, affair creation with
+    tags, and event settlement, which includes running its SettlementJob.
+    Data is generated by bets.benchmark.LoadSeeder and deleted afterwards,
+    unless a dataset loaded by seed_load is used. Results can be compared
+    with the JSON output of a previous run to catch regressions.
+    """
+
+    help = "Measures GraphQL operation throughput, latencies and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=100,
+            help="Amount of requests of each operation",
+        )
+        parser.add_argument(
+            "--page-sizes",
+            default="1,10,100",
+            help="Comma separated page sizes of the list queries",
+        )
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Amount of users seeded"
+        )
+        parser.add_argument(
+            "--events", type=int, default=500, help="Amount of events seeded"
+        )
+        parser.add_argument(
+            "--bets", type=int, default=50000, help="Amount of bets seeded"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Amount of bets settled per chunk of settlement jobs",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--existing",
+            action="store_true",
+            help="Use the dataset loaded by seed_load with the same seed "
+            "instead of seeding one. Mutations change it",
+        )
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="Keep the response cache enabled for the list queries",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="Path of the JSON output of a previous run to compare with",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Share by which latencies can exceed the baseline",
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def measure(self, view, requests, build, complete=None):
+        """
+        Sends an operation to the view repeatedly.
+
+        :param build: Callable which returns the query, the variables and
+            the user of each request, given its number
+        :param complete: Callable which finishes the work of a request from
+            its data, timed along with it
+        :return: Dictionary with the throughput, latency percentiles in
+            milliseconds and database queries per request
+        """
+
+        factory = RequestFactory()
+        counter = QueryCounter()
+        latencies = list()
+        with connection.execute_wrapper(counter):
+            for number in range(requests):
+                query, variables, user = build(number)
+                request = factory.post(
+                    "/graphql",
+                    json.dumps({"query": query, "variables": variables}),
+                    content_type="application/json",
+                )
+                request.user = user
+                start = time.perf_counter()
+                response = view(request)
+                result = json.loads(response.content)
+                if result.get("errors"):
+                    raise CommandError(result["errors"][0]["message"])
+                if complete is not None:
+                    complete(result["data"])
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return {
+            "requests": requests,
+            "throughput": requests / sum(latencies),
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "queries_per_request": counter.count / requests,
+        }
+
+    def operations(self, prefix, page_sizes, requests, options):
+        """
+        Returns the name, the request builder and the completion of every
+        operation, in the order they run. Settlement goes last, since it
+        closes the Events on which Bets are placed.
+        """
+
+        User = get_user_model()
+        rng = random.Random(options["seed"])
+        users = User.objects.filter(username__startswith=prefix + "-")
+        consumers = list(
+            users.filter(groups__name=BET_CONSUMER).order_by("id")[:100]
+        )
+        manager = users.filter(groups__name=BET_MANAGER).order_by("id")[0]
+        quotas = list(
+            Quota.objects.filter(
+                active=True,
+                event__active=True,
+                event__name__startswith=prefix + " event ",
+            ).values_list("id", "event_id")[:1000]
+        )
+        events = list(
+            Event.objects.filter(
+                active=True, name__startswith=prefix + " event "
+            )
+            .select_related("manager")
+            .order_by("-id")[:requests]
+        )
+        tags = list(
+            Tag.objects.filter(name__startswith=prefix + " ").values_list(
+                "name", flat=True
+            )[:100]
+        )
+        if not consumers or not quotas:
+            raise CommandError("There are no open events to bet on")
+
+        operations = list()
+        for size in page_sizes:
+            for name, query in LIST_QUERIES.items():
+                operations.append(
+                    (
+                        "{}[first={}]".format(name, size),
+                        requests,
+                        lambda number, query=query, size=size: (
+                            query,
+                            {"first": size},
+                            rng.choice(consumers),
+                        ),
+                        None,
+                    )
+                )
+        operations.append(
+            (
+                "placeBetByQuota",
+                requests,
+                lambda number: (
+                    PLACE_BET_BY_QUOTA,
+                    {"quotaId": rng.choice(quotas)[0], "amount": "10"},
+                    rng.choice(consumers),
+                ),
+                None,
+            )
+        )
+        operations.append(
+            (
+                "placeBetByEvent",
+                requests,
+                lambda number: (
+                    PLACE_BET_BY_EVENT,
+                    {"eventId": rng.choice(quotas)[1], "amount": "10"},
+                    rng.choice(consumers),
+                ),
+                None,
+            )
+        )
+        operations.append(
+            (
+                "createAffair",
+                requests,
+                lambda number: (
+                    CREATE_AFFAIR,
+                    {
+                        "affairInput": {
+                            "description": "{} benchmark affair {}".format(
+                                prefix, number
+                            ),
+                            # Existing tags, and a new one
+                            "tags": rng.sample(tags, min(len(tags), 2))
+                            + ["{} benchmark tag {}".format(prefix, number)],
+                        }
+                    },
+                    manager,
+                ),
+                None,
+            )
+        )
+        # Quotas are picked on open Events, so there are Events to settle
+        operations.append(
+            (
+                "settleEvent",
+                len(events),
+                lambda number: (
+                    SETTLE_EVENT,
+                    {
+                        "eventInput": {
+                            "id": events[number].id,
+                            "completed": rng.random() < 0.5,
+                        }
+                    },
+                    events[number].manager,
+                ),
+                lambda data: run_settlement_job(
+                    Node.from_global_id(
+                        data["updateEvent"]["settlementJob"]["id"]
+                    )[1],
+                    options["chunk_size"],
+                ),
+            )
+        )
+        return operations
+
+    def compare(self, report, baseline, tolerance):
+        """
+        Returns the regressions of a report against a baseline: operations
+        whose median latency exceeds the baseline by more than the
+        tolerance, or which send more database queries.
+        """
+
+        regressions = list()
+        for name, result in report.items():
+            previous = baseline.get("operations", dict()).get(name)
+            if previous is None:
+                continue
+            if result["p50"] > previous["p50"] * (1 + tolerance):
+                regressions.append(
+                    "{}: {:.2f} ms instead of {:.2f} ms".format(
+                        name, result["p50"], previous["p50"]
+                    )
+                )
+            if result["queries_per_request"] > previous["queries_per_request"]:
+                regressions.append(
+                    "{}: {:g} queries instead of {:g}".format(
+                        name,
+                        result["queries_per_request"],
+                        previous["queries_per_request"],
+                    )
+                )
+        return regressions
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL")
+        try:
+            page_sizes = [
+                int(size) for size in options["page_sizes"].split(",")
+            ]
+        except ValueError:
+            raise CommandError("Page sizes must be comma separated numbers")
+        if options["requests"] < 1 or min(page_sizes) < 1:
+            raise CommandError("Requests and page sizes start from 1")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        seeder = LoadSeeder(
+            users=options["users"],
+            tags=50,
+            affairs=max(options["events"] // 5, 1),
+            events=options["events"],
+            quotas_per_event=2,
+            bets=options["bets"],
+            managers=2,
+            seed=options["seed"],
+        )
+        loaded = seeder.loaded()
+        if options["existing"] and not loaded:
+            raise CommandError(
+                "Seed {} is not loaded, run seed_load first".format(
+                    options["seed"]
+                )
+            )
+        if not options["existing"]:
+            if loaded:
+                raise CommandError(
+                    "Seed {} is already loaded, use --existing or another "
+                    "seed".format(options["seed"])
+                )
+            with transaction.atomic():
+                seeder.load()
+
+        view = PersistedQueryGraphQLView.as_view()
+        enabled = response_cache.enabled
+        response_cache.enabled = options["response_cache"]
+        report = dict()
+        try:
+            for name, requests, build, complete in self.operations(
+                seeder.prefix, page_sizes, options["requests"], options
+            ):
+                report[name] = self.measure(view, requests, build, complete)
+                message = (
+                    "{name}: {throughput:.1f} requests/s, p50 {p50:.2f} ms, "
+                    "p95 {p95:.2f} ms, {queries_per_request:g} queries"
+                ).format(name=name, **report[name])
+                logger.info(message)
+                self.stdout.write(message)
+        finally:
+            response_cache.enabled = enabled
+            if not options["existing"]:
+                seeder.delete()
+
+        regressions = list()
+        if baseline is not None:
+            regressions = self.compare(report, baseline, options["tolerance"])
+            for regression in regressions:
+                logger.warning(regression)
+                self.stdout.write(regression)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {
+                        "seed": options["seed"],
+                        "requests": options["requests"],
+                        "page_sizes": page_sizes,
+                        "operations": report,
+                        "regressions": regressions,
+                    },
+                    output,
+                    indent=2,
+                )
+        if regressions:
+            raise CommandError(
+                "{} regressions against the baseline".format(len(regressions))
+            )
@@ -0,0 +1,171 @@
+import json
+import logging
+from datetime import timedelta
+
+from bets.benchmark import LoadSeeder, explain_analyze, unique_prefix
+from bets.models import Bet, Event, Prize, Quota
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+logger = logging.getLogger("commands_log")
+
+INDEXED_MODELS = (Event, Quota, Bet, Prize)
+
+
+def hot_querysets(seeded, now):
+    """
+    Returns the querysets of the hot paths covered by the indexes of the
+    bets application, bound to the seeded objects.
+
+    :param seeded: IDs of the seeded objects, as returned by
+        LoadSeeder.seeded
+    :param now: Date on which the objects were seeded
+    :return: List of tuples with a name and a queryset
+    """
+
+    # The first active Quota, unless every Event is settled
+    quota = (
+        Quota.objects.filter(id__in=seeded["quotas"])
+        .order_by("-active", "id")
+        .first()
+    )
+    event_id = quota.event_id
+    quota_id = quota.id
+    user_id = seeded["bettors"][0]
+    return [
+        (
+            "active quotas of event",
+            Quota.objects.filter(event_id=event_id, active=True),
+        ),
+        ("latest quotas", Quota.objects.order_by("-creation_date")[:20]),
+        (
+            "open bets of quota",
+            Bet.objects.filter(quota_id=quota_id, won__isnull=True),
+        ),
+        (
+            "open bets of event",
+            Bet.objects.filter(
+                quota__event_id=event_id, won__isnull=True
+            ).order_by("id"),
+        ),
+        ("won bets of quota", Bet.objects.filter(quota_id=quota_id, won=True)),
+        (
+            "active bets of user",
+            Bet.objects.filter(user_id=user_id, active=True),
+        ),
+        (
+            "open events",
+            Event.objects.filter(active=True, completed__isnull=True),
+        ),
+        (
+            "recent prizes",
+            Prize.objects.filter(creation_date__gte=now - timedelta(days=7)),
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    """
+    Benchmark which records EXPLAIN ANALYZE plans of the hot queries of the
+    bets application without and with its indexes, on a seeded dataset.
+    Everything is run inside a transaction which is rolled back, so neither
+    the seeded data nor the dropped indexes outlive the benchmark.
+    """
+
+    help = "Compares query plans of the hot paths with and without indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bets",
+            type=int,
+            default=1000000,
+            help="Amount of bets to seed",
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=1000,
+            help="Amount of events to seed",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=1000,
+            help="Amount of users placing bets",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the plans to"
+        )
+
+    def explain(self, seeded, now):
+        return {
+            name: explain_analyze(queryset)
+            for name, queryset in hot_querysets(seeded, now)
+        }
+
+    def set_indexes(self, enabled):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    if enabled:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                cursor.execute(
+                    "ANALYZE {}".format(
+                        connection.ops.quote_name(model._meta.db_table)
+                    )
+                )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL")
+        seeder = LoadSeeder(
+            users=options["users"] + 1,
+            tags=1,
+            affairs=max(options["events"] // 10, 1),
+            events=options["events"],
+            quotas_per_event=2,
+            bets=options["bets"],
+            managers=1,
+            seed=options["seed"],
+            prefix=unique_prefix(),
+        )
+        with transaction.atomic():
+            seeder.load()
+            seeded = seeder.seeded()
+            # Deferred foreign key checks must run before altering indexes
+            connection.check_constraints()
+            self.set_indexes(False)
+            before = self.explain(seeded, seeder.now)
+            self.set_indexes(True)
+            after = self.explain(seeded, seeder.now)
+            transaction.set_rollback(True)
+
+        results = [
+            {"query": name, "before": before[name], "after": after[name]}
+            for name in before
+        ]
+        for result in results:
+            message = "{query}: {before} ms -> {after} ms".format(
+                query=result["query"],
+                before=result["before"]["execution_time"],
+                after=result["after"]["execution_time"],
+            )
+            logger.info(message)
+            self.stdout.write(message)
+            if options["verbosity"] > 1:
+                self.stdout.write(result["before"]["plan"])
+                self.stdout.write(result["after"]["plan"])
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {"bets": options["bets"], "results": results},
+                    output,
+                    indent=2,
+                )
@@ -0,0 +1,156 @@
+import json
+import logging
+import time
+
+from bets.benchmark import LoadSeeder, QueryCounter, percentile, unique_prefix
+from bets.graphql.fields import KeysetConnectionField, keyset_cursor
+from bets.graphql.types import BetType
+from bets.models import Bet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from graphene_django.fields import DjangoConnectionField
+from graphql_relay.connection.arrayconnection import offset_to_cursor
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Benchmark of the pagination of allBets. Pages at several depths are
+    fetched with offset cursors, as DjangoConnectionField resolves them,
+    and with keyset cursors, as KeysetConnectionField does. Both page
+    through every Bet ordered by creation date and ID. Seeded data is
+    deleted afterwards.
+    """
+
+    help = "Compares offset and keyset pagination latencies by page depth"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bets",
+            type=int,
+            default=1000000,
+            help="Amount of bets seeded",
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=10, help="Bets on each page"
+        )
+        parser.add_argument(
+            "--pages",
+            default="1,1000,100000",
+            help="Comma separated page numbers to fetch, starting from 1",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Amount of times each page is fetched on each path",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def measure(self, resolve, repeat):
+        """
+        Resolves a page repeatedly.
+
+        :return: Tuple with the sorted latencies in seconds and the amount
+            of database queries per page
+        """
+
+        counter = QueryCounter()
+        latencies = list()
+        with connection.execute_wrapper(counter):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                page = resolve()
+                latencies.append(time.perf_counter() - start)
+        if not page.edges:
+            raise CommandError("A page came out empty")
+        return sorted(latencies), counter.count / repeat
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL")
+        try:
+            pages = [int(page) for page in options["pages"].split(",")]
+        except ValueError:
+            raise CommandError("Pages must be comma separated numbers")
+        size = options["page_size"]
+        if options["repeat"] < 1 or size < 1 or min(pages) < 1:
+            raise CommandError("Pages, sizes and repeats start from 1")
+        seeder = LoadSeeder(
+            users=2,
+            tags=1,
+            affairs=1,
+            events=1,
+            quotas_per_event=2,
+            bets=options["bets"],
+            managers=1,
+            seed=options["seed"],
+            prefix=unique_prefix(),
+        )
+        with transaction.atomic():
+            seeder.load()
+        connection_type = BetType._meta.connection
+        queryset = Bet.objects.order_by("creation_date", "id")
+        total = queryset.count()
+        report = dict()
+        try:
+            for page in pages:
+                offset = (page - 1) * size
+                if offset >= total:
+                    self.stdout.write(
+                        "Skipping page {}, there are {} bets".format(
+                            page, total
+                        )
+                    )
+                    continue
+                args = {"first": size}
+                keyset_args = {"first": size}
+                if offset:
+                    args["after"] = offset_to_cursor(offset - 1)
+                    keyset_args["after"] = keyset_cursor(
+                        queryset.only("creation_date")[offset - 1]
+                    )
+                offset_latencies, offset_queries = self.measure(
+                    lambda: DjangoConnectionField.resolve_connection(
+                        connection_type, args, queryset
+                    ),
+                    options["repeat"],
+                )
+                keyset_latencies, keyset_queries = self.measure(
+                    lambda: KeysetConnectionField.resolve_connection(
+                        connection_type, keyset_args, queryset
+                    ),
+                    options["repeat"],
+                )
+                report[page] = {
+                    "offset_p50": percentile(offset_latencies, 0.5),
+                    "offset_p95": percentile(offset_latencies, 0.95),
+                    "offset_queries_per_page": offset_queries,
+                    "keyset_p50": percentile(keyset_latencies, 0.5),
+                    "keyset_p95": percentile(keyset_latencies, 0.95),
+                    "keyset_queries_per_page": keyset_queries,
+                    "speedup": percentile(offset_latencies, 0.5)
+                    / percentile(keyset_latencies, 0.5),
+                }
+                message = (
+                    "page {page}: {offset_p50:.2f} ms with offsets, "
+                    "{keyset_p50:.2f} ms with keysets ({speedup:.1f}x)"
+                ).format(page=page, **report[page])
+                logger.info(message)
+                self.stdout.write(message)
+        finally:
+            seeder.delete()
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {"bets": total, "page_size": size, "pages": report},
+                    output,
+                    indent=2,
+                )
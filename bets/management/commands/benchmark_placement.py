@@ -0,0 +1,180 @@
+import json
+import logging
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from bets.benchmark import LoadSeeder, QueryCounter, unique_prefix
+from bets.models import Quota
+from bets.placement import place_bet_by_quota, place_bets
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Benchmark of bet placement under concurrent clients.
+    Every client places Bets on random Quotas of the seeded Events through
+    its own database connection, so clients placing on the same Quota wait
+    on each other's row lock. Seeded data is deleted afterwards.
+    """
+
+    help = "Measures queries per placement and placements per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--placements",
+            type=int,
+            default=1000,
+            help="Amount of placement requests sent by each client",
+        )
+        parser.add_argument(
+            "--slip-size",
+            type=int,
+            default=1,
+            help="Amount of bets placed per request, through bet slips if "
+            "greater than 1",
+        )
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=8,
+            help="Amount of concurrent clients",
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=10,
+            help="Amount of events receiving bets, fewer means more contention",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=100,
+            help="Amount of users placing bets",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def run_client(self, number, seeded, quota_ids, options):
+        """
+        Places Bets from a single client.
+
+        :return: Tuple with the latencies in seconds and the amount of
+            queries sent
+        """
+
+        rng = random.Random(options["seed"] + number)
+        users = list(get_user_model().objects.filter(id__in=seeded["bettors"]))
+        counter = QueryCounter()
+        latencies = list()
+        try:
+            with connection.execute_wrapper(counter):
+                for _ in range(options["placements"]):
+                    user = rng.choice(users)
+                    start = time.perf_counter()
+                    if options["slip_size"] > 1:
+                        place_bets(
+                            user,
+                            [
+                                (rng.choice(quota_ids), Decimal(10))
+                                for _ in range(options["slip_size"])
+                            ],
+                        )
+                    else:
+                        place_bet_by_quota(
+                            user, rng.choice(quota_ids), Decimal(10)
+                        )
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            if options["clients"] > 1:
+                connection.close()
+        return latencies, counter.count
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL")
+        counts = ("placements", "slip_size", "clients", "events", "users")
+        if min(options[name] for name in counts) < 1:
+            raise CommandError(
+                "Placements, slip sizes, clients, events and users start from 1"
+            )
+        seeder = LoadSeeder(
+            users=options["users"] + 1,
+            tags=1,
+            affairs=max(options["events"] // 10, 1),
+            events=options["events"],
+            quotas_per_event=2,
+            bets=0,
+            managers=1,
+            settled=0,
+            seed=options["seed"],
+            prefix=unique_prefix(),
+        )
+        with transaction.atomic():
+            seeder.load()
+        seeded = seeder.seeded()
+        # Every Event is open, with a single active Quota
+        quota_ids = list(
+            Quota.objects.filter(
+                id__in=seeded["quotas"], active=True
+            ).values_list("id", flat=True)
+        )
+        try:
+            start = time.perf_counter()
+            if options["clients"] > 1:
+                with ThreadPoolExecutor(options["clients"]) as executor:
+                    results = list(
+                        executor.map(
+                            lambda number: self.run_client(
+                                number, seeded, quota_ids, options
+                            ),
+                            range(options["clients"]),
+                        )
+                    )
+            else:
+                results = [self.run_client(0, seeded, quota_ids, options)]
+            duration = time.perf_counter() - start
+        finally:
+            seeder.delete()
+
+        latencies = sorted(
+            latency
+            for client_latencies, _ in results
+            for latency in client_latencies
+        )
+        requests = len(latencies)
+        placements = requests * options["slip_size"]
+        report = {
+            "requests": requests,
+            "placements": placements,
+            "slip_size": options["slip_size"],
+            "clients": options["clients"],
+            "duration": duration,
+            "placements_per_second": placements / duration,
+            "queries_per_placement": sum(count for _, count in results)
+            / placements,
+            "latency_p50": statistics.median(latencies) * 1000,
+            "latency_p95": latencies[int(requests * 0.95) - 1] * 1000,
+        }
+        message = (
+            "{placements} placements in {requests} requests from {clients} "
+            "clients: "
+            "{placements_per_second:.1f} placements/s, "
+            "{queries_per_placement:.2f} queries/placement, "
+            "p50 {latency_p50:.2f} ms, p95 {latency_p95:.2f} ms per request"
+        ).format(**report)
+        logger.info(message)
+        self.stdout.write(message)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
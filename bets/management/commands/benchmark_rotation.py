@@ -0,0 +1,271 @@
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from bets.benchmark import LoadSeeder, percentile, unique_prefix
+from bets.models import Event, Quota
+from bets.placement import PlacementError, place_bet_by_event
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+logger = logging.getLogger("commands_log")
+
+SINGLE = "single"
+EVENT_WIDE = "event-wide"
+
+
+class UpdatedRowsCounter:
+    """
+    Database execute wrapper which counts the rows updated on the table of
+    a model.
+    """
+
+    def __init__(self, model):
+        self.prefix = "UPDATE {}".format(
+            connection.ops.quote_name(model._meta.db_table)
+        )
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.startswith(self.prefix):
+            self.rows += context["cursor"].rowcount
+        return result
+
+
+class Command(BaseCommand):
+    """
+    Benchmark of quota rotation running alongside bet placement.
+    Repricers keep replacing the active Quota of their own Events while
+    clients place Bets by Event, every worker through its own database
+    connection. The event-wide rotation deactivates every Quota of the Event
+    on each tick, as Quota.save() used to, for comparison. Seeded data is
+    deleted afterwards.
+    """
+
+    help = "Measures quota rotations and placements running concurrently"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10,
+            help="Seconds during which every worker runs",
+        )
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=8,
+            help="Amount of concurrent clients placing bets",
+        )
+        parser.add_argument(
+            "--repricers",
+            type=int,
+            default=2,
+            help="Amount of concurrent workers rotating quotas",
+        )
+        parser.add_argument(
+            "--rotation",
+            choices=[SINGLE, EVENT_WIDE],
+            default=SINGLE,
+            help="Deactivate only the active quota, or every quota of the "
+            "event",
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=10,
+            help="Amount of events receiving bets, fewer means more contention",
+        )
+        parser.add_argument(
+            "--history",
+            type=int,
+            default=1000,
+            help="Amount of inactive quotas created for each event",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=100,
+            help="Amount of users placing bets",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def run_client(self, number, seeded, options, stop):
+        """
+        Places Bets by Event until the benchmark stops.
+
+        :return: Tuple with the latencies in seconds and the amount of
+            failed placements
+        """
+
+        rng = random.Random(options["seed"] + number)
+        users = list(get_user_model().objects.filter(id__in=seeded["bettors"]))
+        latencies = list()
+        failures = 0
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                place_bet_by_event(
+                    rng.choice(users), rng.choice(seeded["events"]), Decimal(10)
+                )
+            except PlacementError:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        return latencies, failures
+
+    def run_repricer(self, number, seeded, options, stop):
+        """
+        Rotates the active Quota of the Events of this repricer until the
+        benchmark stops. Events are split between repricers, since
+        concurrent rotations of the same Event are rejected.
+
+        :return: Tuple with the latencies in seconds and the amount of
+            deactivated Quota rows
+        """
+
+        rng = random.Random(options["seed"] - number - 1)
+        event_ids = seeded["events"][number :: options["repricers"]]
+        counter = UpdatedRowsCounter(Quota)
+        latencies = list()
+        with connection.execute_wrapper(counter):
+            while event_ids and time.perf_counter() < stop:
+                event_id = rng.choice(event_ids)
+                start = time.perf_counter()
+                with transaction.atomic():
+                    if options["rotation"] == EVENT_WIDE:
+                        Quota.objects.filter(event_id=event_id).update(
+                            active=False
+                        )
+                    Quota(
+                        manager_id=seeded["managers"][0],
+                        event_id=event_id,
+                        probability=round(rng.uniform(0.01, 0.99), 5),
+                        expiration_date=self.expiration_date,
+                        active=True,
+                    ).save()
+                latencies.append(time.perf_counter() - start)
+        return latencies, counter.rows
+
+    def run_worker(self, number, seeded, options, stop):
+        """
+        Runs a client or a repricer on its own database connection.
+        """
+
+        try:
+            if number < options["clients"]:
+                return self.run_client(number, seeded, options, stop)
+            return self.run_repricer(
+                number - options["clients"], seeded, options, stop
+            )
+        finally:
+            if self.workers > 1:
+                connection.close()
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL")
+        self.workers = options["clients"] + options["repricers"]
+        if not self.workers:
+            raise CommandError("At least one client or repricer is required")
+        seeder = LoadSeeder(
+            users=options["users"] + 1,
+            tags=1,
+            affairs=max(options["events"] // 10, 1),
+            events=options["events"],
+            quotas_per_event=2,
+            bets=0,
+            managers=1,
+            settled=0,
+            seed=options["seed"],
+            prefix=unique_prefix(),
+        )
+        with transaction.atomic():
+            seeder.load()
+            seeded = seeder.seeded()
+            self.expiration_date = Event.objects.get(
+                id=seeded["events"][0]
+            ).expiration_date
+            Quota.objects.bulk_create(
+                Quota(
+                    manager_id=seeded["managers"][0],
+                    event_id=event_id,
+                    probability=Decimal("0.5"),
+                    expiration_date=self.expiration_date,
+                    active=False,
+                )
+                for event_id in seeded["events"]
+                for _ in range(options["history"])
+            )
+        try:
+            stop = time.perf_counter() + options["duration"]
+            if self.workers > 1:
+                with ThreadPoolExecutor(self.workers) as executor:
+                    results = list(
+                        executor.map(
+                            lambda number: self.run_worker(
+                                number, seeded, options, stop
+                            ),
+                            range(self.workers),
+                        )
+                    )
+            else:
+                results = [self.run_worker(0, seeded, options, stop)]
+            duration = options["duration"]
+        finally:
+            seeder.delete()
+
+        placement_latencies = sorted(
+            latency
+            for latencies, _ in results[: options["clients"]]
+            for latency in latencies
+        )
+        rotation_latencies = sorted(
+            latency
+            for latencies, _ in results[options["clients"] :]
+            for latency in latencies
+        )
+        rotations = len(rotation_latencies)
+        report = {
+            "rotation": options["rotation"],
+            "clients": options["clients"],
+            "repricers": options["repricers"],
+            "history": options["history"],
+            "duration": duration,
+            "placements": len(placement_latencies),
+            "failed_placements": sum(
+                failures for _, failures in results[: options["clients"]]
+            ),
+            "placements_per_second": len(placement_latencies) / duration,
+            "placement_p50": percentile(placement_latencies, 0.5),
+            "placement_p95": percentile(placement_latencies, 0.95),
+            "rotations": rotations,
+            "rotations_per_second": rotations / duration,
+            "rows_per_rotation": sum(
+                deactivated for _, deactivated in results[options["clients"] :]
+            )
+            / rotations
+            if rotations
+            else None,
+            "rotation_p95": percentile(rotation_latencies, 0.95),
+        }
+        message = (
+            "{rotation} rotation: {placements_per_second:.1f} placements/s "
+            "from {clients} clients, {rotations_per_second:.1f} rotations/s "
+            "from {repricers} repricers"
+        ).format(**report)
+        logger.info(message)
+        self.stdout.write(message)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from bets.models import Quota
+from bets.pubsub import (
+    QUOTA_CHANNEL,
+    Broker,
+    BrokerPubSub,
+    InProcessPubSub,
+    serialize_instance,
+    set_pubsub,
+)
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from j8bet_backend.graphql.websocket import (
+    GQL_CONNECTION_INIT,
+    GQL_START,
+    GraphQLWebSocketApp,
+)
+
+logger = logging.getLogger("commands_log")
+
+SUBSCRIPTION = "subscription { quotaChanged { id probability coeficient } }"
+
+
+class Command(BaseCommand):
+    """
+    Benchmark of the fan-out of quota changes to GraphQL subscriptions.
+    Subscribers connect to the websocket application through in-memory
+    connections, while a publisher thread publishes unsaved Quotas, so the
+    database is not involved. With --broker, messages go through a local
+    broker between two hubs, as they would between processes.
+    """
+
+    help = "Measures quota changes delivered per second to subscribers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--subscribers",
+            type=int,
+            default=100,
+            help="Amount of websocket connections subscribed to quota changes",
+        )
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=100,
+            help="Amount of quota changes published",
+        )
+        parser.add_argument(
+            "--broker",
+            action="store_true",
+            help="Relay messages through a local broker",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60,
+            help="Seconds to wait for every message to be delivered",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def build_messages(self, options):
+        """
+        Returns serialized Quota changes, built without the database.
+        """
+
+        rng = random.Random(options["seed"])
+        now = timezone.now()
+        return [
+            serialize_instance(
+                Quota(
+                    id=number + 1,
+                    event_id=1,
+                    manager_id=1,
+                    probability=Decimal(round(rng.uniform(0.01, 0.99), 5)),
+                    coeficient=Decimal(round(rng.uniform(1, 50), 5)),
+                    expiration_date=now,
+                    creation_date=now,
+                    modification_date=now,
+                    active=True,
+                )
+            )
+            for number in range(options["messages"])
+        ]
+
+    async def subscribe(self, application, number, timeout):
+        """
+        Opens a websocket connection subscribed to quota changes, once the
+        subscription is registered.
+        """
+
+        communicator = ApplicationCommunicator(
+            application,
+            {
+                "type": "websocket",
+                "path": "/graphql",
+                "subprotocols": ["graphql-ws"],
+            },
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        await communicator.receive_output(timeout)
+        for message in (
+            {"type": GQL_CONNECTION_INIT, "payload": dict()},
+            {
+                "type": GQL_START,
+                "id": str(number),
+                "payload": {"query": SUBSCRIPTION},
+            },
+            # Operations are started in order, so the result of this query
+            # means the subscription is registered
+            {
+                "type": GQL_START,
+                "id": "ready",
+                "payload": {"query": "{ __typename }"},
+            },
+        ):
+            await communicator.send_input(
+                {"type": "websocket.receive", "text": json.dumps(message)}
+            )
+        # Acknowledgement, followed by the result and completion of the query
+        for _ in range(3):
+            await communicator.receive_output(timeout)
+        return communicator
+
+    async def receive(self, communicator, messages, timeout):
+        """
+        Receives every message, returning the seconds at the last delivery.
+        """
+
+        for _ in range(messages):
+            message = json.loads(
+                (await communicator.receive_output(timeout))["text"]
+            )
+            if "errors" in message["payload"]:
+                raise CommandError(message["payload"]["errors"])
+        return time.perf_counter()
+
+    async def run(self, publisher, messages, options):
+        application = GraphQLWebSocketApp()
+        timeout = options["timeout"]
+        communicators = await asyncio.gather(
+            *(
+                self.subscribe(application, number, timeout)
+                for number in range(options["subscribers"])
+            )
+        )
+        try:
+            receivers = asyncio.gather(
+                *(
+                    self.receive(communicator, len(messages), timeout)
+                    for communicator in communicators
+                )
+            )
+            start = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: [
+                    publisher.publish(QUOTA_CHANNEL, message)
+                    for message in messages
+                ],
+            )
+            published = time.perf_counter()
+            delivered = max(await receivers)
+        finally:
+            for communicator in communicators:
+                await communicator.send_input({"type": "websocket.disconnect"})
+                await communicator.wait(timeout)
+        return published - start, delivered - start
+
+    def handle(self, *args, **options):
+        if options["subscribers"] < 1 or options["messages"] < 1:
+            raise CommandError(
+                "At least one subscriber and one message are required"
+            )
+        messages = self.build_messages(options)
+        broker = Broker().start() if options["broker"] else None
+        if broker:
+            publisher = BrokerPubSub(port=broker.port)
+            previous = set_pubsub(BrokerPubSub(port=broker.port))
+        else:
+            publisher = InProcessPubSub()
+            previous = set_pubsub(publisher)
+        try:
+            publishing, duration = async_to_sync(self.run)(
+                publisher, messages, options
+            )
+        finally:
+            subscriber_hub = set_pubsub(previous)
+            if broker:
+                publisher.close()
+                subscriber_hub.close()
+                broker.stop()
+
+        deliveries = len(messages) * options["subscribers"]
+        report = {
+            "backend": "broker" if broker else "in-process",
+            "subscribers": options["subscribers"],
+            "messages": len(messages),
+            "deliveries": deliveries,
+            "publishing_duration": publishing,
+            "duration": duration,
+            "messages_per_second": len(messages) / duration,
+            "deliveries_per_second": deliveries / duration,
+        }
+        message = (
+            "{backend}: {messages} messages to {subscribers} subscribers, "
+            "{deliveries_per_second:.1f} deliveries/s"
+        ).format(**report)
+        logger.info(message)
+        self.stdout.write(message)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
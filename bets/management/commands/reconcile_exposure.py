@@ -0,0 +1,60 @@
+import logging
+
+from bets.exposure import SCOPES, fix_exposure, reconcile_exposures
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Verifies that the exposure of every Quota, Event and User equals the
+    totals of its open Bets, rebuilt from scratch while streaming owners in
+    chunks.
+    """
+
+    help = "Verifies exposures against the totals of the open bets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Amount of quotas, events or users verified per query",
+        )
+        parser.add_argument(
+            "--scope",
+            choices=list(SCOPES),
+            action="append",
+            help="Only verify the given scope, can be repeated",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Set mismatched exposures to the totals of their open bets",
+        )
+
+    def handle(self, *args, **options):
+        verified = 0
+        mismatches = 0
+        for scope in options["scope"] or SCOPES:
+            for owners, chunk_mismatches in reconcile_exposures(
+                scope, options["chunk_size"]
+            ):
+                verified += owners
+                for mismatch in chunk_mismatches:
+                    mismatches += 1
+                    message = (
+                        "Exposure of {scope} {object_id} is {stored} but its "
+                        "open bets total {expected}"
+                    ).format(**mismatch._asdict())
+                    logger.warning(message)
+                    self.stdout.write(message)
+                    if options["fix"]:
+                        fix_exposure(scope, mismatch.object_id)
+        message = "{verified} exposures verified, {mismatches} mismatched"
+        message = message.format(verified=verified, mismatches=mismatches)
+        logger.info(message)
+        self.stdout.write(message)
+        if mismatches and not options["fix"]:
+            raise CommandError(message)
@@ -0,0 +1,52 @@
+import logging
+
+from bets.ledger import fix_account, reconcile_accounts
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Verifies that the balance of every Account equals the sum of its
+    LedgerEntries, streaming Accounts in chunks.
+    """
+
+    help = "Verifies account balances against the sum of their ledger entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Amount of accounts verified per query",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Set mismatched balances to the sum of their entries",
+        )
+
+    def handle(self, *args, **options):
+        verified = 0
+        mismatches = 0
+        for accounts, chunk_mismatches in reconcile_accounts(
+            options["chunk_size"]
+        ):
+            verified += accounts
+            for mismatch in chunk_mismatches:
+                mismatches += 1
+                message = (
+                    "Account {account_id} has a balance of {balance} but its "
+                    "entries sum {total}"
+                ).format(**mismatch._asdict())
+                logger.warning(message)
+                self.stdout.write(message)
+                if options["fix"]:
+                    fix_account(mismatch.account_id)
+        message = "{verified} accounts verified, {mismatches} mismatched"
+        message = message.format(verified=verified, mismatches=mismatches)
+        logger.info(message)
+        self.stdout.write(message)
+        if mismatches and not options["fix"]:
+            raise CommandError(message)
@@ -0,0 +1,47 @@
+import logging
+import time
+
+from bets.models import Event
+from bets.odds import reprice_event, reprice_open_events
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Recalculates the coeficients of active Quotas with the active
+    OddsFormula, for a single Event or for every active Event.
+    """
+
+    help = "Recalculates quota coeficients with the active odds formula"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event",
+            type=int,
+            help="ID of the event to reprice, every active event if omitted",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Amount of quotas updated per query",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["event"] is not None:
+            event = Event.objects.filter(id=options["event"]).first()
+            if event is None:
+                raise CommandError(
+                    "Event {} does not exist".format(options["event"])
+                )
+            repriced = reprice_event(event, options["batch_size"])
+        else:
+            repriced = reprice_open_events(options["batch_size"])
+        message = "Repriced {repriced} quotas in {duration:.3f} seconds".format(
+            repriced=repriced, duration=time.perf_counter() - start
+        )
+        logger.info(message)
+        self.stdout.write(message)
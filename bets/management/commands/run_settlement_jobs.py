@@ -0,0 +1,56 @@
+import logging
+import time
+
+from bets.settlement import next_settlement_job, run_settlement_job
+from django.core.management.base import BaseCommand
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Worker which processes pending SettlementJobs in checkpointed chunks.
+    Jobs left unfinished by a crashed worker are resumed from their last
+    committed chunk.
+    """
+
+    help = "Processes pending settlement jobs in checkpointed chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Amount of bets settled per committed chunk",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait when there are no pending jobs",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no pending jobs",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job_id = next_settlement_job()
+            if job_id is None:
+                if options["once"]:
+                    return
+                time.sleep(options["sleep"])
+                continue
+            job = run_settlement_job(job_id, options["chunk_size"])
+            message = (
+                "Settlement job {id} {status}: {settled}/{total} bets".format(
+                    id=job.id,
+                    status=job.status,
+                    settled=job.settled_bets,
+                    total=job.total_bets,
+                )
+            )
+            logger.info(message)
+            self.stdout.write(message)
@@ -0,0 +1,175 @@
+import json
+import logging
+import time
+from datetime import date, datetime
+
+from bets.benchmark import SEED_DATE, LoadSeeder
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger("commands_log")
+
+
+class Command(BaseCommand):
+    """
+    Generates a large dataset of Users, Tags, Affairs, Events, Quotas,
+    Transactions, Bets, Prizes, ledger entries and exposures on PostgreSQL,
+    see bets.benchmark.LoadSeeder. The same seed and sizes always generate
+    the same data on the same --date, and with --flush the same IDs too, so
+    benchmarks and EXPLAIN runs can start from the same database. Seeded
+    data is kept.
+    """
+
+    help = "Generates a large, reproducible dataset for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=1000000,
+            help="Amount of users, managers included",
+        )
+        parser.add_argument(
+            "--managers",
+            type=int,
+            default=10,
+            help="Amount of users managing the catalog, the rest place bets",
+        )
+        parser.add_argument(
+            "--tags", type=int, default=1000, help="Amount of tags"
+        )
+        parser.add_argument(
+            "--affairs", type=int, default=50000, help="Amount of affairs"
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=200000,
+            help="Amount of events, spread evenly across the affairs",
+        )
+        parser.add_argument(
+            "--quotas-per-event",
+            type=int,
+            default=2,
+            help="Amount of quotas of each event",
+        )
+        parser.add_argument(
+            "--bets", type=int, default=5000000, help="Amount of bets"
+        )
+        parser.add_argument(
+            "--settled",
+            type=float,
+            default=0.5,
+            help="Share of settled events, from 0 to 1",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Amount of rows created per query",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for generated values"
+        )
+        parser.add_argument(
+            "--date",
+            type=date.fromisoformat,
+            default=SEED_DATE.date(),
+            help="Day in UTC on which the data is generated, as YYYY-MM-DD",
+        )
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete every object of the database first, which also "
+            "restarts the IDs",
+        )
+        parser.add_argument(
+            "--output", help="Path of a JSON file to write the results to"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This command requires PostgreSQL")
+        counts = ("tags", "affairs", "events", "quotas_per_event")
+        if min(options[name] for name in counts + ("batch_size",)) < 1:
+            raise CommandError(
+                "Tags, affairs, events, quotas and batch sizes start from 1"
+            )
+        if options["bets"] < 0 or options["managers"] < 1:
+            raise CommandError("There must be managers and no negative bets")
+        if options["users"] <= options["managers"]:
+            raise CommandError("There must be more users than managers")
+        if not 0 <= options["settled"] <= 1:
+            raise CommandError("The share of settled events goes from 0 to 1")
+        if options["flush"]:
+            call_command("flush", interactive=False, verbosity=0)
+        seeder = LoadSeeder(
+            users=options["users"],
+            tags=options["tags"],
+            affairs=options["affairs"],
+            events=options["events"],
+            quotas_per_event=options["quotas_per_event"],
+            bets=options["bets"],
+            managers=options["managers"],
+            settled=options["settled"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            now=datetime.combine(
+                options["date"], datetime.min.time(), tzinfo=timezone.utc
+            ),
+        )
+        if seeder.loaded():
+            raise CommandError(
+                "Seed {} is already loaded, use --flush or another "
+                "seed".format(options["seed"])
+            )
+
+        durations = dict()
+        start = time.perf_counter()
+        with transaction.atomic():
+            for name, step in seeder.steps():
+                step_start = time.perf_counter()
+                step()
+                durations[name] = time.perf_counter() - step_start
+                message = "{name} seeded in {duration:.2f} s".format(
+                    name=name, duration=durations[name]
+                )
+                logger.info(message)
+                if options["verbosity"] > 1:
+                    self.stdout.write(message)
+        duration = time.perf_counter() - start
+        sizes = {
+            name: options[name]
+            for name in (
+                "users",
+                "managers",
+                "tags",
+                "affairs",
+                "events",
+                "quotas_per_event",
+                "bets",
+                "settled",
+            )
+        }
+        message = (
+            "Seeded {users} users, {events} events and {bets} bets with "
+            "seed {seed} in {duration:.2f} s"
+        ).format(seed=options["seed"], duration=duration, **sizes)
+        logger.info(message)
+        self.stdout.write(message)
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {
+                        "seed": options["seed"],
+                        "date": seeder.now.isoformat(),
+                        "sizes": sizes,
+                        "duration": duration,
+                        "steps": durations,
+                    },
+                    output,
+                    indent=2,
+                )
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.6 on 2026-10-16 20:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0004_auto_20210812_2054'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed', models.BooleanField(verbose_name='Completado')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En proceso'), ('done', 'Terminado'), ('failed', 'Fallido')], default='pending', max_length=10, verbose_name='Estado')),
+                ('last_bet_id', models.IntegerField(default=0, verbose_name='Última apuesta liquidada')),
+                ('settled_bets', models.IntegerField(default=0, verbose_name='Apuestas liquidadas')),
+                ('total_bets', models.IntegerField(default=0, verbose_name='Apuestas por liquidar')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('creation_date', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('modification_date', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('finish_date', models.DateTimeField(null=True, verbose_name='Fecha de término')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlement_jobs', to='bets.event', verbose_name='Evento')),
+            ],
+            options={
+                'verbose_name': 'Liquidación',
+                'verbose_name_plural': 'Liquidaciones',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.6 on 2026-10-16 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0005_settlementjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['quota', 'won'], name='bet_quota_won_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['user', 'active'], name='bet_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(condition=models.Q(('won__isnull', True)), fields=['quota', 'id'], name='bet_open_quota_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['active', 'completed'], name='event_active_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prize',
+            index=models.Index(fields=['creation_date'], name='prize_creation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quota',
+            index=models.Index(fields=['event', 'active'], name='quota_event_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quota',
+            index=models.Index(fields=['creation_date'], name='quota_creation_date_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.2.6 on 2026-10-16 21:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Existing Bet placements and Prize payouts are posted to the ledger, so the
+# balance of every User starts consistent with its history.
+BACKFILL_SQL = """
+    INSERT INTO bets_account (user_id, balance, modification_date)
+    SELECT user_id, SUM(amount), NOW()
+    FROM (
+        SELECT trx.user_id, -trx.amount AS amount
+        FROM bets_transaction AS trx
+        WHERE EXISTS (SELECT 1 FROM bets_bet WHERE transaction_id = trx.id)
+        UNION ALL
+        SELECT user_id, reward FROM bets_prize
+    ) AS movement
+    GROUP BY user_id;
+
+    INSERT INTO bets_ledgerentry
+        (account_id, amount, description, transaction_id, prize_id,
+        creation_date)
+    SELECT account.id, -trx.amount, 'Bet placement', trx.id, NULL,
+        trx.creation_date
+    FROM bets_transaction AS trx
+    INNER JOIN bets_account AS account ON account.user_id = trx.user_id
+    WHERE EXISTS (SELECT 1 FROM bets_bet WHERE transaction_id = trx.id)
+    UNION ALL
+    SELECT account.id, prize.reward, 'Prize payout', NULL, prize.id,
+        prize.creation_date
+    FROM bets_prize AS prize
+    INNER JOIN bets_account AS account ON account.user_id = prize.user_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bets', '0006_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Account',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Saldo')),
+                ('modification_date', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='account', to=settings.AUTH_USER_MODEL, verbose_name='Titular')),
+            ],
+            options={
+                'verbose_name': 'Cuenta',
+                'verbose_name_plural': 'Cuentas',
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Monto')),
+                ('description', models.CharField(max_length=255, verbose_name='Descripción')),
+                ('creation_date', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='bets.account', verbose_name='Cuenta')),
+                ('prize', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='bets.prize', verbose_name='Premio')),
+                ('transaction', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='bets.transaction', verbose_name='Transacción')),
+            ],
+            options={
+                'verbose_name': 'Movimiento',
+                'verbose_name_plural': 'Movimientos',
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
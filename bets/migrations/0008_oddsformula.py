@@ -0,0 +1,31 @@
+# Generated by Django 3.2.6 on 2026-10-16 22:15
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0007_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OddsFormula',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Nombre')),
+                ('method', models.CharField(choices=[('margin', 'Margen'), ('shin', 'Shin'), ('power', 'Potencia')], max_length=10, verbose_name='Método')),
+                ('parameter', models.DecimalField(decimal_places=5, max_digits=6, validators=[django.core.validators.MaxValueValidator(Decimal('0.99999')), django.core.validators.MinValueValidator(0)], verbose_name='Parámetro')),
+                ('active', models.BooleanField(default=False, verbose_name='Activo')),
+                ('creation_date', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('modification_date', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+            ],
+            options={
+                'verbose_name': 'Fórmula de cuotas',
+                'verbose_name_plural': 'Fórmulas de cuotas',
+            },
+        ),
+    ]
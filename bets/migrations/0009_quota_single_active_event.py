@@ -0,0 +1,27 @@
+# Generated by Django 3.2.6 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+# Only the newest active Quota of each Event is kept active, so the unique
+# index can be created.
+DEACTIVATE_SQL = """
+    UPDATE bets_quota SET active = FALSE
+    WHERE active AND id NOT IN (
+        SELECT MAX(id) FROM bets_quota WHERE active GROUP BY event_id
+    )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0008_oddsformula'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEACTIVATE_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='quota',
+            constraint=models.UniqueConstraint(condition=models.Q(('active', True)), fields=('event',), name='quota_single_active_event'),
+        ),
+    ]
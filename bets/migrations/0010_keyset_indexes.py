@@ -0,0 +1,21 @@
+# Generated by Django 3.2.6 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0009_quota_single_active_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['creation_date', 'id'], name='bet_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['creation_date', 'id'], name='transaction_keyset_idx'),
+        ),
+    ]
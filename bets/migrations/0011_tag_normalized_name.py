@@ -0,0 +1,54 @@
+# Generated by Django 3.2.6 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+def normalize(name):
+    return " ".join(name.split()).casefold()
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """
+    Fills the normalized name of every Tag. Tags whose names only differ on
+    case or spacing are merged into the oldest one, so the unique index can
+    be created.
+    """
+
+    Tag = apps.get_model("bets", "Tag")
+    Affair = apps.get_model("bets", "Affair")
+    kept = dict()
+    for tag in Tag.objects.order_by("id").iterator():
+        normalized_name = normalize(tag.name)
+        if normalized_name not in kept:
+            kept[normalized_name] = tag.id
+            tag.normalized_name = normalized_name
+            tag.save(update_fields=["normalized_name"])
+            continue
+        for affair in Affair.objects.filter(tags=tag):
+            affair.tags.add(kept[normalized_name])
+        tag.delete()
+    # Deleted Tags leave deferred foreign key checks pending, which would
+    # prevent altering the table on the same transaction
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=255, null=True, verbose_name='Nombre normalizado'),
+        ),
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=255, unique=True, verbose_name='Nombre normalizado'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 3.2.6 on 2026-10-16 22:49
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Search vectors are computed by triggers, so every write keeps them up to
+# date, bulk ones included. Names of Events weigh more than descriptions.
+# Trigram indexes serve partial word matches on the same columns, built on
+# the expressions of Django case insensitive lookups, so icontains and
+# istartswith filters use them too.
+SEARCH_SQL = """
+    CREATE FUNCTION bets_affair_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := setweight(
+            to_tsvector('spanish', coalesce(NEW.description, '')), 'B'
+        );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER bets_affair_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF description, search_vector ON bets_affair
+    FOR EACH ROW EXECUTE FUNCTION bets_affair_search_vector();
+
+    CREATE FUNCTION bets_event_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('spanish', coalesce(NEW.name, '')), 'A')
+            || setweight(
+                to_tsvector('spanish', coalesce(NEW.description, '')), 'B'
+            );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER bets_event_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description, search_vector ON bets_event
+    FOR EACH ROW EXECUTE FUNCTION bets_event_search_vector();
+
+    UPDATE bets_affair SET search_vector = NULL;
+    UPDATE bets_event SET search_vector = NULL;
+
+    CREATE INDEX affair_search_idx ON bets_affair USING gin (search_vector);
+    CREATE INDEX event_search_idx ON bets_event USING gin (search_vector);
+"""
+
+TRIGRAM_SQL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX affair_description_trgm_idx
+    ON bets_affair USING gin (upper(description::text) gin_trgm_ops);
+    CREATE INDEX event_name_trgm_idx
+    ON bets_event USING gin (upper(name::text) gin_trgm_ops);
+    CREATE INDEX event_description_trgm_idx
+    ON bets_event USING gin (upper(description::text) gin_trgm_ops);
+"""
+
+DROP_SEARCH_SQL = """
+    DROP INDEX affair_search_idx;
+    DROP INDEX IF EXISTS affair_description_trgm_idx;
+    DROP INDEX event_search_idx;
+    DROP INDEX IF EXISTS event_name_trgm_idx;
+    DROP INDEX IF EXISTS event_description_trgm_idx;
+    DROP TRIGGER bets_affair_search_vector_trigger ON bets_affair;
+    DROP TRIGGER bets_event_search_vector_trigger ON bets_event;
+    DROP FUNCTION bets_affair_search_vector();
+    DROP FUNCTION bets_event_search_vector();
+"""
+
+
+def create_search(apps, schema_editor):
+    # Other databases search with the fallback of bets.search
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_SQL)
+    # pg_trgm ships with the contrib modules of PostgreSQL, which some
+    # installations leave out. Partial matches still work without it.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone():
+            schema_editor.execute(TRIGRAM_SQL)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SEARCH_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0011_tag_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affair',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Vector de búsqueda'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Vector de búsqueda'),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
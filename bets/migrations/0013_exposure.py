@@ -0,0 +1,93 @@
+# Generated by Django 3.2.6 on 2026-10-16 22:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Exposures start from the totals of the Bets which are still open.
+BACKFILL_SQL = """
+    INSERT INTO bets_quotaexposure
+        (quota_id, bets, stake, liability, modification_date)
+    SELECT bet.quota_id, COUNT(*), SUM(trx.amount),
+        SUM(bet.potential_earnings), CURRENT_TIMESTAMP
+    FROM bets_bet AS bet
+    INNER JOIN bets_transaction AS trx ON trx.id = bet.transaction_id
+    WHERE bet.won IS NULL
+    GROUP BY bet.quota_id;
+
+    INSERT INTO bets_eventexposure
+        (event_id, bets, stake, liability, modification_date)
+    SELECT quota.event_id, COUNT(*), SUM(trx.amount),
+        SUM(bet.potential_earnings), CURRENT_TIMESTAMP
+    FROM bets_bet AS bet
+    INNER JOIN bets_quota AS quota ON quota.id = bet.quota_id
+    INNER JOIN bets_transaction AS trx ON trx.id = bet.transaction_id
+    WHERE bet.won IS NULL
+    GROUP BY quota.event_id;
+
+    INSERT INTO bets_userexposure
+        (user_id, bets, stake, liability, modification_date)
+    SELECT bet.user_id, COUNT(*), SUM(trx.amount),
+        SUM(bet.potential_earnings), CURRENT_TIMESTAMP
+    FROM bets_bet AS bet
+    INNER JOIN bets_transaction AS trx ON trx.id = bet.transaction_id
+    WHERE bet.won IS NULL
+    GROUP BY bet.user_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bets', '0012_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserExposure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bets', models.IntegerField(default=0, verbose_name='Apuestas abiertas')),
+                ('stake', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto apostado')),
+                ('liability', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Pago potencial')),
+                ('modification_date', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='exposure', to=settings.AUTH_USER_MODEL, verbose_name='Apostador')),
+            ],
+            options={
+                'verbose_name': 'Exposición de apostador',
+                'verbose_name_plural': 'Exposiciones de apostadores',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuotaExposure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bets', models.IntegerField(default=0, verbose_name='Apuestas abiertas')),
+                ('stake', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto apostado')),
+                ('liability', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Pago potencial')),
+                ('modification_date', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('quota', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='exposure', to='bets.quota', verbose_name='Cuota')),
+            ],
+            options={
+                'verbose_name': 'Exposición de cuota',
+                'verbose_name_plural': 'Exposiciones de cuotas',
+            },
+        ),
+        migrations.CreateModel(
+            name='EventExposure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bets', models.IntegerField(default=0, verbose_name='Apuestas abiertas')),
+                ('stake', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto apostado')),
+                ('liability', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Pago potencial')),
+                ('modification_date', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='exposure', to='bets.event', verbose_name='Evento')),
+            ],
+            options={
+                'verbose_name': 'Exposición de evento',
+                'verbose_name_plural': 'Exposiciones de eventos',
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.6 on 2026-10-16 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0013_exposure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventexposure',
+            name='max_liability',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Pago potencial máximo'),
+        ),
+        migrations.AddField(
+            model_name='eventexposure',
+            name='max_stake',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Monto apostado máximo'),
+        ),
+        migrations.AddField(
+            model_name='quotaexposure',
+            name='max_liability',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Pago potencial máximo'),
+        ),
+        migrations.AddField(
+            model_name='quotaexposure',
+            name='max_stake',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Monto apostado máximo'),
+        ),
+        migrations.AddField(
+            model_name='userexposure',
+            name='max_liability',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Pago potencial máximo'),
+        ),
+        migrations.AddField(
+            model_name='userexposure',
+            name='max_stake',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Monto apostado máximo'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.6 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+# Bets placed before the coefficient was kept on them take the one their
+# potential earnings were calculated with when placed, since their Quota
+# might have been repriced since then. Bets without an amount take the
+# current one of their Quota instead.
+BACKFILL_SQL = """
+    UPDATE bets_bet AS bet
+    SET coeficient = COALESCE(
+        bet.potential_earnings / NULLIF(trx.amount, 0), quota.coeficient
+    )
+    FROM bets_quota AS quota, bets_transaction AS trx
+    WHERE quota.id = bet.quota_id AND trx.id = bet.transaction_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0014_exposure_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bet',
+            name='coeficient',
+            field=models.DecimalField(decimal_places=5, max_digits=9, null=True, verbose_name='Coeficiente de ganancia'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='bet',
+            name='coeficient',
+            field=models.DecimalField(decimal_places=5, max_digits=9, verbose_name='Coeficiente de ganancia'),
+        ),
+    ]
@@ -1,9 +1,10 @@
 from decimal import Decimal
 
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -15,6 +16,9 @@ class Tag(models.Model):
     """
 
     name = models.CharField("Nombre", max_length=255)
+    normalized_name = models.CharField(
+        "Nombre normalizado", max_length=255, unique=True, editable=False
+    )
     creation_date = models.DateTimeField("Fecha de creación", auto_now_add=True)
     modification_date = models.DateTimeField(
         "Fecha de modificación", auto_now=True
@@ -24,6 +28,22 @@ class Tag(models.Model):
         verbose_name = "Etiqueta"
         verbose_name_plural = "Etiquetas"
 
+    @staticmethod
+    def normalize(name):
+        """
+        Returns the form of a name under which Tags are unique: trimmed,
+        with single spaces and case folded.
+        """
+
+        return " ".join(name.split()).casefold()
+
+    def save(self, **kwargs):
+        """
+        Function which saves a Tag along with its normalized name
+        """
+        self.normalized_name = self.normalize(self.name)
+        super().save(**kwargs)
+
 
 class Affair(models.Model):
     """
@@ -48,6 +68,10 @@ class Affair(models.Model):
         related_name="affairs",
     )
     description = models.TextField("Descripción", null=False, blank=False)
+    # Kept up to date by a trigger on PostgreSQL, see bets.search
+    search_vector = SearchVectorField(
+        "Vector de búsqueda", null=True, editable=False
+    )
     creation_date = models.DateTimeField("Fecha de creación", auto_now_add=True)
     modification_date = models.DateTimeField(
         "Fecha de modificación", auto_now=True
@@ -76,6 +100,10 @@ class Event(models.Model):
     name = models.CharField("Nombre", max_length=255)
     description = models.TextField("Descripción", null=False, blank=False)
     rules = models.TextField("Reglas", null=True, blank=True)
+    # Kept up to date by a trigger on PostgreSQL, see bets.search
+    search_vector = SearchVectorField(
+        "Vector de búsqueda", null=True, editable=False
+    )
     creation_date = models.DateTimeField("Fecha de creación", auto_now_add=True)
     modification_date = models.DateTimeField(
         "Fecha de modificación", auto_now=True
@@ -87,6 +115,12 @@ class Event(models.Model):
     class Meta:
         verbose_name = "Evento"
         verbose_name_plural = "Eventos"
+        indexes = [
+            models.Index(
+                fields=["active", "completed"],
+                name="event_active_completed_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -99,43 +133,56 @@ class Event(models.Model):
             self.completed = None
             super().save()
             return
+        # Imported here since the response cache is built on these models
+        from bets.response_cache import bump_generations
+
         if self.active is False:
-            self.quotas.update(active=False)
+            self.quotas.filter(active=True).update(active=False)
+            bump_generations(Quota)
             super().save()
             return
-        bets_to_update = list()
-        if self.completed is True:
-            prizes_to_create = list()
-            for quota in self.quotas.all():
-                for bet in quota.bets.filter(won=None):
-                    # Reward amount calculation must include the
-                    # probability-to-quota calculation. This should
-                    # probably be done when creating a new quota
-                    prize = Prize(
-                        bet=bet,
-                        user=bet.user,
-                        reward=bet.quota.probability * bet.transaction.amount,
-                    )
-                    prizes_to_create.append(prize)
-                    bet.won = True
-                    bet.active = False
-                    bets_to_update.append(bet)
-            Prize.objects.bulk_create(prizes_to_create)
-            self.expiration_date = timezone.now()
-        elif self.completed is False:
-            for quota in self.quotas.all():
-                for bet in quota.bets.filter(won=None):
-                    bet.won = False
-                    bet.active = False
-                    bets_to_update.append(bet)
-            self.expiration_date = timezone.now()
-        else:
+        if self.completed is None:
             super().save()
             return
-        Bet.objects.bulk_update(bets_to_update, fields=["won", "active"])
-        self.quotas.update(active=False)
-        self.active = False
-        super().save()
+        # Bets are settled by the settlement worker, never on this request
+        self.schedule_settlement(self.completed)
+
+    def schedule_settlement(self, completed):
+        """
+        Closes the Event and creates a SettlementJob for its open Bets,
+        which will be settled by a worker instead of on this request.
+        An unfinished job for the Event is reused if it exists, as long as
+        it settles the same outcome, since it may have paid Prizes already.
+
+        :param completed: Outcome of the Event
+        :return: SettlementJob for the Event
+        :raise ValidationError: If an unfinished job has another outcome
+        """
+
+        with transaction.atomic():
+            job = (
+                self.settlement_jobs.select_for_update()
+                .filter(status__in=SettlementJob.UNFINISHED_STATUSES)
+                .first()
+            )
+            if job is not None and job.completed != completed:
+                raise ValidationError(
+                    _("El evento ya se está liquidando con otro resultado")
+                )
+            self.completed = completed
+            self.active = False
+            self.expiration_date = timezone.now()
+            # Inactive Events are saved without settling their Bets
+            self.save()
+            if job is None:
+                job = SettlementJob.objects.create(
+                    event=self,
+                    completed=completed,
+                    total_bets=Bet.objects.filter(
+                        quota__event=self, won=None
+                    ).count(),
+                )
+        return job
 
 
 class Transaction(models.Model):
@@ -160,11 +207,68 @@ class Transaction(models.Model):
     class Meta:
         verbose_name = "Transacción"
         verbose_name_plural = "Transacciones"
+        indexes = [
+            # Keyset pagination order of allTransactions
+            models.Index(
+                fields=["creation_date", "id"], name="transaction_keyset_idx"
+            ),
+        ]
 
     def __str__(self):
         return str(self.amount)
 
 
+class OddsFormula(models.Model):
+    """
+    Class for OddsFormula model.
+    An OddsFormula describes how probabilities of Quotas are transformed
+    into coeficients. Only one OddsFormula can be active at a time.
+    """
+
+    MARGIN = "margin"
+    SHIN = "shin"
+    POWER = "power"
+    METHOD_CHOICES = [
+        (MARGIN, "Margen"),
+        (SHIN, "Shin"),
+        (POWER, "Potencia"),
+    ]
+
+    name = models.CharField("Nombre", max_length=255)
+    method = models.CharField("Método", max_length=10, choices=METHOD_CHOICES)
+    parameter = models.DecimalField(
+        "Parámetro",
+        max_digits=6,
+        decimal_places=5,
+        validators=[
+            MaxValueValidator(Decimal("0.99999")),
+            MinValueValidator(0),
+        ],
+    )
+    active = models.BooleanField("Activo", default=False)
+    creation_date = models.DateTimeField("Fecha de creación", auto_now_add=True)
+    modification_date = models.DateTimeField(
+        "Fecha de modificación", auto_now=True
+    )
+
+    class Meta:
+        verbose_name = "Fórmula de cuotas"
+        verbose_name_plural = "Fórmulas de cuotas"
+
+    def __str__(self):
+        return "{name} - {method}".format(
+            name=self.name, method=self.get_method_display()
+        )
+
+    def save(self, **kwargs):
+        """
+        Function which saves an OddsFormula and deactivates the other ones
+        """
+        if self.active:
+            OddsFormula.objects.exclude(id=self.id).update(active=False)
+        super().save()
+
+
 class Quota(models.Model):
     """
     Class for Quota model.
@@ -207,6 +311,21 @@ class Quota(models.Model):
     class Meta:
         verbose_name = "Cuota"
         verbose_name_plural = "Cuotas"
+        indexes = [
+            models.Index(
+                fields=["event", "active"], name="quota_event_active_idx"
+            ),
+            models.Index(
+                fields=["creation_date"], name="quota_creation_date_idx"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event"],
+                condition=models.Q(active=True),
+                name="quota_single_active_event",
+            ),
+        ]
 
     def __str__(self):
         return "{event} - {probability}".format(
@@ -216,22 +335,28 @@ class Quota(models.Model):
     def calculate_coeficient(self):
         """
         Transforms a probability (numeric value from 0 to 1) into a
-        coeficient which determines the potential earnings in bets.
+        coeficient which determines the potential earnings in bets, using
+        the active OddsFormula.
         """
-        # TODO implement the coeficient calculation
-        # This calculation must not be part of the code, but instead be a
-        # formula retrieved from .env, stored on database, or something else.
+        # Imported here since the odds engine depends on these models
+        from bets.odds import get_pricer
 
-        self.coeficient = Decimal(1.00001)
+        self.coeficient = get_pricer()([self.probability])[0]
 
     def save(self, **kwargs):
         """
-        Function which saves a Quota model and deactivates previous ones
+        Function which saves a Quota model and deactivates the previously
+        active one. Only that row is updated, and the partial unique index
+        on active Quotas rejects concurrent rotations of the same Event
+        instead of leaving two active Quotas.
         """
-        if self.active:
-            self.event.quotas.update(active=False)
         self.calculate_coeficient()
-        super().save()
+        with transaction.atomic():
+            if self.active:
+                Quota.objects.filter(
+                    event_id=self.event_id, active=True
+                ).exclude(id=self.id).update(active=False)
+            super().save()
 
 
 class Bet(models.Model):
@@ -260,6 +385,11 @@ class Bet(models.Model):
         on_delete=models.CASCADE,
         related_name="bets",
     )
+    # Coefficient of the Quota when the Bet was placed, from which its
+    # potential earnings are calculated once and paid on settlement
+    coeficient = models.DecimalField(
+        "Coeficiente de ganancia", max_digits=9, decimal_places=5
+    )
     potential_earnings = models.DecimalField(
         "Ganancias potenciales", max_digits=12, decimal_places=2
     )
@@ -273,6 +403,18 @@ class Bet(models.Model):
     class Meta:
         verbose_name = "Apuesta"
         verbose_name_plural = "Apuestas"
+        indexes = [
+            models.Index(fields=["quota", "won"], name="bet_quota_won_idx"),
+            models.Index(fields=["user", "active"], name="bet_user_active_idx"),
+            # Open Bets are the ones scanned by settlement
+            models.Index(
+                fields=["quota", "id"],
+                name="bet_open_quota_idx",
+                condition=models.Q(won__isnull=True),
+            ),
+            # Keyset pagination order of allBets
+            models.Index(fields=["creation_date", "id"], name="bet_keyset_idx"),
+        ]
 
     def __str__(self):
         return "{event} - {user} - {amount}".format(
@@ -281,18 +423,41 @@ class Bet(models.Model):
             amount=self.transaction.amount,
         )
 
-    def save(self, **kwargs):
+    def calculate_potential_earnings(self):
+        """
+        Calculates the earnings of the Bet if it is won, from the amount of
+        its Transaction and the current coeficient of its Quota, which is
+        kept on the Bet.
+        """
+
+        self.coeficient = self.quota.coeficient
+        self.potential_earnings = self.transaction.amount * self.coeficient
+
+    def save(self, limits=None, **kwargs):
         """
         Function which prevents from saving a Bet with a disabled Quota.
+        The potential earnings of new Bets are frozen, so later changes of
+        their Quota do not change their payout, they are added to the
+        exposures of their Quota, Event and User, within the given limits,
+        see bets.exposure.add_placed_bets, and their Transaction is charged
+        on the ledger.
         """
         if not self.quota.active:
             raise ValidationError(_("La cuota debe estar activa"))
-        self.potential_earnings = (
-            self.transaction.amount * self.quota.coeficient
-        )
+        # Imported here since exposures and the ledger use these models
+        from bets.exposure import add_placed_bets
+        from bets.ledger import bet_postings, post_entries
+
+        adding = self._state.adding
+        if adding:
+            self.calculate_potential_earnings()
         self.won = None
         self.active = True
-        super().save()
+        with transaction.atomic(savepoint=False):
+            super().save()
+            if adding:
+                add_placed_bets([self.id], limits)
+                post_entries(bet_postings([self]))
 
 
 class Prize(models.Model):
@@ -319,8 +484,240 @@ class Prize(models.Model):
     class Meta:
         verbose_name = "Premio"
         verbose_name_plural = "Premios"
+        indexes = [
+            models.Index(
+                fields=["creation_date"], name="prize_creation_date_idx"
+            ),
+        ]
 
     def __str__(self):
         return "{event} - {user} - {amount}".format(
             event=self.bet.quota.event, user=self.user, amount=self.reward
         )
+
+
+class SettlementJob(models.Model):
+    """
+    Class for SettlementJob model.
+    A SettlementJob tracks the asynchronous settlement of the Bets of an
+    Event, which is processed in checkpointed chunks by a worker.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pendiente"),
+        (RUNNING, "En proceso"),
+        (DONE, "Terminado"),
+        (FAILED, "Fallido"),
+    ]
+    UNFINISHED_STATUSES = [PENDING, RUNNING]
+
+    event = models.ForeignKey(
+        Event,
+        verbose_name="Evento",
+        on_delete=models.CASCADE,
+        related_name="settlement_jobs",
+    )
+    completed = models.BooleanField("Completado")
+    status = models.CharField(
+        "Estado", max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    last_bet_id = models.IntegerField("Última apuesta liquidada", default=0)
+    settled_bets = models.IntegerField("Apuestas liquidadas", default=0)
+    total_bets = models.IntegerField("Apuestas por liquidar", default=0)
+    error = models.TextField("Error", blank=True, default="")
+    creation_date = models.DateTimeField("Fecha de creación", auto_now_add=True)
+    modification_date = models.DateTimeField(
+        "Fecha de modificación", auto_now=True
+    )
+    finish_date = models.DateTimeField("Fecha de término", null=True)
+
+    class Meta:
+        verbose_name = "Liquidación"
+        verbose_name_plural = "Liquidaciones"
+
+    def __str__(self):
+        return "{event} - {status}".format(
+            event=self.event, status=self.get_status_display()
+        )
+
+    @property
+    def progress(self):
+        """
+        Fraction of the Bets which have already been settled.
+        """
+
+        if not self.total_bets:
+            return 1.0 if self.status == self.DONE else 0.0
+        return min(self.settled_bets / self.total_bets, 1.0)
+
+
+class Account(models.Model):
+    """
+    Class for Account model.
+    An Account keeps the current balance of a User, which is updated on the
+    same statement that appends each of its LedgerEntries.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        verbose_name="Titular",
+        on_delete=models.CASCADE,
+        related_name="account",
+    )
+    balance = models.DecimalField(
+        "Saldo", max_digits=14, decimal_places=2, default=0
+    )
+    modification_date = models.DateTimeField(
+        "Fecha de modificación", auto_now=True
+    )
+
+    class Meta:
+        verbose_name = "Cuenta"
+        verbose_name_plural = "Cuentas"
+
+    def __str__(self):
+        return "{user} - {balance}".format(user=self.user, balance=self.balance)
+
+
+class LedgerEntry(models.Model):
+    """
+    Class for LedgerEntry model.
+    A LedgerEntry is an append-only movement of money on an Account, such as
+    a Bet placement (negative) or a Prize payout (positive).
+    """
+
+    account = models.ForeignKey(
+        Account,
+        verbose_name="Cuenta",
+        on_delete=models.CASCADE,
+        related_name="entries",
+    )
+    amount = models.DecimalField("Monto", max_digits=12, decimal_places=2)
+    description = models.CharField("Descripción", max_length=255)
+    transaction = models.ForeignKey(
+        Transaction,
+        verbose_name="Transacción",
+        on_delete=models.SET_NULL,
+        related_name="ledger_entries",
+        null=True,
+    )
+    prize = models.ForeignKey(
+        Prize,
+        verbose_name="Premio",
+        on_delete=models.SET_NULL,
+        related_name="ledger_entries",
+        null=True,
+    )
+    creation_date = models.DateTimeField("Fecha de creación", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Movimiento"
+        verbose_name_plural = "Movimientos"
+
+    def __str__(self):
+        return "{account} - {amount}".format(
+            account=self.account, amount=self.amount
+        )
+
+    def save(self, **kwargs):
+        """
+        Function which prevents LedgerEntries from being modified.
+        """
+        if self.id:
+            raise ValidationError(_("Los movimientos no se pueden modificar"))
+        super().save()
+
+
+class Exposure(models.Model):
+    """
+    Abstract class for the exposure models.
+    An exposure keeps the running totals of the open Bets of an object,
+    which are updated on the same statements that place and settle them.
+    """
+
+    bets = models.IntegerField("Apuestas abiertas", default=0)
+    stake = models.DecimalField(
+        "Monto apostado", max_digits=14, decimal_places=2, default=0
+    )
+    liability = models.DecimalField(
+        "Pago potencial", max_digits=14, decimal_places=2, default=0
+    )
+    # Limits of this object, replacing the ones of EXPOSURE_LIMITS
+    max_stake = models.DecimalField(
+        "Monto apostado máximo",
+        max_digits=14,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    max_liability = models.DecimalField(
+        "Pago potencial máximo",
+        max_digits=14,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    modification_date = models.DateTimeField(
+        "Fecha de modificación", auto_now=True
+    )
+
+    class Meta:
+        abstract = True
+
+
+class QuotaExposure(Exposure):
+    """
+    Class for QuotaExposure model.
+    Totals of the open Bets placed on a Quota.
+    """
+
+    quota = models.OneToOneField(
+        Quota,
+        verbose_name="Cuota",
+        on_delete=models.CASCADE,
+        related_name="exposure",
+    )
+
+    class Meta:
+        verbose_name = "Exposición de cuota"
+        verbose_name_plural = "Exposiciones de cuotas"
+
+
+class EventExposure(Exposure):
+    """
+    Class for EventExposure model.
+    Totals of the open Bets placed on the Quotas of an Event.
+    """
+
+    event = models.OneToOneField(
+        Event,
+        verbose_name="Evento",
+        on_delete=models.CASCADE,
+        related_name="exposure",
+    )
+
+    class Meta:
+        verbose_name = "Exposición de evento"
+        verbose_name_plural = "Exposiciones de eventos"
+
+
+class UserExposure(Exposure):
+    """
+    Class for UserExposure model.
+    Totals of the open Bets placed by a User.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        verbose_name="Apostador",
+        on_delete=models.CASCADE,
+        related_name="exposure",
+    )
+
+    class Meta:
+        verbose_name = "Exposición de apostador"
+        verbose_name_plural = "Exposiciones de apostadores"
@@ -0,0 +1,189 @@
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+from bets.models import OddsFormula, Quota
+from bets.pubsub import QUOTA_CHANNEL, publish_instance
+from bets.response_cache import bump_generations, get_generations
+from django.conf import settings
+from django.utils import timezone
+from j8bet_backend.caches import BoundedCache
+
+DEFAULT_COEFICIENT = Decimal("1.00001")
+MAX_COEFICIENT = 9999.99999
+# Probabilities are kept away from 0 and 1, where the power method has no
+# solution
+EPSILON = 1e-9
+POWER_ITERATIONS = 60
+
+
+def margin_method(probabilities, margin):
+    """
+    Spreads the margin proportionally over the probabilities.
+    """
+
+    return probabilities * (1 + margin)
+
+
+def shin_method(probabilities, insiders):
+    """
+    Prices a two outcome market following Shin's model, where insiders is
+    the share of money wagered by insiders.
+    """
+
+    implied, implied_against = (
+        np.sqrt(insiders * outcome + (1 - insiders) * outcome**2)
+        for outcome in (probabilities, 1 - probabilities)
+    )
+    return implied * (implied + implied_against)
+
+
+def power_method(probabilities, margin):
+    """
+    Raises the probabilities of a two outcome market to the power k for
+    which both implied probabilities add up to 1 + margin. Every k is found
+    at once by a vectorized bisection.
+    """
+
+    probabilities = np.clip(probabilities, EPSILON, 1 - EPSILON)
+    target = 1 + margin
+    low = np.zeros_like(probabilities)
+    high = np.ones_like(probabilities)
+    for _ in range(POWER_ITERATIONS):
+        power = (low + high) / 2
+        over = probabilities**power + (1 - probabilities) ** power > target
+        low = np.where(over, power, low)
+        high = np.where(over, high, power)
+    return probabilities ** ((low + high) / 2)
+
+
+METHODS = {
+    OddsFormula.MARGIN: margin_method,
+    OddsFormula.SHIN: shin_method,
+    OddsFormula.POWER: power_method,
+}
+
+
+@lru_cache(maxsize=32)
+def compile_formula(method, parameter):
+    """
+    Compiles a formula into a callable which transforms a sequence of
+    probabilities into coeficients with a single vectorized pass.
+
+    :param method: Method of the OddsFormula
+    :param parameter: Parameter of the OddsFormula
+    :return: Callable returning a list of Decimal coeficients
+    """
+
+    function = METHODS[method]
+    parameter = float(parameter)
+
+    def pricer(probabilities):
+        probabilities = np.asarray(probabilities, dtype=float)
+        with np.errstate(divide="ignore"):
+            coeficients = 1 / function(probabilities, parameter)
+        coeficients = np.clip(coeficients, 1, MAX_COEFICIENT)
+        return [Decimal("{:.5f}".format(value)) for value in coeficients]
+
+    return pricer
+
+
+def default_pricer(probabilities):
+    """
+    Pricer used while there is no active OddsFormula.
+    """
+
+    return [DEFAULT_COEFICIENT] * len(probabilities)
+
+
+class PricerCache(BoundedCache):
+    """
+    Cache of the pricer of the active OddsFormula, keyed on the formula
+    generation, which is bumped whenever an OddsFormula is saved or deleted.
+    Processes sharing the Django cache reload the formula as soon as a
+    change is committed, and the others once the pricer expires.
+    """
+
+    def get_pricer(self):
+        (generation,) = get_generations([OddsFormula._meta.label])
+        pricer = self.get(generation)
+        if pricer is None:
+            formula = (
+                OddsFormula.objects.filter(active=True)
+                .values_list("method", "parameter")
+                .first()
+            )
+            pricer = compile_formula(*formula) if formula else default_pricer
+            self.set(generation, pricer)
+        return pricer
+
+
+# Pricers of older generations are never read again
+pricer_cache = PricerCache(1, settings.ODDS_CACHE_TIMEOUT)
+
+
+def get_pricer():
+    """
+    Returns the callable which transforms probabilities into coeficients
+    following the active OddsFormula.
+    """
+
+    return pricer_cache.get_pricer()
+
+
+def invalidate_pricer(sender, **kwargs):
+    """
+    Signal receiver which invalidates the cached pricer when formulas
+    change, right away in this process and once committed in the others.
+    """
+
+    pricer_cache.invalidate()
+    bump_generations(sender)
+
+
+def reprice_quotas(quotas, batch_size=1000):
+    """
+    Recalculates the coeficients of Quotas with one vectorized pass and
+    a bulk update per batch, without saving each Quota. Repriced Quotas are
+    published to their subscribers once the transaction is committed.
+
+    :param quotas: Queryset of Quotas to reprice
+    :param batch_size: Amount of Quotas updated per query
+    :return: Amount of repriced Quotas
+    """
+
+    repriced = list(quotas)
+    if not repriced:
+        return 0
+    now = timezone.now()
+    coeficients = get_pricer()([quota.probability for quota in repriced])
+    for quota, coeficient in zip(repriced, coeficients):
+        quota.coeficient = coeficient
+        quota.modification_date = now
+    Quota.objects.bulk_update(
+        repriced, ["coeficient", "modification_date"], batch_size=batch_size
+    )
+    bump_generations(Quota)
+    for quota in repriced:
+        publish_instance(QUOTA_CHANNEL, quota)
+    return len(repriced)
+
+
+def reprice_event(event, batch_size=1000):
+    """
+    Recalculates the coeficients of the active Quotas of an Event.
+    """
+
+    return reprice_quotas(
+        Quota.objects.filter(event=event, active=True), batch_size
+    )
+
+
+def reprice_open_events(batch_size=1000):
+    """
+    Recalculates the coeficients of the active Quotas of every active Event.
+    """
+
+    return reprice_quotas(
+        Quota.objects.filter(active=True, event__active=True), batch_size
+    )
@@ -0,0 +1,225 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from bets.exposure import LimitExceeded, add_placed_bets
+from bets.ledger import bet_postings, post_entries
+from bets.models import Bet, Event, Quota, Transaction
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+PlacementResult = namedtuple(
+    "PlacementResult", ["quota_id", "amount", "bet", "error"]
+)
+
+
+class PlacementError(Exception):
+    """
+    Raised when a Bet can not be placed.
+    """
+
+
+def lock_quota(**filters):
+    """
+    Returns the first active Quota of an active Event matching the filters,
+    locked until the end of the current transaction. The Event is fetched on
+    the same query, but only the Quota row is locked.
+
+    :param filters: Lookups which select the Quota
+    :return: Locked Quota, or None if there is no valid Quota
+    """
+
+    return (
+        Quota.objects.select_for_update(of=("self",))
+        .select_related("event")
+        .filter(active=True, event__active=True, **filters)
+        .order_by("creation_date")
+        .first()
+    )
+
+
+def amount_error(amount):
+    """
+    Returns why the amount of a Bet is not valid, or None if it is within
+    BET_MIN_AMOUNT and BET_MAX_AMOUNT.
+    """
+
+    try:
+        amount = Decimal(amount)
+    except (InvalidOperation, TypeError, ValueError):
+        return "Not a valid amount."
+    if not amount.is_finite():
+        return "Not a valid amount."
+    if amount < settings.BET_MIN_AMOUNT:
+        return "The amount must be at least {}.".format(settings.BET_MIN_AMOUNT)
+    if settings.BET_MAX_AMOUNT is not None and (
+        amount > settings.BET_MAX_AMOUNT
+    ):
+        return "The amount can not be greater than {}.".format(
+            settings.BET_MAX_AMOUNT
+        )
+    return None
+
+
+def check_amount(amount):
+    """
+    Raises a PlacementError if the amount of a Bet is not valid.
+    """
+
+    error = amount_error(amount)
+    if error is not None:
+        raise PlacementError(error)
+
+
+def create_bet(user, quota, amount):
+    """
+    Creates the Transaction and the Bet of a placement on a locked Quota.
+    Saving the Bet adds it to the exposures within EXPOSURE_LIMITS and
+    charges the Transaction on the ledger.
+
+    :param user: User placing the Bet
+    :param quota: Locked Quota on which the Bet is placed
+    :param amount: Amount of money being betted
+    :return: The new Bet
+    """
+
+    # TODO change the way Transactions are managed when the time comes
+    bet_transaction = Transaction.objects.create(
+        amount=amount, description="Bet placement", user=user
+    )
+    bet = Bet(transaction=bet_transaction, quota=quota, user=user)
+    try:
+        bet.save(limits=settings.EXPOSURE_LIMITS)
+    except LimitExceeded as error:
+        raise PlacementError(
+            "The bet exceeds the limits of the {}.".format(error.scope)
+        )
+    return bet
+
+
+def place_bet_by_quota(user, quota_id, amount):
+    """
+    Places a Bet on a Quota with a single locking query followed by the
+    inserts of the Transaction, the Bet and its ledger entry, all in one
+    atomic block.
+
+    :param user: User placing the Bet
+    :param quota_id: ID of the Quota
+    :param amount: Amount of money being betted
+    :return: The new Bet
+    """
+
+    check_amount(amount)
+    with transaction.atomic():
+        quota = lock_quota(id=quota_id)
+        if quota is None:
+            raise PlacementError("Not a valid quota.")
+        return create_bet(user, quota, amount)
+
+
+def place_bet_by_event(user, event_id, amount):
+    """
+    Places a Bet on the oldest active Quota of an Event, with a single
+    locking query followed by the inserts of the Transaction, the Bet and
+    its ledger entry, all in one atomic block.
+
+    :param user: User placing the Bet
+    :param event_id: ID of the Event
+    :param amount: Amount of money being betted
+    :return: The new Bet
+    """
+
+    check_amount(amount)
+    with transaction.atomic():
+        quota = lock_quota(event_id=event_id)
+        if quota is None:
+            # A rotation committed while waiting on the lock deactivates the
+            # locked Quota, and only a new statement sees its replacement
+            quota = lock_quota(event_id=event_id)
+        if quota is None:
+            # Only failed placements query again to explain the failure
+            if not Event.objects.filter(id=event_id, active=True).exists():
+                raise PlacementError("Not a valid event.")
+            raise PlacementError("Event does not have any valid Quotas.")
+        return create_bet(user, quota, amount)
+
+
+def _quota_pk(value):
+    """
+    Returns a Quota primary key from user input, or None if it is invalid.
+    """
+
+    try:
+        return Quota._meta.pk.to_python(value)
+    except ValidationError:
+        return None
+
+
+def place_bets(user, entries):
+    """
+    Places a bet slip. Every Quota is validated and locked with a single
+    query, and the Transactions and Bets of the valid entries are inserted
+    with one bulk insert each, then added to the exposures and charged on
+    the ledger with a single statement each, all in one atomic block.
+    Invalid entries are reported without preventing the valid ones from
+    being placed.
+
+    :param user: User placing the Bets
+    :param entries: List of tuples with a Quota ID and an amount
+    :return: List of PlacementResult, in the same order as the entries
+    :raise PlacementError: If the valid entries together exceed some limit
+        of EXPOSURE_LIMITS, in which case no Bet is placed
+    """
+
+    if len(entries) > settings.BET_SLIP_MAX_ENTRIES:
+        raise PlacementError(
+            "A bet slip can not have more than {} entries.".format(
+                settings.BET_SLIP_MAX_ENTRIES
+            )
+        )
+    quota_ids = {_quota_pk(quota_id) for quota_id, _ in entries} - {None}
+    results = list()
+    with transaction.atomic():
+        # Locks are taken in a fixed order to avoid deadlocks between slips
+        quotas = (
+            Quota.objects.select_for_update(of=("self",))
+            .select_related("event")
+            .filter(id__in=quota_ids, active=True, event__active=True)
+            .order_by("id")
+            .in_bulk()
+            if quota_ids
+            else dict()
+        )
+        for quota_id, amount in entries:
+            quota = quotas.get(_quota_pk(quota_id))
+            error = (
+                "Not a valid quota." if quota is None else amount_error(amount)
+            )
+            if error is not None:
+                results.append(PlacementResult(quota_id, amount, None, error))
+                continue
+            bet_transaction = Transaction(
+                amount=amount, description="Bet placement", user=user
+            )
+            bet = Bet(transaction=bet_transaction, quota=quota, user=user)
+            bet.calculate_potential_earnings()
+            results.append(PlacementResult(quota_id, amount, bet, None))
+        placed = [result.bet for result in results if result.bet]
+        if placed:
+            Transaction.objects.bulk_create(bet.transaction for bet in placed)
+            for bet in placed:
+                # Assigning the saved Transaction keeps it cached on the Bet
+                bet.transaction = bet.transaction
+            Bet.objects.bulk_create(placed)
+            try:
+                add_placed_bets(
+                    [bet.id for bet in placed], settings.EXPOSURE_LIMITS
+                )
+            except LimitExceeded as error:
+                raise PlacementError(
+                    "The bet slip exceeds the limits of the {}.".format(
+                        error.scope
+                    )
+                )
+            post_entries(bet_postings(placed))
+    return results
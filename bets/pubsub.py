@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import socket
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+QUOTA_CHANNEL = "quota"
+EVENT_CHANNEL = "event"
+
+
+class InProcessPubSub:
+    """
+    Publish/subscribe hub which delivers messages to the subscribers of the
+    current process, on the thread of the publisher.
+    """
+
+    def __init__(self, **options):
+        self._subscribers = defaultdict(dict)
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def subscribe(self, channel, callback):
+        """
+        Subscribes a callback to the messages of a channel.
+
+        :param channel: Name of the channel
+        :param callback: Callable receiving each message
+        :return: Callable which cancels the subscription
+        """
+
+        with self._lock:
+            self._next_id += 1
+            subscription_id = self._next_id
+            self._subscribers[channel][subscription_id] = callback
+
+        def unsubscribe():
+            with self._lock:
+                self._subscribers[channel].pop(subscription_id, None)
+
+        return unsubscribe
+
+    def publish(self, channel, message):
+        """
+        Publishes a JSON serializable message on a channel.
+        """
+
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        """
+        Calls every subscriber of a channel. A failing subscriber does not
+        prevent the others from receiving the message.
+        """
+
+        with self._lock:
+            callbacks = list(self._subscribers[channel].values())
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Subscriber of %s failed", channel)
+
+
+class BrokerPubSub(InProcessPubSub):
+    """
+    Publish/subscribe hub which relays messages through a broker, so every
+    process connected to it receives them. The broker protocol is a stream of
+    JSON lines with a channel and a message, each one being forwarded to
+    every connected process, as done by Broker.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6380, **options):
+        super().__init__(**options)
+        self._socket = socket.create_connection((host, port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def publish(self, channel, message):
+        line = json.dumps(
+            {"channel": channel, "message": message}, cls=DjangoJSONEncoder
+        )
+        with self._send_lock:
+            self._socket.sendall(line.encode() + b"\n")
+
+    def _read(self):
+        try:
+            with self._socket.makefile("rb") as stream:
+                for line in stream:
+                    try:
+                        envelope = json.loads(line)
+                        channel = envelope["channel"]
+                        message = envelope["message"]
+                    except (TypeError, KeyError, ValueError):
+                        logger.exception("Invalid broker message %r", line)
+                        continue
+                    self.deliver(channel, message)
+        except OSError:
+            if not self._closed:
+                logger.exception("Connection to the broker failed")
+            return
+        if not self._closed:
+            logger.error("Connection to the broker closed by the broker")
+
+    def close(self):
+        self._closed = True
+        self._socket.close()
+
+
+class Broker:
+    """
+    Local stand-in for a message broker, which forwards every line received
+    from a client to every connected client. It runs its own event loop on a
+    background thread.
+
+    :cvar port: Port on which the broker listens, once started
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self._writers = set()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for client in list(self._writers):
+                    client.write(line)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def start(self):
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, self.host, self.port),
+            self._loop,
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def stop(self):
+        async def close():
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_pubsub = None
+_pubsub_lock = threading.Lock()
+
+
+def get_pubsub():
+    """
+    Returns the publish/subscribe hub configured on the PUBSUB setting.
+    """
+
+    global _pubsub
+    with _pubsub_lock:
+        if _pubsub is None:
+            _pubsub = import_string(settings.PUBSUB["BACKEND"])(
+                **settings.PUBSUB.get("OPTIONS", {})
+            )
+        return _pubsub
+
+
+def set_pubsub(pubsub):
+    """
+    Replaces the publish/subscribe hub of the process.
+
+    :param pubsub: New hub, or None to load the configured one again
+    :return: The previous hub
+    """
+
+    global _pubsub
+    with _pubsub_lock:
+        previous, _pubsub = _pubsub, pubsub
+    return previous
+
+
+def serialize_instance(instance):
+    """
+    Returns a JSON serializable dictionary with the concrete field values
+    of a model instance.
+    """
+
+    return json.loads(
+        json.dumps(
+            {
+                field.attname: field.value_from_object(instance)
+                for field in instance._meta.concrete_fields
+            },
+            cls=DjangoJSONEncoder,
+        )
+    )
+
+
+def deserialize_instance(model, data):
+    """
+    Builds a model instance from a dictionary made by serialize_instance,
+    without querying the database.
+    """
+
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    instance = model(
+        **{
+            attname: fields[attname].to_python(value)
+            for attname, value in data.items()
+            if attname in fields
+        }
+    )
+    instance._state.adding = False
+    return instance
+
+
+def publish_instance(channel, instance):
+    """
+    Publishes a model instance once the current transaction is committed.
+    Publishing errors are logged, since the transaction is already committed
+    by then.
+    """
+
+    message = serialize_instance(instance)
+
+    def publish():
+        try:
+            get_pubsub().publish(channel, message)
+        except Exception:
+            logger.exception("Publishing on %s failed", channel)
+
+    transaction.on_commit(publish)
+
+
+def publish_quota(sender, instance, **kwargs):
+    """
+    Signal receiver which publishes saved Quotas.
+    """
+
+    publish_instance(QUOTA_CHANNEL, instance)
+
+
+def publish_event(sender, instance, **kwargs):
+    """
+    Signal receiver which publishes saved Events.
+    """
+
+    publish_instance(EVENT_CHANNEL, instance)
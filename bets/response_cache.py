@@ -0,0 +1,287 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql.language.printer import print_ast
+from graphql.type import (
+    GraphQLInterfaceType,
+    GraphQLObjectType,
+    GraphQLUnionType,
+    get_named_type,
+)
+
+# Root fields whose responses are cached, along with the models they list
+CATALOG_FIELDS = ("allTags", "allAffairs", "allEvents", "allQuotas")
+CATALOG_MODELS = ("bets.Tag", "bets.Affair", "bets.Event", "bets.Quota")
+
+GENERATION_KEY = "response-cache:generation:{}"
+RESPONSE_KEY = "response-cache:response:{}"
+
+
+def _generation_key(model):
+    return GENERATION_KEY.format(model._meta.label)
+
+
+def get_generations(labels):
+    """
+    Returns the current generation of each model. A missing generation,
+    never set or evicted from the cache, starts from the current time, so
+    responses cached under an older generation are never served again.
+
+    :param labels: Labels of the models
+    :return: List of generations, in the same order
+    """
+
+    keys = [GENERATION_KEY.format(label) for label in labels]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(*models):
+    """
+    Invalidates the cached responses which list any of the models, once the
+    current transaction is committed. Bumping before the commit would let
+    a concurrent request cache data which is about to change.
+    """
+
+    def bump():
+        for model in models:
+            try:
+                cache.incr(_generation_key(model))
+            except ValueError:
+                cache.add(_generation_key(model), time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def invalidate_responses(sender, **kwargs):
+    """
+    Signal receiver which invalidates the cached responses listing the
+    model of the saved or deleted instance.
+    """
+
+    bump_generations(sender)
+
+
+def invalidate_tag_responses(sender, **kwargs):
+    """
+    Signal receiver which invalidates the cached responses listing Affairs
+    or Tags when the Tags of an Affair change.
+    """
+
+    if kwargs["action"].startswith("post_"):
+        bump_generations(kwargs["model"], kwargs["instance"].__class__)
+
+
+def _collect_models(schema, fragments, parent_type, selection_set, models):
+    """
+    Adds the labels of the models returned on a selection set to a set.
+
+    :return: False if a selected type is not part of the catalog
+    """
+
+    pending = [(parent_type, selection_set)]
+    while pending:
+        parent_type, selection_set = pending.pop()
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = fragments[selection.name.value]
+                pending.append(
+                    (
+                        schema.get_type(fragment.type_condition.name.value),
+                        fragment.selection_set,
+                    )
+                )
+                continue
+            if isinstance(selection, ast.InlineFragment):
+                pending.append(
+                    (
+                        schema.get_type(selection.type_condition.name.value)
+                        if selection.type_condition
+                        else parent_type,
+                        selection.selection_set,
+                    )
+                )
+                continue
+            name = selection.name.value
+            if name.startswith("__"):
+                if name != "__typename":
+                    return False
+                continue
+            field_type = get_named_type(parent_type.fields[name].type)
+            # Abstract types could resolve to any model
+            if isinstance(field_type, (GraphQLInterfaceType, GraphQLUnionType)):
+                return False
+            if not isinstance(field_type, GraphQLObjectType):
+                continue
+            meta = getattr(field_type.graphene_type, "_meta", None)
+            model = getattr(meta, "model", None)
+            if model is not None:
+                if model._meta.label not in CATALOG_MODELS:
+                    return False
+                models.add(model._meta.label)
+            pending.append((field_type, selection.selection_set))
+    return True
+
+
+def catalog_operations(schema, document_ast):
+    """
+    Finds the operations of a valid document whose responses can be cached:
+    queries selecting only catalog fields, and only catalog models below
+    them.
+
+    :return: Dictionary with the labels of the listed models of each
+        cacheable operation, by operation name
+    """
+
+    operations = dict()
+    query_type = schema.get_query_type()
+    fragments = {
+        definition.name.value: definition
+        for definition in document_ast.definitions
+        if isinstance(definition, ast.FragmentDefinition)
+    }
+    for definition in document_ast.definitions:
+        if (
+            not isinstance(definition, ast.OperationDefinition)
+            or definition.operation != "query"
+        ):
+            continue
+        fields = [
+            selection
+            for selection in definition.selection_set.selections
+            if isinstance(selection, ast.Field)
+        ]
+        if len(fields) != len(definition.selection_set.selections) or any(
+            field.name.value not in CATALOG_FIELDS for field in fields
+        ):
+            continue
+        models = set()
+        if _collect_models(
+            schema, fragments, query_type, definition.selection_set, models
+        ):
+            name = definition.name.value if definition.name else None
+            operations[name] = tuple(sorted(models))
+    return operations
+
+
+class ResponseCache:
+    """
+    Cache of the responses of catalog queries, stored on the Django cache.
+    Responses are keyed by the normalized document, the operation name, the
+    variables and the generations of the models they list, so bumping a
+    generation invalidates every response listing its model. Hits and
+    misses of this process are counted for monitoring.
+
+    :cvar timeout: Seconds during which a response is kept
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def wrap(self, schema, document_ast, execute):
+        """
+        Returns an execute function for a validated document which serves
+        its catalog operations from the cache, or the given one if the
+        document has no cacheable operation.
+        """
+
+        operations = catalog_operations(schema, document_ast)
+        if not operations:
+            return execute
+        document_hash = hashlib.sha256(
+            print_ast(document_ast).encode("utf-8")
+        ).hexdigest()
+        names = [
+            definition.name.value if definition.name else None
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.OperationDefinition)
+        ]
+
+        def execute_cached(
+            root_value=None,
+            context_value=None,
+            operation_name=None,
+            variable_values=None,
+            **options
+        ):
+            # Without a name, only a document with a single operation runs
+            if operation_name is None and len(names) == 1:
+                labels = operations.get(names[0])
+            else:
+                labels = operations.get(operation_name)
+            if labels is None or not self.enabled:
+                return execute(
+                    root_value,
+                    context_value,
+                    operation_name=operation_name,
+                    variable_values=variable_values,
+                    **options
+                )
+            key = RESPONSE_KEY.format(
+                hashlib.sha256(
+                    json.dumps(
+                        [
+                            document_hash,
+                            operation_name,
+                            variable_values,
+                            get_generations(labels),
+                        ],
+                        sort_keys=True,
+                        default=str,
+                    ).encode("utf-8")
+                ).hexdigest()
+            )
+            data = cache.get(key)
+            if data is not None:
+                self.count(hit=True)
+                return ExecutionResult(data=data)
+            self.count(hit=False)
+            result = execute(
+                root_value,
+                context_value,
+                operation_name=operation_name,
+                variable_values=variable_values,
+                **options
+            )
+            if not result.errors and not result.invalid:
+                cache.set(key, result.data, self.timeout)
+            return result
+
+        return execute_cached
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+        """
+
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_TIMEOUT)
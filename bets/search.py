@@ -0,0 +1,141 @@
+from collections import namedtuple
+
+from bets.models import Affair, Event
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Q
+
+# Text search configuration of the search vectors, matching LANGUAGE_CODE
+SEARCH_CONFIG = "spanish"
+
+# Fields searched on each model, with the weight of their matches, which
+# are the default weights of ts_rank for the A and B labels of the vectors
+SEARCH_FIELDS = {
+    Affair: (("description", 0.4),),
+    Event: (("name", 1.0), ("description", 0.4)),
+}
+
+# SQLSTATE of statements cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+SearchHit = namedtuple("SearchHit", ["rank", "node"])
+
+
+class SearchTimeout(Exception):
+    """
+    Raised when a search does not finish within SEARCH_TIMEOUT.
+    """
+
+
+def merge_hits(hits, limit):
+    """
+    Returns the best ranked hits, newest first among equally ranked ones.
+    """
+
+    hits.sort(key=lambda hit: (-hit.rank, -hit.node.creation_date.timestamp()))
+    return hits[:limit]
+
+
+def search_postgresql(query, limit, timeout):
+    """
+    Searches Affairs and Events on PostgreSQL. Words are matched against the
+    search vectors, with the web search syntax, and the whole query as a
+    part of the searched fields, through their trigram indexes. Only the
+    former contribute to the rank. The timeout is set on a savepoint of its
+    own, and the previous one is restored afterwards, so statements of an
+    enclosing transaction are not affected.
+
+    :param query: Text being searched
+    :param limit: Maximum amount of hits
+    :param timeout: Milliseconds given to the search
+    :raise SearchTimeout: If the search did not finish on time
+    """
+
+    search_query = SearchQuery(
+        query, config=SEARCH_CONFIG, search_type="websearch"
+    )
+    hits = list()
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW statement_timeout")
+                (previous_timeout,) = cursor.fetchone()
+                cursor.execute("SET LOCAL statement_timeout = %s", [timeout])
+            for model, fields in SEARCH_FIELDS.items():
+                matches = Q(search_vector=search_query)
+                for field, _ in fields:
+                    matches |= Q(**{"{}__icontains".format(field): query})
+                rank = SearchRank(F("search_vector"), search_query)
+                queryset = (
+                    model.objects.filter(matches)
+                    .annotate(rank=rank)
+                    .defer("search_vector")
+                    .order_by("-rank", "-creation_date")
+                )
+                hits.extend(
+                    SearchHit(node.rank, node) for node in queryset[:limit]
+                )
+            # Rolling back the savepoint restores it on errors instead
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = %s", [previous_timeout]
+                )
+    except OperationalError as error:
+        if getattr(error.__cause__, "pgcode", None) != QUERY_CANCELED:
+            raise
+        raise SearchTimeout(
+            "The search took too long, try a more specific query."
+        )
+    return merge_hits(hits, limit)
+
+
+def search_fallback(query, limit):
+    """
+    Searches Affairs and Events on databases without text search, meant for
+    local development. Every word must be part of a searched field, and
+    hits are ranked by the weights of the fields containing each word.
+
+    :param query: Text being searched
+    :param limit: Maximum amount of hits
+    """
+
+    words = query.split()
+    hits = list()
+    for model, fields in SEARCH_FIELDS.items():
+        queryset = model.objects.defer("search_vector")
+        for word in words:
+            matches = Q()
+            for field, _ in fields:
+                matches |= Q(**{"{}__icontains".format(field): word})
+            queryset = queryset.filter(matches)
+        for node in queryset:
+            rank = sum(
+                weight
+                for word in words
+                for field, weight in fields
+                if word.casefold() in getattr(node, field).casefold()
+            )
+            hits.append(SearchHit(rank, node))
+    return merge_hits(hits, limit)
+
+
+def search(query, limit=None):
+    """
+    Searches Affairs and Events by their names and descriptions.
+
+    :param query: Text being searched
+    :param limit: Maximum amount of hits, SEARCH_MAX_RESULTS at most
+    :return: List of SearchHit, best ranked first
+    :raise SearchTimeout: If the search did not finish on time
+    """
+
+    limit = min(
+        limit or settings.SEARCH_MAX_RESULTS, settings.SEARCH_MAX_RESULTS
+    )
+    query = " ".join(query.split())
+    if not query or limit < 1:
+        return list()
+    if connection.vendor == "postgresql":
+        return search_postgresql(query, limit, settings.SEARCH_TIMEOUT)
+    return search_fallback(query, limit)
@@ -0,0 +1,236 @@
+import logging
+import time
+from collections import namedtuple
+
+from bets.exposure import exposure_ctes
+from bets.ledger import PRIZE_PAYOUT, table_name
+from bets.models import (
+    Account,
+    Bet,
+    LedgerEntry,
+    Prize,
+    Quota,
+    SettlementJob,
+    Transaction,
+)
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SettlementResult = namedtuple("SettlementResult", ["settled", "duration"])
+
+# Single statement which closes a batch of open Bets of an Event (every open
+# Bet when no limit is given) and creates their Prizes when the Event was
+# completed, paying them into the ledger and releasing them from the
+# exposures. Every write shares the same snapshot and the batch rows are
+# locked, so a Bet can never be marked as won without its Prize and its
+# payout, nor be paid or released twice by concurrent settlements. Rewards
+# are the potential earnings frozen on each Bet when it was placed.
+SETTLEMENT_SQL = """
+    WITH batch AS (
+        SELECT bet.id
+        FROM {bet} AS bet
+        INNER JOIN {quota} AS quota ON quota.id = bet.quota_id
+        WHERE quota.event_id = %(event_id)s
+            AND bet.won IS NULL
+            AND bet.id > %(after_id)s
+        ORDER BY bet.id
+        LIMIT %(limit)s
+        FOR UPDATE OF bet
+    ),
+    settled AS (
+        UPDATE {bet} AS bet
+        SET won = %(won)s, active = FALSE
+        FROM batch, {quota} AS quota
+        WHERE bet.id = batch.id
+            AND quota.id = bet.quota_id
+            AND bet.won IS NULL
+        RETURNING bet.id, bet.user_id, bet.transaction_id, bet.quota_id,
+            bet.potential_earnings, quota.event_id
+    ),
+    released AS (
+        SELECT settled.quota_id, settled.event_id, settled.user_id,
+            -1 AS bets, -trx.amount AS stake,
+            -settled.potential_earnings AS liability
+        FROM settled
+        INNER JOIN {transaction} AS trx ON trx.id = settled.transaction_id
+    ),{exposures},
+    prizes AS (
+        INSERT INTO {prize} (bet_id, user_id, reward, creation_date)
+        SELECT settled.id, settled.user_id, settled.potential_earnings,
+            %(creation_date)s
+        FROM settled
+        WHERE %(won)s
+        RETURNING id, user_id, reward
+    ),
+    accounts AS (
+        INSERT INTO {account} AS account (user_id, balance, modification_date)
+        SELECT user_id, SUM(reward), %(creation_date)s
+        FROM prizes
+        GROUP BY user_id
+        ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET balance = account.balance + EXCLUDED.balance,
+            modification_date = EXCLUDED.modification_date
+        RETURNING id, user_id
+    ),
+    entries AS (
+        INSERT INTO {entry}
+            (account_id, amount, description, prize_id, creation_date)
+        SELECT accounts.id, prizes.reward, %(description)s, prizes.id,
+            %(creation_date)s
+        FROM prizes
+        INNER JOIN accounts ON accounts.user_id = prizes.user_id
+    )
+    SELECT COUNT(*), MAX(settled.id) FROM settled
+"""
+
+
+def settle_bets(event_id, completed, after_id=0, limit=None):
+    """
+    Settles the open Bets of an Event with a single statement.
+    When completed is True, Bets are won and their Prizes are created and
+    paid into the ledger.
+    When completed is False, Bets are lost.
+    Either way, settled Bets are released from the exposures.
+
+    :param event_id: ID of the Event being settled
+    :param completed: Outcome of the Event
+    :param after_id: Only Bets with a greater ID are settled
+    :param limit: Maximum amount of Bets to settle, all of them if None
+    :return: Tuple with the amount of settled Bets and the greatest
+        settled Bet ID
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SETTLEMENT_SQL.format(
+                bet=table_name(Bet),
+                quota=table_name(Quota),
+                prize=table_name(Prize),
+                transaction=table_name(Transaction),
+                account=table_name(Account),
+                entry=table_name(LedgerEntry),
+                exposures=exposure_ctes("released"),
+            ),
+            {
+                "event_id": event_id,
+                "won": bool(completed),
+                "after_id": after_id,
+                "limit": limit,
+                "creation_date": timezone.now(),
+                "description": PRIZE_PAYOUT,
+                "now": timezone.now(),
+            },
+        )
+        settled, last_bet_id = cursor.fetchone()
+    return settled, last_bet_id
+
+
+def settle_event(event, completed):
+    """
+    Settles every open Bet of an Event using set-based statements in a
+    single chunk. Events are settled by SettlementJobs, see
+    run_settlement_job, so this is meant for scripts and benchmarks.
+
+    :param event: Event being settled
+    :param completed: Outcome of the Event
+    :return: SettlementResult with the amount of settled Bets and
+        the time taken in seconds
+    """
+
+    start = time.perf_counter()
+    settled, _ = settle_bets(event.id, completed)
+    result = SettlementResult(
+        settled=settled, duration=time.perf_counter() - start
+    )
+    logger.info(
+        "Settled %d bets of event %s in %.3f seconds",
+        result.settled,
+        event.id,
+        result.duration,
+    )
+    return result
+
+
+def next_settlement_job():
+    """
+    Returns the ID of the oldest unfinished SettlementJob which is not being
+    processed by another worker, or None.
+    """
+
+    with transaction.atomic():
+        return (
+            SettlementJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=SettlementJob.UNFINISHED_STATUSES)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+
+
+def process_settlement_chunk(job_id, chunk_size):
+    """
+    Settles the next chunk of Bets of a SettlementJob.
+    The chunk and the job checkpoint are committed on the same transaction,
+    so a crashed worker resumes right after the last committed chunk.
+
+    :param job_id: ID of the SettlementJob
+    :param chunk_size: Maximum amount of Bets to settle
+    :return: The updated SettlementJob, or None if it is finished or
+        locked by another worker
+    """
+
+    with transaction.atomic():
+        job = (
+            SettlementJob.objects.select_for_update(skip_locked=True)
+            .filter(id=job_id, status__in=SettlementJob.UNFINISHED_STATUSES)
+            .first()
+        )
+        if job is None:
+            return None
+        settled, last_bet_id = settle_bets(
+            job.event_id, job.completed, job.last_bet_id, chunk_size
+        )
+        job.settled_bets += settled
+        job.last_bet_id = last_bet_id or job.last_bet_id
+        if settled < chunk_size:
+            job.status = SettlementJob.DONE
+            job.finish_date = timezone.now()
+        else:
+            job.status = SettlementJob.RUNNING
+        job.save()
+    return job
+
+
+def run_settlement_job(job_id, chunk_size):
+    """
+    Processes a SettlementJob chunk by chunk until it is finished.
+    Failures are recorded on the job instead of being raised.
+
+    :param job_id: ID of the SettlementJob
+    :param chunk_size: Maximum amount of Bets to settle per chunk
+    :return: The last state of the SettlementJob
+    """
+
+    start = time.perf_counter()
+    try:
+        while True:
+            job = process_settlement_chunk(job_id, chunk_size)
+            if job is None or job.status == SettlementJob.DONE:
+                break
+    except Exception as error:
+        logger.exception("Settlement job %s failed", job_id)
+        SettlementJob.objects.filter(id=job_id).update(
+            status=SettlementJob.FAILED, error=str(error)
+        )
+    job = SettlementJob.objects.get(id=job_id)
+    logger.info(
+        "Settlement job %s is %s after settling %d bets in %.3f seconds",
+        job.id,
+        job.status,
+        job.settled_bets,
+        time.perf_counter() - start,
+    )
+    return job
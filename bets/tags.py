@@ -0,0 +1,117 @@
+from bets.models import Tag
+from bets.response_cache import bump_generations
+from django.conf import settings
+from django.db import transaction
+from j8bet_backend.caches import BoundedCache
+
+
+class TagError(Exception):
+    """
+    Raised when the Tags given to an Affair can not be resolved.
+    """
+
+
+# IDs of the most used Tags by normalized name, see invalidate_tags
+tag_cache = BoundedCache(settings.TAG_CACHE_SIZE, settings.TAG_CACHE_TIMEOUT)
+
+
+def split_tag_entries(entries):
+    """
+    Splits the Tag entries of an Affair input into IDs and names. Entries
+    which are numbers are IDs of existing Tags, any other is a Tag name.
+
+    :param entries: IDs or names of Tags
+    :return: Tuple with the list of IDs and the dictionary of names by
+        normalized name
+    """
+
+    tag_ids = list()
+    names = dict()
+    for entry in entries:
+        try:
+            tag_ids.append(int(entry))
+        except ValueError:
+            normalized_name = Tag.normalize(entry)
+            if not normalized_name:
+                raise TagError("Tag names can not be blank.")
+            names.setdefault(normalized_name, entry.strip())
+    return tag_ids, names
+
+
+def get_or_create_tags(names):
+    """
+    Returns the IDs of the Tags with some names, creating the missing ones
+    on a single query. Tags created concurrently under the same normalized
+    name are picked up instead of duplicated.
+
+    :param names: Dictionary with the name of each new Tag, by normalized
+        name
+    :return: Dictionary with the ID of each normalized name
+    """
+
+    tag_ids = tag_cache.get_many(names)
+    missing = [name for name in names if name not in tag_ids]
+    if not missing:
+        return tag_ids
+    found = dict(
+        Tag.objects.filter(normalized_name__in=missing).values_list(
+            "normalized_name", "id"
+        )
+    )
+    created = [name for name in missing if name not in found]
+    if created:
+        Tag.objects.bulk_create(
+            [Tag(name=names[name], normalized_name=name) for name in created],
+            ignore_conflicts=True,
+        )
+        found.update(
+            Tag.objects.filter(normalized_name__in=created).values_list(
+                "normalized_name", "id"
+            )
+        )
+        # Bulk creation sends no signals
+        bump_generations(Tag)
+    # Tags created by a transaction which is rolled back must not be cached
+    transaction.on_commit(lambda: tag_cache.set_many(found))
+    tag_ids.update(found)
+    return tag_ids
+
+
+def resolve_tags(entries):
+    """
+    Returns the IDs of the Tags of an Affair input. Given IDs are checked on
+    a single query, and names are looked up on the cache first, then on the
+    database, and created if they do not exist.
+
+    :param entries: IDs or names of Tags
+    :return: List of Tag IDs, in the order of the entries and without
+        duplicates
+    :raise TagError: If an ID does not exist or a name is blank
+    """
+
+    tag_ids, names = split_tag_entries(entries)
+    if tag_ids:
+        existing = set(
+            Tag.objects.filter(id__in=tag_ids).values_list("id", flat=True)
+        )
+        for tag_id in tag_ids:
+            if tag_id not in existing:
+                raise TagError(f"The tag with ID {tag_id} does not exist.")
+    name_ids = get_or_create_tags(names) if names else dict()
+    resolved = dict()
+    for entry in entries:
+        try:
+            resolved[int(entry)] = None
+        except ValueError:
+            resolved[name_ids[Tag.normalize(entry)]] = None
+    return list(resolved)
+
+
+def invalidate_tags(sender, **kwargs):
+    """
+    Signal receiver which invalidates the cached Tag IDs when a Tag is
+    renamed or deleted. Creations leave the cached names valid.
+    """
+
+    if not kwargs.get("created"):
+        tag_cache.invalidate()
@@ -1,33 +1,161 @@
+import asyncio
+import json
+import socket
+import struct
+import tempfile
+import threading
 from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from unittest.mock import ANY, Mock, call, patch
 
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from bets.exposure import add_placed_bets, get_exposure
 from bets.factories import (
     AffairFactory,
     BetFactory,
     EventFactory,
+    PrizeFactory,
     QuotaFactory,
     TagFactory,
 )
+from bets.graphql.fields import (
+    KEYSET_PREFIX,
+    KeysetConnectionField,
+    OptimizedConnectionField,
+    keyset_position,
+)
+from bets.graphql.loaders import Loaders, related_resolver
 from bets.graphql.types import (
     AffairType,
     BetType,
     EventType,
     PrizeType,
     QuotaType,
+    SettlementJobType,
     TagType,
     TransactionType,
 )
-from bets.models import Affair, Bet, Event, Prize, Quota
+from bets.ledger import get_balance, post_entries
+from bets.models import (
+    Account,
+    Affair,
+    Bet,
+    Event,
+    LedgerEntry,
+    OddsFormula,
+    Prize,
+    Quota,
+    QuotaExposure,
+    SettlementJob,
+    Tag,
+    UserExposure,
+)
+from bets.odds import (
+    DEFAULT_COEFICIENT,
+    compile_formula,
+    default_pricer,
+    get_pricer,
+    pricer_cache,
+    reprice_event,
+    reprice_open_events,
+    reprice_quotas,
+)
+from bets.placement import (
+    PlacementError,
+    place_bet_by_event,
+    place_bet_by_quota,
+    place_bets,
+)
+from bets.pubsub import (
+    Broker,
+    BrokerPubSub,
+    InProcessPubSub,
+    deserialize_instance,
+    get_pubsub,
+    serialize_instance,
+    set_pubsub,
+)
+from bets.response_cache import (
+    bump_generations,
+    catalog_operations,
+    response_cache,
+)
+from bets.search import SearchTimeout, search, search_fallback
+from bets.settlement import (
+    next_settlement_job,
+    process_settlement_chunk,
+    run_settlement_job,
+    settle_event,
+)
+from bets.tags import TagError, resolve_tags, tag_cache
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import RequestFactory, TestCase
+from django.core.management import CommandError, call_command
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    OperationalError,
+    connection,
+    transaction,
+)
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import F
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from graphene import Field, Interface, ObjectType, Schema, String
 from graphene.relay import Node
+from graphql.error import GraphQLError
 from graphql.error.located_error import GraphQLLocatedError
+from graphql.execution import ExecutionResult, MiddlewareManager
+from graphql.language import ast
+from graphql.language.parser import parse
+from graphql.language.printer import print_ast
+from graphql_jwt.middleware import JSONWebTokenMiddleware
+from graphql_jwt.shortcuts import get_token
 from graphql_jwt.testcases import JSONWebTokenTestCase
+from graphql_relay.connection.arrayconnection import offset_to_cursor
+from graphql_relay.utils import base64
 from j8bet_backend.constants import BET_CONSUMER, BET_MANAGER
+from j8bet_backend.graphql.api import schema
+from j8bet_backend.graphql.cost import argument_value, cost_analyzer
+from j8bet_backend.graphql.documents import (
+    document_backend,
+    query_hash,
+    validate,
+)
+from j8bet_backend.graphql.profiling import (
+    ProfilingMiddleware,
+    ResolverMetrics,
+    resolver_metrics,
+)
+from j8bet_backend.graphql.repeated_queries import (
+    RepeatedQueriesError,
+    RepeatedQueryBackend,
+    repeated_query_detector,
+    statement_shape,
+)
+from j8bet_backend.graphql.views import PersistedQueryGraphQLView
+from j8bet_backend.graphql.websocket import (
+    GraphQLWebSocketApp,
+    GraphQLWebSocketConnection,
+)
 from users.factories import UserFactory
 
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+
 
 class BetModelsTest(TestCase):
     """
@@ -123,6 +251,11 @@ class BetModelsTest(TestCase):
         second_bet = BetFactory(quota=second_quota)
         self.event.completed = True
         self.event.save()
+        first_bet.refresh_from_db()
+        # Bets are left to the settlement worker
+        self.assertIsNone(first_bet.won)
+        self.assertEqual(self.event.settlement_jobs.count(), 1)
+        call_command("run_settlement_jobs", once=True, stdout=StringIO())
         first_quota.refresh_from_db()
         second_quota.refresh_from_db()
         first_bet.refresh_from_db()
@@ -165,6 +298,11 @@ class BetModelsTest(TestCase):
         second_bet = BetFactory(quota=second_quota)
         self.event.completed = False
         self.event.save()
+        first_bet.refresh_from_db()
+        # Bets are left to the settlement worker
+        self.assertIsNone(first_bet.won)
+        self.assertEqual(self.event.settlement_jobs.count(), 1)
+        call_command("run_settlement_jobs", once=True, stdout=StringIO())
         first_quota.refresh_from_db()
         second_quota.refresh_from_db()
         first_bet.refresh_from_db()
@@ -184,6 +322,294 @@ class BetModelsTest(TestCase):
         # No prizes should be created
         self.assertEqual(Prize.objects.count(), 0)
 
+    def test_06_settlement_engine(self):
+        """
+        This test evaluates the set-based settlement engine, which must
+        settle any amount of Bets with a single statement.
+        """
+
+        first_quota = Quota.objects.get(id=self.second_quota.id)
+        bets = [BetFactory(quota=first_quota) for _ in range(3)]
+        second_quota = QuotaFactory(event=self.event, active=True)
+        bets += [BetFactory(quota=second_quota) for _ in range(2)]
+        other_bet = BetFactory(quota=QuotaFactory(active=True))
+        # Payouts are frozen when Bets are placed
+        Quota.objects.filter(id=second_quota.id).update(
+            probability=Decimal("0.5"), coeficient=Decimal(100)
+        )
+        bets[-1].refresh_from_db()
+        bets[-1].save()
+        with self.assertNumQueries(1):
+            result = settle_event(self.event, True)
+        self.assertEqual(result.settled, 5)
+        self.assertGreaterEqual(result.duration, 0)
+        for bet in bets:
+            bet.refresh_from_db()
+            self.assertTrue(bet.won)
+            self.assertFalse(bet.active)
+            self.assertEqual(
+                Prize.objects.get(bet=bet).reward,
+                (bet.coeficient * bet.transaction.amount).quantize(
+                    Decimal("0.01"), rounding=ROUND_HALF_UP
+                ),
+            )
+            self.assertEqual(
+                Prize.objects.get(bet=bet).reward, bet.potential_earnings
+            )
+            self.assertNotEqual(bet.coeficient, Decimal(100))
+        other_bet.refresh_from_db()
+        self.assertIsNone(other_bet.won)
+
+        # Settling again must not pay any Prize twice
+        self.assertEqual(settle_event(self.event, True).settled, 0)
+        self.assertEqual(settle_event(self.event, False).settled, 0)
+        self.assertEqual(Prize.objects.count(), 5)
+
+    def test_07_settlement_job(self):
+        """
+        This test evaluates settling an Event through a SettlementJob
+        processed in checkpointed chunks.
+        """
+
+        quota = Quota.objects.get(id=self.second_quota.id)
+        bets = [BetFactory(quota=quota) for _ in range(5)]
+        job = self.event.schedule_settlement(True)
+        self.event.refresh_from_db()
+        quota.refresh_from_db()
+        # The Event is closed but its Bets are not settled yet
+        self.assertFalse(self.event.active)
+        self.assertTrue(self.event.completed)
+        self.assertFalse(quota.active)
+        self.assertEqual(job.status, SettlementJob.PENDING)
+        self.assertEqual(job.total_bets, 5)
+        self.assertEqual(job.progress, 0)
+        self.assertEqual(
+            job.__str__(),
+            "{event} - {status}".format(
+                event=self.event, status=job.get_status_display()
+            ),
+        )
+        self.assertEqual(Prize.objects.count(), 0)
+        # Scheduling twice reuses the unfinished job
+        self.assertEqual(self.event.schedule_settlement(True), job)
+        # But the outcome can not change while the job is unfinished
+        with self.assertRaises(ValidationError):
+            self.event.schedule_settlement(False)
+        self.event.refresh_from_db()
+        self.assertTrue(self.event.completed)
+        self.assertEqual(SettlementJob.objects.count(), 1)
+
+        self.assertEqual(next_settlement_job(), job.id)
+        job = process_settlement_chunk(job.id, 2)
+        self.assertEqual(job.status, SettlementJob.RUNNING)
+        self.assertEqual(job.settled_bets, 2)
+        self.assertEqual(job.last_bet_id, bets[1].id)
+        self.assertEqual(job.progress, 0.4)
+        self.assertEqual(Prize.objects.count(), 2)
+
+        # A new worker resumes the job from its checkpoint
+        job = run_settlement_job(job.id, 2)
+        self.assertEqual(job.status, SettlementJob.DONE)
+        self.assertEqual(job.settled_bets, 5)
+        self.assertEqual(job.progress, 1)
+        self.assertIsNotNone(job.finish_date)
+        self.assertEqual(Prize.objects.count(), 5)
+        self.assertFalse(Bet.objects.filter(won=None).exists())
+        self.assertIsNone(process_settlement_chunk(job.id, 2))
+        self.assertIsNone(next_settlement_job())
+
+    def test_08_settlement_job_command(self):
+        """
+        This test evaluates the settlement worker command, including
+        failed jobs and events without open Bets.
+        """
+
+        quota = Quota.objects.get(id=self.second_quota.id)
+        BetFactory(quota=quota)
+        lost_job = self.event.schedule_settlement(False)
+        empty_job = EventFactory(active=True).schedule_settlement(True)
+        self.assertEqual(empty_job.progress, 0)
+        out = StringIO()
+        call_command("run_settlement_jobs", once=True, stdout=out)
+        lost_job.refresh_from_db()
+        empty_job.refresh_from_db()
+        self.assertEqual(lost_job.status, SettlementJob.DONE)
+        self.assertEqual(lost_job.settled_bets, 1)
+        self.assertEqual(empty_job.status, SettlementJob.DONE)
+        self.assertEqual(empty_job.progress, 1)
+        self.assertIn("Settlement job {}".format(lost_job.id), out.getvalue())
+        self.assertFalse(Bet.objects.get(quota=quota).won)
+        self.assertEqual(Prize.objects.count(), 0)
+
+        failed_job = EventFactory(active=True).schedule_settlement(True)
+        with patch(
+            "bets.settlement.settle_bets", side_effect=DatabaseError
+        ), self.assertLogs("bets.settlement", level="ERROR"):
+            failed_job = run_settlement_job(failed_job.id, 10)
+        self.assertEqual(failed_job.status, SettlementJob.FAILED)
+
+        # Without --once the worker keeps waiting for new jobs until it is
+        # stopped
+        with patch(
+            "bets.management.commands.run_settlement_jobs.time.sleep",
+            side_effect=[None, KeyboardInterrupt],
+        ) as sleep, self.assertRaises(KeyboardInterrupt):
+            call_command("run_settlement_jobs", sleep=2, stdout=StringIO())
+        self.assertEqual(sleep.call_args_list, [call(2), call(2)])
+
+    def test_09_benchmark_indexes(self):
+        """
+        This test evaluates the index benchmark command on a small dataset,
+        which must leave neither data nor index changes behind.
+        """
+
+        bets = Bet.objects.count()
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_indexes",
+                bets=300,
+                events=5,
+                users=3,
+                output=output.name,
+                verbosity=2,
+                stdout=out,
+            )
+            report = json.load(output)
+        self.assertEqual(report["bets"], 300)
+        self.assertEqual(len(report["results"]), 8)
+        for result in report["results"]:
+            self.assertIn("Execution Time", result["before"]["plan"])
+            self.assertIsNotNone(result["after"]["execution_time"])
+        self.assertIn("open bets of quota", out.getvalue())
+        self.assertEqual(Bet.objects.count(), bets)
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, Bet._meta.db_table
+            )
+        self.assertIn("bet_open_quota_idx", indexes)
+
+        # Plans are only written out on higher verbosity
+        out = StringIO()
+        call_command(
+            "benchmark_indexes", bets=10, events=2, users=1, stdout=out
+        )
+        self.assertIn("open bets of quota", out.getvalue())
+        self.assertNotIn("Execution Time", out.getvalue())
+
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_indexes", bets=1)
+
+    def test_10_odds_engine(self):
+        """
+        This test evaluates transforming probabilities into coeficients with
+        the active OddsFormula, and repricing Quotas in bulk.
+        """
+
+        self.addCleanup(pricer_cache.invalidate)
+        probabilities = [Decimal("0.5"), Decimal("0.25"), Decimal("0")]
+        # Without formulas every Quota keeps the default coeficient
+        self.assertEqual(get_pricer()(probabilities), [DEFAULT_COEFICIENT] * 3)
+
+        margin = compile_formula(OddsFormula.MARGIN, Decimal("0.05"))
+        self.assertEqual(
+            margin(probabilities),
+            [Decimal("1.90476"), Decimal("3.80952"), Decimal("9999.99999")],
+        )
+        # Without margin nor insiders the fair coeficient is given
+        for method in (OddsFormula.SHIN, OddsFormula.POWER):
+            self.assertEqual(
+                compile_formula(method, Decimal(0))(probabilities[:2]),
+                [Decimal("2.00000"), Decimal("4.00000")],
+            )
+        shin = compile_formula(OddsFormula.SHIN, Decimal("0.02"))
+        power = compile_formula(OddsFormula.POWER, Decimal("0.05"))
+        for pricer in (shin, power):
+            coeficients = pricer(probabilities[:2])
+            self.assertLess(coeficients[0], 2)
+            self.assertLess(coeficients[1], 4)
+        # Coeficients never go below 1
+        self.assertEqual(margin([Decimal(1)]), [Decimal("1.00000")])
+
+        OddsFormula.objects.create(
+            name="Margin", method=OddsFormula.MARGIN, parameter=0.05
+        )
+        self.assertEqual(get_pricer(), default_pricer)
+        formula = OddsFormula.objects.create(
+            name="Power", method=OddsFormula.POWER, parameter=0.05, active=True
+        )
+        self.assertEqual(formula.__str__(), "Power - Potencia")
+        self.assertFalse(OddsFormula.objects.get(name="Margin").active)
+        self.assertEqual(get_pricer(), power)
+        quota = QuotaFactory(event=self.event, active=True)
+        self.assertEqual(quota.coeficient, power([quota.probability])[0])
+
+        other_quota = QuotaFactory(active=True, event=EventFactory(active=True))
+        formula.method = OddsFormula.MARGIN
+        formula.save()
+        with self.assertNumQueries(3):
+            self.assertEqual(reprice_event(self.event), 1)
+        quota.refresh_from_db()
+        self.assertEqual(quota.coeficient, margin([quota.probability])[0])
+        self.assertEqual(reprice_open_events(), 2)
+        other_quota.refresh_from_db()
+        self.assertEqual(
+            other_quota.coeficient, margin([other_quota.probability])[0]
+        )
+
+        # Formulas changed by another process are seen once the formula
+        # generation is bumped
+        OddsFormula.objects.filter(id=formula.id).update(
+            method=OddsFormula.SHIN, parameter=Decimal("0.02")
+        )
+        self.assertEqual(get_pricer(), margin)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_generations(OddsFormula)
+        self.assertEqual(get_pricer(), shin)
+
+        out = StringIO()
+        call_command("reprice_quotas", event=self.event.id, stdout=out)
+        self.assertIn("Repriced 1 quotas", out.getvalue())
+        out = StringIO()
+        call_command("reprice_quotas", stdout=out)
+        self.assertIn("Repriced 2 quotas", out.getvalue())
+        self.assertEqual(reprice_quotas(Quota.objects.none()), 0)
+        with self.assertRaises(CommandError):
+            call_command("reprice_quotas", event=0)
+
+    def test_11_quota_rotation(self):
+        """
+        This test evaluates that saving an active Quota only deactivates the
+        currently active Quota of its Event, and that an Event can never
+        have two active Quotas.
+        """
+
+        # Only active Quotas are deactivated, and never the one being saved
+        with CaptureQueriesContext(connection) as context:
+            self.second_quota.save()
+        updates = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('UPDATE "bets_quota"')
+        ]
+        self.assertEqual(len(updates), 2)
+        self.assertIn('"bets_quota"."active"', updates[0])
+        self.assertTrue(Quota.objects.get(id=self.second_quota.id).active)
+
+        third_quota = QuotaFactory(event=self.event, active=True)
+        self.assertEqual(
+            list(
+                self.event.quotas.filter(active=True).values_list(
+                    "id", flat=True
+                )
+            ),
+            [third_quota.id],
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Quota.objects.filter(id=self.first_quota.id).update(active=True)
+
 
 class QueryTest(JSONWebTokenTestCase):
     def setUp(self):
@@ -1122,6 +1548,7 @@ class QueryTest(JSONWebTokenTestCase):
         self.client.authenticate(self.user)
         self.first_event.completed = True
         self.first_event.save()
+        call_command("run_settlement_jobs", once=True, stdout=StringIO())
         self.first_prize = Prize.objects.first()
         self.second_prize = Prize.objects.exclude(
             id=self.first_prize.id
@@ -1192,6 +1619,7 @@ class QueryTest(JSONWebTokenTestCase):
         self.client.authenticate(self.user)
         self.first_event.completed = True
         self.first_event.save()
+        call_command("run_settlement_jobs", once=True, stdout=StringIO())
         self.first_prize = Prize.objects.first()
         query = """
             query getPrize {{
@@ -1220,6 +1648,478 @@ class QueryTest(JSONWebTokenTestCase):
             int(Node.from_global_id(result.data["prize"]["bet"]["id"])[1]),
         )
 
+    def test_15_batched_relations(self):
+        """
+        This test evaluates that nested relations are batched, so the amount
+        of queries does not depend on the page size.
+        """
+
+        self.client.authenticate(self.user)
+        query = """
+            query getAllBets($first: Int) {
+                bets: allBets(first: $first) {
+                    edges {
+                        node {
+                            id,
+                            user { username }
+                            transaction { amount }
+                            prizes { edges { node { reward } } }
+                            quota {
+                                manager { username }
+                                event {
+                                    affair {
+                                        manager { username }
+                                        tags { edges { node { name } } }
+                                    }
+                                    quotas { edges { node { id } } }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        """
+        query_counts = list()
+        for page_size in (2, 12):
+            while Bet.objects.count() < page_size:
+                affair = AffairFactory(tags=[TagFactory(), TagFactory()])
+                event = EventFactory(active=True, affair=affair)
+                bet = BetFactory(quota=QuotaFactory(event=event, active=True))
+                PrizeFactory(bet=bet, user=bet.user)
+            with CaptureQueriesContext(connection) as context:
+                result = self.client.execute(
+                    query, variables=dict(first=page_size)
+                )
+            self.assertIsNone(result.errors)
+            self.assertEqual(len(result.data["bets"]["edges"]), page_size)
+            query_counts.append(len(context.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+        # Executions without a request get DataLoaders of their own, and
+        # unset relations are not loaded
+        resolve_affair = related_resolver("affair")
+        event = Event.objects.first()
+        info = Mock(context=None)
+        self.assertEqual(resolve_affair(event, info).get(), event.affair)
+        self.assertIsNone(resolve_affair(Event(), info))
+
+    def test_16_optimized_querysets(self):
+        """
+        This test evaluates that top-level querysets only fetch the requested
+        columns and join or prefetch the requested relations.
+        """
+
+        self.client.authenticate(self.user)
+        query = """
+            query getAllEvents {
+                events: allEvents {
+                    edges {
+                        node {
+                            id,
+                            name,
+                            affair { manager { username } }
+                            quotas { edges { node { probability } } }
+                        }
+                    }
+                }
+            }
+        """
+        with CaptureQueriesContext(connection) as context:
+            result = self.client.execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            len(result.data["events"]["edges"]), Event.objects.count()
+        )
+        sql = [query["sql"] for query in context.captured_queries]
+        events_sql = next(
+            statement
+            for statement in sql
+            if statement.startswith("SELECT")
+            and '"bets_event"."name"' in statement
+        )
+        self.assertIn('INNER JOIN "bets_affair"', events_sql)
+        self.assertIn('INNER JOIN "users_user"', events_sql)
+        self.assertIn('ORDER BY "bets_event"."id" ASC', events_sql)
+        self.assertNotIn('"bets_event"."rules"', events_sql)
+        self.assertNotIn('"bets_affair"."description"', events_sql)
+        quotas_sql = [
+            statement
+            for statement in sql
+            if statement.startswith('SELECT "bets_quota"')
+        ]
+        self.assertEqual(len(quotas_sql), 1)
+        self.assertNotIn('"bets_quota"."coeficient"', quotas_sql[0])
+
+        filtered_query = """
+            query getAllEvents {
+                events: allEvents {
+                    edges {
+                        node {
+                            quotas(active: true) {
+                                edges { node { id } }
+                            }
+                        }
+                    }
+                }
+            }
+        """
+        result = self.client.execute(filtered_query)
+        self.assertIsNone(result.errors)
+
+        # Querysets ordered by their resolver keep their order
+        class Query(ObjectType):
+            events = OptimizedConnectionField(EventType)
+
+            def resolve_events(self, info, **kwargs):
+                return Event.objects.order_by("-id")
+
+        result = Schema(query=Query).execute(
+            "{ events { edges { node { id } } } }"
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [
+                int(Node.from_global_id(edge["node"]["id"])[1])
+                for edge in result.data["events"]["edges"]
+            ],
+            list(Event.objects.order_by("-id").values_list("id", flat=True)),
+        )
+
+    def test_17_keyset_pagination(self):
+        """
+        This test evaluates that bets are paged forwards and backwards with
+        keyset cursors, with the same amount of queries on every page, and
+        only counted when totalCount is selected.
+        """
+
+        for _ in range(3):
+            BetFactory(quota=self.second_quota)
+        expected = list(
+            Bet.objects.order_by("creation_date", "id").values_list(
+                "id", flat=True
+            )
+        )
+        self.client.authenticate(self.user)
+        query = """
+            query getAllBets($first: Int, $after: String) {
+                bets: allBets(first: $first, after: $after) {
+                    edges { node { id } }
+                    pageInfo { endCursor hasNextPage hasPreviousPage }
+                }
+            }
+        """
+        ids = list()
+        query_counts = list()
+        after = None
+        while True:
+            with CaptureQueriesContext(connection) as context:
+                result = self.client.execute(
+                    query, variables=dict(first=2, after=after)
+                )
+            self.assertIsNone(result.errors)
+            query_counts.append(len(context.captured_queries))
+            self.assertFalse(
+                any(
+                    "COUNT(" in captured["sql"]
+                    for captured in context.captured_queries
+                )
+            )
+            page = result.data["bets"]
+            ids.extend(
+                int(Node.from_global_id(edge["node"]["id"])[1])
+                for edge in page["edges"]
+            )
+            self.assertEqual(
+                page["pageInfo"]["hasPreviousPage"], after is not None
+            )
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(set(query_counts)), 1)
+
+        backward_query = """
+            query getAllBets($before: String) {
+                bets: allBets(last: 2, before: $before) {
+                    totalCount
+                    edges { node { id } }
+                    pageInfo { startCursor hasPreviousPage }
+                }
+            }
+        """
+        result = self.client.execute(backward_query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["bets"]["totalCount"], len(expected))
+        self.assertTrue(result.data["bets"]["pageInfo"]["hasPreviousPage"])
+        self.assertEqual(
+            [
+                int(Node.from_global_id(edge["node"]["id"])[1])
+                for edge in result.data["bets"]["edges"]
+            ],
+            expected[-2:],
+        )
+        result = self.client.execute(
+            backward_query,
+            variables=dict(
+                before=result.data["bets"]["pageInfo"]["startCursor"]
+            ),
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [
+                int(Node.from_global_id(edge["node"]["id"])[1])
+                for edge in result.data["bets"]["edges"]
+            ],
+            expected[-4:-2],
+        )
+
+        result = self.client.execute(
+            query, variables=dict(first=2, after="invalid")
+        )
+        self.assertIsNotNone(result.errors)
+        self.assertIn("Invalid cursor", str(result.errors[0]))
+        for cursor in (
+            offset_to_cursor(0),
+            base64(KEYSET_PREFIX + json.dumps(["invalid", 1])),
+        ):
+            with self.assertRaisesMessage(GraphQLError, "Invalid cursor"):
+                keyset_position(cursor)
+
+        # Negative page sizes are rejected before querying, the only query
+        # being the one authenticating the user
+        for variables in (dict(first=-1), dict(last=-1)):
+            with self.assertNumQueries(1):
+                result = self.client.execute(
+                    """
+                    query getAllBets($first: Int, $last: Int) {
+                        allBets(first: $first, last: $last) {
+                            edges { node { id } }
+                        }
+                    }
+                    """,
+                    variables=variables,
+                )
+            self.assertEqual(
+                result.errors[0].message,
+                "Arguments first and last can not be negative.",
+            )
+
+        # Pages are bounded by the maximum limit, or by both first and
+        # last, and lists are paged by offset
+        connection_type = BetType._meta.connection
+        queryset = Bet.objects.all()
+        for args, max_limit, page in (
+            (dict(), None, expected),
+            (dict(), 2, expected[:2]),
+            (dict(first=3, last=2), None, expected[1:3]),
+        ):
+            resolved = KeysetConnectionField.resolve_connection(
+                connection_type, args, queryset, max_limit=max_limit
+            )
+            self.assertEqual([edge.node.id for edge in resolved.edges], page)
+        self.assertTrue(resolved.page_info.has_previous_page)
+        resolved = KeysetConnectionField.resolve_connection(
+            connection_type, dict(first=1), list(queryset.order_by("pk"))
+        )
+        self.assertEqual(len(resolved.edges), 1)
+        self.assertEqual(resolved.resolve_total_count(None), len(expected))
+
+    def test_18_benchmark_pagination(self):
+        """
+        This test evaluates the pagination benchmark command, which must
+        delete the seeded data afterwards.
+        """
+
+        bets = Bet.objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_pagination",
+                bets=30,
+                page_size=5,
+                pages="1,3,100",
+                repeat=2,
+                output=output.name,
+                stdout=StringIO(),
+            )
+            report = json.load(output)
+        self.assertEqual(set(report["pages"]), {"1", "3"})
+        for page in report["pages"].values():
+            self.assertEqual(page["keyset_queries_per_page"], 1)
+            self.assertGreater(page["offset_queries_per_page"], 1)
+        self.assertEqual(Bet.objects.count(), bets)
+
+        stdout = StringIO()
+        call_command("benchmark_pagination", bets=5, page_size=5, stdout=stdout)
+        self.assertIn("page 1: ", stdout.getvalue())
+        with patch.object(
+            KeysetConnectionField,
+            "resolve_connection",
+            return_value=Mock(edges=[]),
+        ), self.assertRaisesMessage(CommandError, "empty"):
+            call_command("benchmark_pagination", bets=5, page_size=5)
+        self.assertEqual(Bet.objects.count(), bets)
+        for options in (dict(pages="1,a"), dict(pages="0"), dict(repeat=0)):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_pagination", **options)
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_pagination")
+
+    def test_19_paged_relations(self):
+        """
+        This test evaluates that DataLoaders only fetch the page of each
+        parent selected by first and last, with a single query.
+        """
+
+        tags = [TagFactory() for _ in range(3)]
+        affair = AffairFactory(tags=tags)
+        empty_affair = AffairFactory(tags=[])
+        field = Affair._meta.get_field("tags")
+        for first, last, names, start in (
+            (2, None, tags[:2], 0),
+            (100, 1, tags[2:], 2),
+            (2, 1, tags[1:2], 1),
+            (None, None, tags, 0),
+        ):
+            with self.assertNumQueries(1):
+                page, empty_page = (
+                    Loaders()
+                    .for_field(field, first, last)
+                    .batch_load_fn([affair.id, empty_affair.id])
+                    .get()
+                )
+            self.assertEqual(page, names)
+            self.assertEqual((page.start, page.total), (start, 3))
+            self.assertEqual((empty_page, empty_page.total), ([], 0))
+
+        quotas = [QuotaFactory(event=self.first_event) for _ in range(2)]
+        (page,) = (
+            Loaders()
+            .for_field(Event._meta.get_field("quotas"), None, 1)
+            .batch_load_fn([self.first_event.id])
+            .get()
+        )
+        self.assertEqual(page, quotas[-1:])
+        self.assertEqual(page.total, self.first_event.quotas.count())
+
+        # Paged connections are not prefetched but loaded page by page
+        query = """
+            query getAllAffairs($first: Int, $last: Int) {
+                affairs: allAffairs {
+                    edges {
+                        node {
+                            id,
+                            tags(first: $first, last: $last) {
+                                pageInfo { hasNextPage, hasPreviousPage }
+                                edges { node { name } }
+                            }
+                        }
+                    }
+                }
+            }
+        """
+        for variables, names, has_next, has_previous in (
+            (dict(first=2), tags[:2], True, False),
+            (dict(last=1), tags[2:], False, True),
+        ):
+            with CaptureQueriesContext(connection) as context:
+                result = self.client.execute(query, variables=variables)
+            self.assertIsNone(result.errors)
+            connections = {
+                edge["node"]["id"]: edge["node"]["tags"]
+                for edge in result.data["affairs"]["edges"]
+            }
+            tags_connection = connections[
+                Node.to_global_id("AffairType", affair.id)
+            ]
+            self.assertEqual(
+                [edge["node"]["name"] for edge in tags_connection["edges"]],
+                [tag.name for tag in names],
+            )
+            self.assertEqual(
+                tags_connection["pageInfo"],
+                dict(hasNextPage=has_next, hasPreviousPage=has_previous),
+            )
+            self.assertEqual(
+                connections[Node.to_global_id("AffairType", empty_affair.id)],
+                dict(
+                    pageInfo=dict(hasNextPage=False, hasPreviousPage=False),
+                    edges=[],
+                ),
+            )
+            tags_sql = [
+                query["sql"]
+                for query in context.captured_queries
+                if '"bets_tag"' in query["sql"]
+            ]
+            self.assertEqual(len(tags_sql), 1)
+            self.assertIn("ROW_NUMBER()", tags_sql[0])
+
+    def test_20_fragment_selections(self):
+        """
+        This test evaluates that relations selected through named and inline
+        fragments are joined or prefetched as well.
+        """
+
+        for _ in range(3):
+            event = EventFactory(active=True, affair=AffairFactory())
+            QuotaFactory(event=event, active=True)
+        query = """
+            fragment affairFields on AffairType {
+                manager { username }
+            }
+            query getAllEvents {
+                events: allEvents {
+                    edges {
+                        node {
+                            id,
+                            affair { ...affairFields }
+                            ... on EventType {
+                                quotas { edges { node { probability } } }
+                            }
+                        }
+                    }
+                }
+            }
+        """
+        with self.assertNumQueries(3):
+            result = self.client.execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            len(result.data["events"]["edges"]), Event.objects.count()
+        )
+        self.assertEqual(
+            sum(
+                len(edge["node"]["quotas"]["edges"])
+                for edge in result.data["events"]["edges"]
+            ),
+            Quota.objects.count(),
+        )
+
+        # Fields which are not model fields load every column
+        self.client.authenticate(
+            UserFactory.create(groups=(Group.objects.get(name=BET_MANAGER),))
+        )
+        job = self.second_event.schedule_settlement(True)
+        query = """
+            query getAllSettlementJobs {
+                allSettlementJobs {
+                    edges { node { progress } }
+                }
+            }
+        """
+        with CaptureQueriesContext(connection) as context:
+            result = self.client.execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            result.data["allSettlementJobs"]["edges"],
+            [dict(node=dict(progress=job.progress))],
+        )
+        self.assertIn(
+            '"bets_settlementjob"."total_bets"',
+            context.captured_queries[-1]["sql"],
+        )
+
 
 class MutationAsManagerTest(JSONWebTokenTestCase):
     def setUp(self):
@@ -1945,23 +2845,185 @@ class MutationAsManagerTest(JSONWebTokenTestCase):
         )
         self.assertIsNone(result.data["placeBetByEvent"])
 
+    def test_12_complete_event(self):
+        """
+        This test evaluates completing an Event via mutation, which must
+        schedule a SettlementJob instead of settling its Bets inline.
+        """
 
-class MutationAsConsumerTest(JSONWebTokenTestCase):
-    def setUp(self):
-        self.affair = AffairFactory()
-        self.event = EventFactory(active=True, affair=self.affair)
-        self.quota = QuotaFactory(event=self.event, active=True)
-        self.event_fields = """
-            id,
-            affair{
-                id,
-                description
-            }
-            name,
-            description,
-            rules,
-            creationDate,
-            modificationDate,
+        bet = BetFactory(quota=self.quota)
+        mutation = """
+            mutation updateEvent($eventInput: EventUpdateInput!) {
+                updateEvent(eventInput: $eventInput) {
+                    event{
+                        id,
+                        active,
+                        completed
+                    }
+                    settlementJob{
+                        id,
+                        status,
+                        totalBets,
+                        progress
+                    }
+                }
+            }
+        """
+        executed = self.client.execute(
+            mutation,
+            context_value=self.context_value,
+            variables=dict(eventInput=dict(id=self.event.id, completed=True)),
+        )
+        self.assertIsNone(executed.errors)
+        event = executed.data["updateEvent"]["event"]
+        job = executed.data["updateEvent"]["settlementJob"]
+        self.assertFalse(event["active"])
+        self.assertTrue(event["completed"])
+        self.assertEqual(job["status"], "PENDING")
+        self.assertEqual(job["totalBets"], 1)
+        self.assertEqual(job["progress"], 0)
+        bet.refresh_from_db()
+        self.assertIsNone(bet.won)
+
+        # The pending job keeps its outcome, and so does the Event
+        executed = self.client.execute(
+            mutation,
+            context_value=self.context_value,
+            variables=dict(
+                eventInput=dict(id=self.event.id, name="Flip", completed=False)
+            ),
+        )
+        self.assertEqual(
+            executed.errors[0].message,
+            "El evento ya se está liquidando con otro resultado",
+        )
+        self.event.refresh_from_db()
+        self.assertTrue(self.event.completed)
+        self.assertNotEqual(self.event.name, "Flip")
+
+        call_command("run_settlement_jobs", once=True, stdout=StringIO())
+        query = """
+            query getSettlementJob($id: ID!) {
+                settlementJobById(id: $id) {
+                    status,
+                    settledBets,
+                    progress
+                }
+                allSettlementJobs {
+                    edges {
+                        node {
+                            id
+                        }
+                    }
+                }
+            }
+        """
+        executed = self.client.execute(query, variables=dict(id=job["id"]))
+        self.assertIsNone(executed.errors)
+        self.assertEqual(
+            executed.data["allSettlementJobs"]["edges"],
+            [dict(node=dict(id=job["id"]))],
+        )
+        self.assertEqual(
+            executed.data["settlementJobById"],
+            dict(status="DONE", settledBets=1, progress=1.0),
+        )
+        bet.refresh_from_db()
+        self.assertTrue(bet.won)
+
+    def test_13_tag_resolution(self):
+        """
+        This test evaluates that the tags of an Affair are resolved with a
+        constant amount of queries, matched by normalized name and served
+        from the cache once committed.
+        """
+
+        tag_cache.invalidate()
+        names = ["Tag {}".format(number) for number in range(30)]
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(3):
+                tag_ids = resolve_tags(names + ["  tag   0 "])
+        self.assertEqual(len(tag_ids), 30)
+        self.assertEqual(
+            list(
+                Tag.objects.filter(id__in=tag_ids)
+                .order_by("id")
+                .values_list("name", flat=True)
+            ),
+            names,
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                resolve_tags([name.upper() for name in names]), tag_ids
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                resolve_tags([self.first_tag.id, str(self.second_tag.id)]),
+                [self.first_tag.id, self.second_tag.id],
+            )
+        with self.assertRaises(TagError):
+            resolve_tags([self.first_tag.id, 900])
+        with self.assertRaises(TagError):
+            resolve_tags(["   "])
+
+        # Renamed Tags are not served from the cache anymore
+        tag = Tag.objects.get(id=tag_ids[0])
+        tag.name = "Renamed"
+        tag.save()
+        self.assertEqual(len(tag_cache), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertNotIn(tag.id, resolve_tags(["Tag 0"]))
+
+        # Known Tags missing from the cache are read without creating any
+        tag_cache.invalidate()
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_tags(names[1:3]), tag_ids[1:3])
+
+        mutation = """
+            mutation createAffair($affairInput: AffairCreationInput!) {
+                createAffair(affairInput: $affairInput) {
+                    affair { tags { edges { node { name } } } }
+                }
+            }
+        """
+        executed = self.client.execute(
+            mutation,
+            context_value=self.context_value,
+            variables=dict(
+                affairInput=dict(
+                    description="Description",
+                    tags=["Some tag", "some  TAG", self.first_tag.name],
+                )
+            ),
+        )
+        self.assertIsNone(executed.errors)
+        self.assertEqual(
+            [
+                edge["node"]["name"]
+                for edge in executed.data["createAffair"]["affair"]["tags"][
+                    "edges"
+                ]
+            ],
+            [self.first_tag.name, "Some tag"],
+        )
+
+
+class MutationAsConsumerTest(JSONWebTokenTestCase):
+    def setUp(self):
+        self.affair = AffairFactory()
+        self.event = EventFactory(active=True, affair=self.affair)
+        self.quota = QuotaFactory(event=self.event, active=True)
+        self.event_fields = """
+            id,
+            affair{
+                id,
+                description
+            }
+            name,
+            description,
+            rules,
+            creationDate,
+            modificationDate,
             expirationDate,
             active
         """
@@ -2009,6 +3071,42 @@ class MutationAsConsumerTest(JSONWebTokenTestCase):
         )
         self.assertIsNone(executed.data["createEvent"])
 
+    def test_02_settlement_jobs(self):
+        """
+        This test tries reading SettlementJobs, which are only
+        available to Bet Managers.
+        """
+
+        job = self.event.schedule_settlement(True)
+        query = """
+            query getSettlementJobs($id: ID!) {
+                allSettlementJobs {
+                    edges {
+                        node {
+                            id
+                        }
+                    }
+                }
+                settlementJobById(id: $id) {
+                    id
+                }
+            }
+        """
+        executed = self.client.execute(
+            query,
+            variables=dict(
+                id=Node.to_global_id(SettlementJobType.__name__, job.id)
+            ),
+        )
+        self.assertEqual(len(executed.errors), 2)
+        for error in executed.errors:
+            self.assertEqual(
+                error.message,
+                "You do not have permission to perform this action",
+            )
+        self.assertIsNone(executed.data["allSettlementJobs"])
+        self.assertIsNone(executed.data["settlementJobById"])
+
 
 class NotLoggedInTest(JSONWebTokenTestCase):
     def setUp(self):
@@ -2268,3 +3366,2372 @@ class BetPlacement(JSONWebTokenTestCase):
             type(result.errors[0]),
         )
         self.assertIsNone(result.data["placeBetByEvent"])
+
+    def test_06_placement_service(self):
+        """
+        This test evaluates that a placement locks its Quota with a single
+        query before inserting the Transaction and the Bet.
+        """
+
+        with CaptureQueriesContext(connection) as context:
+            bet = place_bet_by_quota(
+                self.user, self.enabled_quota.id, Decimal(40)
+            )
+        statements = [
+            query["sql"]
+            for query in context.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(len(statements), 5)
+        self.assertIn('INNER JOIN "bets_event"', statements[0])
+        self.assertTrue(statements[0].endswith('FOR UPDATE OF "bets_quota"'))
+        self.assertEqual(bet.potential_earnings, 40 * bet.quota.coeficient)
+
+        with self.assertRaisesMessage(PlacementError, "Not a valid quota."):
+            place_bet_by_quota(self.user, self.disabled_quota.id, Decimal(40))
+        with self.assertRaisesMessage(PlacementError, "Not a valid event."):
+            place_bet_by_event(self.user, self.disabled_event.id, Decimal(40))
+        self.enabled_quota.active = False
+        self.enabled_quota.save()
+        with self.assertRaisesMessage(
+            PlacementError, "Event does not have any valid Quotas."
+        ):
+            place_bet_by_event(self.user, self.enabled_event.id, Decimal(40))
+
+    def test_07_benchmark_placement(self):
+        """
+        This test evaluates the placement benchmark command, which must
+        delete the seeded data afterwards.
+        """
+
+        bets = Bet.objects.count()
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_placement",
+                placements=20,
+                clients=1,
+                events=2,
+                users=2,
+                output=output.name,
+                stdout=out,
+            )
+            report = json.load(output)
+        self.assertEqual(report["placements"], 20)
+        self.assertEqual(report["queries_per_placement"], 7)
+        self.assertIn(
+            "20 placements in 20 requests from 1 clients", out.getvalue()
+        )
+        self.assertEqual(Bet.objects.count(), bets)
+
+        # Bet slips place several bets per request
+        out = StringIO()
+        call_command(
+            "benchmark_placement",
+            placements=5,
+            slip_size=3,
+            clients=1,
+            events=2,
+            users=2,
+            stdout=out,
+        )
+        self.assertIn(
+            "15 placements in 5 requests from 1 clients", out.getvalue()
+        )
+        self.assertEqual(Bet.objects.count(), bets)
+
+        for name in ("placements", "slip_size", "clients", "events", "users"):
+            with self.assertRaisesMessage(CommandError, "start from 1"):
+                call_command("benchmark_placement", **{name: 0})
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_placement", placements=1)
+
+    def test_08_place_bets(self):
+        """
+        This test evaluates placing a bet slip. Bets on enabled Quotas should
+        be created, while the other entries should report an error.
+        """
+
+        mutation = """
+            mutation placeBets($entries: [BetSlipEntryInput]!) {{
+                placeBets(entries: $entries) {{
+                    results{{
+                        quotaId,
+                        amount,
+                        bet{{
+                            {fields}
+                        }}
+                        error
+                    }}
+                }}
+            }}
+        """.format(
+            fields=self.bet_fields
+        )
+        result = self.client.execute(
+            mutation,
+            context_value=self.context_value,
+            variables=dict(
+                entries=[
+                    dict(quotaId=self.enabled_quota.id, amount=40),
+                    dict(quotaId=self.disabled_quota.id, amount=40),
+                    dict(quotaId="invalid", amount=40),
+                    dict(quotaId=self.enabled_quota.id, amount=10),
+                ]
+            ),
+        )
+        self.assertIsNone(result.errors)
+        results = result.data["placeBets"]["results"]
+        self.assertEqual(len(results), 4)
+        for entry in (results[0], results[3]):
+            self.assertIsNone(entry["error"])
+            self.assertEqual(
+                self.enabled_quota.id,
+                int(Node.from_global_id(entry["bet"]["quota"]["id"])[1]),
+            )
+        for entry in (results[1], results[2]):
+            self.assertEqual(entry["error"], "Not a valid quota.")
+            self.assertIsNone(entry["bet"])
+        self.assertEqual(self.user.bets.count(), 2)
+
+        # A slip without valid entries places nothing
+        result = self.client.execute(
+            mutation,
+            context_value=self.context_value,
+            variables=dict(
+                entries=[dict(quotaId=self.disabled_quota.id, amount=40)]
+            ),
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            result.data["placeBets"]["results"][0]["error"],
+            "Not a valid quota.",
+        )
+        self.assertEqual(self.user.bets.count(), 2)
+
+        # Slips over BET_SLIP_MAX_ENTRIES are rejected as a whole
+        with self.settings(BET_SLIP_MAX_ENTRIES=1):
+            result = self.client.execute(
+                mutation,
+                context_value=self.context_value,
+                variables=dict(
+                    entries=[dict(quotaId=self.enabled_quota.id, amount=10)] * 2
+                ),
+            )
+        self.assertEqual(
+            result.errors[0].message,
+            "A bet slip can not have more than 1 entries.",
+        )
+        self.assertIsNone(result.data["placeBets"])
+        self.assertEqual(self.user.bets.count(), 2)
+
+    def test_09_place_bets_service(self):
+        """
+        This test evaluates that a bet slip locks its Quotas with a single
+        query and inserts its Transactions and Bets with one query each.
+        """
+
+        other_quota = QuotaFactory(
+            event=EventFactory(active=True, affair=self.affair), active=True
+        )
+        entries = [
+            (quota.id, Decimal(amount))
+            for amount in range(1, 11)
+            for quota in (self.enabled_quota, other_quota)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            results = place_bets(self.user, entries)
+        statements = [
+            query["sql"]
+            for query in context.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(len(statements), 5)
+        self.assertTrue(statements[0].endswith('FOR UPDATE OF "bets_quota"'))
+        self.assertEqual(len(results), 20)
+        for (quota_id, amount), result in zip(entries, results):
+            self.assertIsNone(result.error)
+            self.assertEqual(result.bet.quota_id, quota_id)
+            self.assertEqual(result.bet.transaction.amount, amount)
+        self.assertEqual(self.user.bets.count(), 20)
+
+        with self.settings(BET_SLIP_MAX_ENTRIES=10):
+            with self.assertRaises(PlacementError):
+                place_bets(self.user, entries)
+        self.assertEqual(self.user.bets.count(), 20)
+
+    def test_10_ledger(self):
+        """
+        This test evaluates that placements and payouts are posted to the
+        ledger, and that balances are verified by the reconciliation command.
+        """
+
+        self.assertEqual(get_balance(self.user), 0)
+        place_bet_by_quota(self.user, self.enabled_quota.id, Decimal(40))
+        place_bets(
+            self.user,
+            [(self.enabled_quota.id, Decimal(10))] * 2,
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(get_balance(self.user), -60)
+        self.assertEqual(
+            LedgerEntry.objects.filter(account__user=self.user).count(), 3
+        )
+        with self.assertRaises(ValidationError):
+            LedgerEntry.objects.first().save()
+        # New entries can be saved, and nothing is posted without postings
+        entry = LedgerEntry(
+            account=Account.objects.get(user=self.user),
+            amount=0,
+            description="adjustment",
+        )
+        entry.save()
+        self.assertIsNotNone(entry.id)
+        with self.assertNumQueries(0):
+            post_entries([])
+
+        settle_event(self.enabled_event, True)
+        rewards = sum(prize.reward for prize in self.user.prizes.all())
+        self.assertEqual(get_balance(self.user), rewards - 60)
+        self.assertEqual(
+            LedgerEntry.objects.filter(prize__isnull=False).count(), 3
+        )
+
+        result = self.client.execute(
+            "query { myBalance }", context_value=self.context_value
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(Decimal(result.data["myBalance"]), rewards - 60)
+
+        out = StringIO()
+        call_command("reconcile_ledger", chunk_size=1, stdout=out)
+        self.assertIn("1 accounts verified, 0 mismatched", out.getvalue())
+        Account.objects.filter(user=self.user).update(balance=1000)
+        with self.assertRaises(CommandError):
+            call_command("reconcile_ledger", stdout=StringIO())
+        call_command("reconcile_ledger", fix=True, stdout=StringIO())
+        self.assertEqual(get_balance(self.user), rewards - 60)
+
+        # Bets saved outside the placement service are charged as well
+        bet = BetFactory(quota=QuotaFactory(active=True), user=self.user)
+        self.assertEqual(
+            get_balance(self.user), rewards - 60 - bet.transaction.amount
+        )
+        out = StringIO()
+        call_command("reconcile_ledger", stdout=out)
+        self.assertIn("0 mismatched", out.getvalue())
+
+    def test_11_benchmark_rotation(self):
+        """
+        This test evaluates the quota rotation benchmark command, which must
+        delete the seeded data afterwards.
+        """
+
+        quotas = Quota.objects.count()
+        for rotation, rows in (("single", 1), ("event-wide", 4)):
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                call_command(
+                    "benchmark_rotation",
+                    duration=0.2,
+                    clients=0,
+                    repricers=1,
+                    rotation=rotation,
+                    events=1,
+                    history=2,
+                    users=1,
+                    output=output.name,
+                    stdout=StringIO(),
+                )
+                report = json.load(output)
+            self.assertGreater(report["rotations"], 0)
+            # Event-wide rotations rewrite every historical Quota
+            self.assertGreaterEqual(report["rows_per_rotation"], rows)
+        self.assertEqual(Quota.objects.count(), quotas)
+
+        out = StringIO()
+        call_command(
+            "benchmark_rotation",
+            duration=0.2,
+            clients=1,
+            repricers=0,
+            events=1,
+            users=1,
+            stdout=out,
+        )
+        self.assertIn("single rotation", out.getvalue())
+
+        # Failed placements are counted apart from the placed ones
+        with tempfile.NamedTemporaryFile(suffix=".json") as output, patch(
+            "bets.management.commands.benchmark_rotation.place_bet_by_event",
+            side_effect=PlacementError("Not a valid event."),
+        ):
+            call_command(
+                "benchmark_rotation",
+                duration=0.1,
+                clients=1,
+                repricers=0,
+                events=1,
+                users=1,
+                output=output.name,
+                stdout=StringIO(),
+            )
+            report = json.load(output)
+        self.assertEqual(report["placements"], 0)
+        self.assertGreater(report["failed_placements"], 0)
+        self.assertIsNone(report["placement_p50"])
+        self.assertEqual(Quota.objects.count(), quotas)
+
+        with self.assertRaises(CommandError):
+            call_command("benchmark_rotation", clients=0, repricers=0)
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaisesMessage(CommandError, "PostgreSQL"):
+                call_command("benchmark_rotation", clients=1)
+
+    def test_12_exposure(self):
+        """
+        This test evaluates that placements and settlements keep the
+        exposures of Quotas, Events and Users, which are served by the
+        riskExposure query and verified by the reconciliation command.
+        """
+
+        place_bet_by_quota(self.user, self.enabled_quota.id, Decimal(40))
+        place_bets(self.user, [(self.enabled_quota.id, Decimal(10))] * 2)
+        other_bet = BetFactory(quota=self.disabled_quota)
+        other_bet.refresh_from_db()
+        liability = sum(
+            bet.potential_earnings
+            for bet in Bet.objects.filter(quota=self.enabled_quota)
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                get_exposure("quota", self.enabled_quota.id),
+                (3, Decimal(60), liability),
+            )
+        self.assertEqual(
+            get_exposure("user", self.user.id), (3, Decimal(60), liability)
+        )
+        self.assertEqual(
+            get_exposure("event", self.enabled_event.id),
+            (
+                4,
+                60 + other_bet.transaction.amount,
+                liability + other_bet.potential_earnings,
+            ),
+        )
+        self.assertEqual(
+            get_exposure("event", self.disabled_event.id), (0, 0, 0)
+        )
+
+        query = """
+            query riskExposure($eventId: ID, $userId: ID) {
+                riskExposure(eventId: $eventId, userId: $userId) {
+                    bets, stake, liability
+                }
+            }
+        """
+        # Only bet managers may query exposures
+        result = self.client.execute(
+            query,
+            variables=dict(eventId=self.enabled_event.id),
+            context_value=self.context_value,
+        )
+        self.assertEqual(
+            result.errors[0].message,
+            "You do not have permission to perform this action",
+        )
+        self.assertIsNone(result.data["riskExposure"])
+        manager = UserFactory(groups=(Group.objects.get(name=BET_MANAGER),))
+        self.client.authenticate(manager)
+        result = self.client.execute(
+            query,
+            variables=dict(eventId=self.enabled_event.id),
+            context_value=self.context_value,
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["riskExposure"]["bets"], 4)
+        self.assertEqual(
+            Decimal(result.data["riskExposure"]["stake"]),
+            60 + other_bet.transaction.amount,
+        )
+        for variables, message in (
+            (
+                dict(eventId=self.enabled_event.id, userId=manager.id),
+                "Exactly one of quotaId, eventId or userId must be given.",
+            ),
+            (dict(eventId="first"), "Invalid event ID first."),
+        ):
+            result = self.client.execute(
+                query, variables=variables, context_value=self.context_value
+            )
+            self.assertEqual(result.errors[0].message, message)
+
+        # Saving no Bets does not query anything
+        with self.assertNumQueries(0):
+            add_placed_bets([])
+
+        out = StringIO()
+        call_command("reconcile_exposure", chunk_size=1, stdout=out)
+        self.assertIn("0 mismatched", out.getvalue())
+        settle_event(self.enabled_event, False)
+        for scope, object_id in (
+            ("quota", self.enabled_quota.id),
+            ("event", self.enabled_event.id),
+            ("user", self.user.id),
+        ):
+            self.assertEqual(get_exposure(scope, object_id), (0, 0, 0))
+
+        UserExposure.objects.filter(user=self.user).update(bets=5)
+        with self.assertRaises(CommandError):
+            call_command("reconcile_exposure", stdout=StringIO())
+        call_command(
+            "reconcile_exposure", scope=["user"], fix=True, stdout=StringIO()
+        )
+        self.assertEqual(get_exposure("user", self.user.id), (0, 0, 0))
+        call_command("reconcile_exposure", stdout=StringIO())
+
+    @override_settings(
+        BET_MAX_AMOUNT=Decimal(50),
+        EXPOSURE_LIMITS={"user": {"stake": Decimal(60)}},
+    )
+    def test_13_limits(self):
+        """
+        This test evaluates that placements are rejected when their amount
+        or the exposures they would reach exceed the limits, without placing
+        any Bet, and that exposures can replace the limits of their scope.
+        """
+
+        for amount, message in (
+            (Decimal(0), "The amount must be at least 0.01."),
+            (Decimal(51), "The amount can not be greater than 50."),
+            (Decimal("NaN"), "Not a valid amount."),
+            (None, "Not a valid amount."),
+        ):
+            with self.assertRaisesMessage(PlacementError, message):
+                place_bet_by_quota(self.user, self.enabled_quota.id, amount)
+        results = place_bets(
+            self.user,
+            [
+                (self.enabled_quota.id, Decimal(51)),
+                (self.enabled_quota.id, Decimal(20)),
+            ],
+        )
+        self.assertEqual(
+            results[0].error, "The amount can not be greater than 50."
+        )
+        self.assertIsNotNone(results[1].bet)
+
+        with CaptureQueriesContext(connection) as context:
+            place_bet_by_event(self.user, self.enabled_event.id, Decimal(30))
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in context.captured_queries
+                    if "SAVEPOINT" not in query["sql"]
+                ]
+            ),
+            5,
+        )
+        with self.assertRaisesMessage(
+            PlacementError, "The bet exceeds the limits of the user."
+        ):
+            place_bet_by_quota(self.user, self.enabled_quota.id, Decimal(20))
+        with self.assertRaisesMessage(
+            PlacementError, "The bet slip exceeds the limits of the user."
+        ):
+            place_bets(
+                self.user,
+                [(self.enabled_quota.id, Decimal(5))] * 3,
+            )
+        self.assertEqual(
+            get_exposure("user", self.user.id), (2, Decimal(50), ANY)
+        )
+        self.assertEqual(Bet.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(get_balance(self.user), Decimal(-50))
+
+        QuotaExposure.objects.filter(quota=self.enabled_quota).update(
+            max_stake=Decimal(55)
+        )
+        place_bet_by_quota(self.user, self.enabled_quota.id, Decimal(5))
+        with self.assertRaisesMessage(
+            PlacementError, "The bet exceeds the limits of the quota."
+        ):
+            place_bet_by_quota(
+                self.user, self.enabled_quota.id, Decimal("0.01")
+            )
+        UserExposure.objects.filter(user=self.user).update(
+            max_stake=Decimal(100)
+        )
+        QuotaExposure.objects.filter(quota=self.enabled_quota).update(
+            max_stake=None
+        )
+        place_bet_by_quota(self.user, self.enabled_quota.id, Decimal(45))
+        self.assertEqual(
+            get_exposure("user", self.user.id), (4, Decimal(100), ANY)
+        )
+
+        # A raised limit applies to the whole slip, even above the default
+        UserExposure.objects.filter(user=self.user).update(
+            max_stake=Decimal(1000)
+        )
+        results = place_bets(
+            self.user, [(self.enabled_quota.id, Decimal(40))] * 5
+        )
+        self.assertTrue(all(result.bet for result in results))
+        self.assertEqual(
+            get_exposure("user", self.user.id), (9, Decimal(300), ANY)
+        )
+        call_command("reconcile_exposure", stdout=StringIO())
+
+
+class BenchmarkCommandTest(TestCase):
+    """
+    This class contains tests performed on the commands which generate
+    benchmark datasets and run benchmarks over them.
+    """
+
+    def test_01_seed_load(self):
+        """
+        This test evaluates the dataset generator on a small load, which must
+        be consistent with settlement, the ledger and the exposures, and be
+        the same for the same seed.
+        """
+
+        options = {
+            "users": 30,
+            "managers": 2,
+            "tags": 5,
+            "affairs": 4,
+            "events": 10,
+            "quotas_per_event": 2,
+            "bets": 300,
+            "batch_size": 7,
+            "seed": 3,
+        }
+        bets = Bet.objects.filter(user__username__startswith="load-3-")
+
+        def load():
+            return list(
+                bets.order_by("id").values_list(
+                    "user__username",
+                    "quota__event__name",
+                    "quota__probability",
+                    "transaction__amount",
+                    "transaction__creation_date",
+                    "quota__event__expiration_date",
+                    "won",
+                )
+            )
+
+        with transaction.atomic():
+            call_command("seed_load", stdout=StringIO(), **options)
+            first_load = load()
+            transaction.set_rollback(True)
+        self.assertFalse(bets.exists())
+
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "seed_load",
+                output=output.name,
+                verbosity=2,
+                stdout=out,
+                **options
+            )
+            report = json.load(output)
+        # Dates are generated from a fixed day, not from the current time
+        self.assertEqual(load(), first_load)
+        self.assertIn(
+            "Seeded 30 users, 10 events and 300 bets with seed 3",
+            out.getvalue(),
+        )
+        self.assertIn("bets seeded in ", out.getvalue())
+        self.assertEqual(report["sizes"]["bets"], 300)
+        self.assertEqual(report["date"], "2021-01-01T00:00:00+00:00")
+        self.assertIn("balances", report["steps"])
+
+        events = Event.objects.filter(name__startswith="load-3 event")
+        self.assertEqual(events.count(), 10)
+        self.assertEqual(Quota.objects.filter(event__in=events).count(), 20)
+        self.assertEqual(
+            Quota.objects.filter(event__in=events, active=True).count(),
+            events.filter(active=True).count(),
+        )
+        self.assertTrue(
+            Affair.objects.filter(events__in=events, tags__isnull=False)
+            .distinct()
+            .exists()
+        )
+        self.assertTrue(
+            get_user_model()
+            .objects.filter(username="load-3-0", groups__name=BET_MANAGER)
+            .exists()
+        )
+        self.assertFalse(bets.filter(user__username="load-3-0").exists())
+        # Bets follow the outcome of their Event, and won ones are paid
+        self.assertFalse(
+            bets.filter(quota__event__completed=True).exclude(won=True).exists()
+        )
+        self.assertFalse(
+            bets.filter(quota__event__completed=False)
+            .exclude(won=False)
+            .exists()
+        )
+        self.assertFalse(
+            bets.filter(quota__event__active=True, won__isnull=False).exists()
+        )
+        self.assertFalse(bets.exclude(coeficient=F("quota__coeficient")))
+        self.assertEqual(
+            Prize.objects.filter(
+                bet__in=bets, reward=F("bet__potential_earnings")
+            ).count(),
+            bets.filter(won=True).count(),
+        )
+        call_command("reconcile_ledger", stdout=StringIO())
+        call_command("reconcile_exposure", stdout=StringIO())
+
+        with self.assertRaisesMessage(CommandError, "already loaded"):
+            call_command("seed_load", **options)
+        with transaction.atomic(), patch(
+            "bets.management.commands.seed_load.call_command"
+        ) as flush:
+            call_command(
+                "seed_load",
+                "--date",
+                "2020-06-01",
+                "--flush",
+                stdout=StringIO(),
+                **dict(options, seed=4)
+            )
+            flush.assert_called_once_with(
+                "flush", interactive=False, verbosity=0
+            )
+            placed = Bet.objects.filter(user__username__startswith="load-4-")
+            self.assertTrue(placed.exists())
+            self.assertFalse(
+                placed.filter(
+                    creation_date__gt=datetime(2020, 6, 1, tzinfo=timezone.utc)
+                ).exists()
+            )
+            transaction.set_rollback(True)
+        for invalid, message in (
+            (dict(tags=0), "start from 1"),
+            (dict(batch_size=0), "start from 1"),
+            (dict(bets=-1), "no negative bets"),
+            (dict(managers=0), "no negative bets"),
+            (dict(users=2), "more users than managers"),
+            (dict(settled=1.5), "from 0 to 1"),
+        ):
+            with self.assertRaisesMessage(CommandError, message):
+                call_command("seed_load", **dict(options, **invalid))
+        with self.assertRaises(CommandError):
+            call_command("seed_load", "--date", "2021-13-01")
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("seed_load", users=1)
+
+    def test_02_benchmark_graphql(self):
+        """
+        This test evaluates the end to end GraphQL benchmark command, which
+        must delete the seeded data afterwards and report regressions
+        against a baseline.
+        """
+
+        users = get_user_model().objects.count()
+        options = {
+            "requests": 2,
+            "page_sizes": "1,2",
+            "users": 6,
+            "events": 10,
+            "bets": 40,
+            "seed": 5,
+        }
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_graphql", output=output.name, stdout=out, **options
+            )
+            report = json.load(output)
+        operations = report["operations"]
+        self.assertEqual(len(operations), 16)
+        for name in (
+            "allBetsNested[first=2]",
+            "placeBetByQuota",
+            "placeBetByEvent",
+            "createAffair",
+            "settleEvent",
+        ):
+            self.assertEqual(operations[name]["requests"], 2)
+            self.assertGreater(operations[name]["queries_per_request"], 0)
+            self.assertGreater(operations[name]["throughput"], 0)
+        self.assertIn("createAffair: ", out.getvalue())
+        self.assertEqual(report["regressions"], [])
+        self.assertEqual(get_user_model().objects.count(), users)
+        self.assertFalse(Tag.objects.filter(name__startswith="load-5 "))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as baseline:
+            json.dump(
+                {
+                    "operations": {
+                        "allEvents[first=1]": dict(
+                            operations["allEvents[first=1]"],
+                            p50=0.000001,
+                            queries_per_request=0,
+                        )
+                    }
+                },
+                baseline,
+            )
+            baseline.flush()
+            out = StringIO()
+            with self.assertRaisesMessage(CommandError, "2 regressions"):
+                call_command(
+                    "benchmark_graphql",
+                    baseline=baseline.name,
+                    stdout=out,
+                    **options
+                )
+        self.assertIn("allEvents[first=1]: ", out.getvalue())
+
+        # Operations within the baseline are not regressions
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as baseline:
+            json.dump(
+                {
+                    "operations": {
+                        "allEvents[first=1]": dict(
+                            operations["allEvents[first=1]"],
+                            p50=1000000,
+                            queries_per_request=1000,
+                        )
+                    }
+                },
+                baseline,
+            )
+            baseline.flush()
+            out = StringIO()
+            call_command(
+                "benchmark_graphql",
+                baseline=baseline.name,
+                stdout=out,
+                **options
+            )
+        self.assertNotIn("instead of", out.getvalue())
+
+        # Failed requests stop the benchmark, which still deletes its data
+        with patch.dict(
+            "bets.management.commands.benchmark_graphql.LIST_QUERIES",
+            {"allBets": "query allBets($first: Int) { allBets { unknown } }"},
+        ), self.assertRaisesMessage(CommandError, "unknown"):
+            call_command("benchmark_graphql", stdout=StringIO(), **options)
+        self.assertEqual(get_user_model().objects.count(), users)
+        with self.assertRaisesMessage(CommandError, "no open events"):
+            call_command("benchmark_graphql", **dict(options, users=2))
+        self.assertEqual(get_user_model().objects.count(), users)
+
+        with self.assertRaisesMessage(CommandError, "not loaded"):
+            call_command("benchmark_graphql", existing=True, **options)
+        call_command(
+            "seed_load",
+            users=6,
+            managers=2,
+            tags=5,
+            affairs=2,
+            events=10,
+            bets=40,
+            seed=5,
+            stdout=StringIO(),
+        )
+        out = StringIO()
+        call_command("benchmark_graphql", existing=True, stdout=out, **options)
+        self.assertIn("settleEvent: ", out.getvalue())
+        # Loaded data is kept
+        self.assertTrue(Tag.objects.filter(name__startswith="load-5 "))
+        with self.assertRaisesMessage(CommandError, "already loaded"):
+            call_command("benchmark_graphql", **options)
+
+        for invalid in (dict(page_sizes="1,a"), dict(requests=0)):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_graphql", **invalid)
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_graphql", requests=1)
+
+
+class ExposureLimitConcurrencyTest(TransactionTestCase):
+    serialized_rollback = True
+
+    def place_concurrently(self, placements):
+        """
+        Runs each placement on its own thread and connection, all of them
+        released at once.
+
+        :param placements: List of tuples with a placement function and its
+            arguments
+        :return: Amount of placements which did not exceed any limit
+        """
+
+        barrier = threading.Barrier(len(placements))
+        placed = list()
+
+        def place(function, *args):
+            try:
+                barrier.wait()
+                function(*args)
+                placed.append(args)
+            except PlacementError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=place, args=placement)
+            for placement in placements
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(placed)
+
+    @override_settings(EXPOSURE_LIMITS={"user": {"stake": Decimal(50)}})
+    def test_01_user_limit(self):
+        """
+        This test evaluates that concurrent placements of a User on
+        different Quotas, which do not share any Quota lock, never exceed
+        the limits of the User.
+        """
+
+        user = UserFactory()
+        quotas = [
+            QuotaFactory(active=True, event__active=True) for _ in range(12)
+        ]
+        placements = [
+            (place_bet_by_quota, user, quota.id, Decimal(10))
+            for quota in quotas[:6]
+        ] + [
+            (place_bets, user, [(quota.id, Decimal(5))] * 2)
+            for quota in quotas[6:]
+        ]
+        self.assertEqual(self.place_concurrently(placements), 5)
+        self.assertEqual(get_exposure("user", user.id), (ANY, Decimal(50), ANY))
+        self.assertEqual(get_balance(user), Decimal(-50))
+        call_command("reconcile_exposure", stdout=StringIO())
+
+    def test_02_quota_limit(self):
+        """
+        This test evaluates that concurrent placements of different Users on
+        a Quota never exceed the limits of the Quota, nor the limits of the
+        exposures of the Users.
+        """
+
+        quota = QuotaFactory(active=True, event__active=True)
+        quota.refresh_from_db()
+        users = [UserFactory() for _ in range(10)]
+        UserExposure.objects.create(user=users[0], max_stake=0)
+        placements = [
+            (place_bet_by_quota, user, quota.id, Decimal(10)) for user in users
+        ]
+        limits = {"quota": {"liability": 4 * 10 * quota.coeficient}}
+        with self.settings(EXPOSURE_LIMITS=limits):
+            self.assertEqual(self.place_concurrently(placements), 4)
+        exposure = get_exposure("quota", quota.id)
+        self.assertEqual(exposure, (4, Decimal(40), ANY))
+        self.assertLessEqual(exposure.liability, 4 * 10 * quota.coeficient)
+        self.assertFalse(Bet.objects.filter(user=users[0]).exists())
+        call_command("reconcile_exposure", stdout=StringIO())
+
+
+class BenchmarkConcurrencyTest(TransactionTestCase):
+    serialized_rollback = True
+
+    def test_01_placement_clients(self):
+        """
+        This test evaluates the placement benchmark command with concurrent
+        clients, each of them placing bets through its own connection.
+        """
+
+        bets = Bet.objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_placement",
+                placements=5,
+                clients=3,
+                events=1,
+                users=3,
+                output=output.name,
+                stdout=StringIO(),
+            )
+            report = json.load(output)
+        self.assertEqual(report["clients"], 3)
+        self.assertEqual(report["placements"], 15)
+        self.assertEqual(Bet.objects.count(), bets)
+
+    def test_02_rotation_workers(self):
+        """
+        This test evaluates the quota rotation benchmark command with a
+        client and a repricer running concurrently, each of them through its
+        own connection.
+        """
+
+        quotas = Quota.objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_rotation",
+                duration=0.2,
+                clients=1,
+                repricers=1,
+                events=2,
+                history=2,
+                users=2,
+                output=output.name,
+                stdout=StringIO(),
+            )
+            report = json.load(output)
+        self.assertGreater(report["placements"], 0)
+        self.assertGreater(report["rotations"], 0)
+        self.assertEqual(Quota.objects.count(), quotas)
+
+
+class SubscriptionTest(TestCase):
+    """
+    This class contains tests performed on GraphQL subscriptions served over
+    websockets.
+    """
+
+    def setUp(self):
+        self.bet_manager_group = Group.objects.get(name=BET_MANAGER)
+        self.bet_manager = UserFactory.create(groups=(self.bet_manager_group,))
+        self.event = EventFactory(active=True, manager=self.bet_manager)
+        self.other_event = EventFactory(active=True, manager=self.bet_manager)
+        self.quota = QuotaFactory(
+            event=self.event, active=True, manager=self.bet_manager
+        )
+        self.previous_pubsub = set_pubsub(InProcessPubSub())
+        super().setUp()
+
+    def tearDown(self):
+        set_pubsub(self.previous_pubsub)
+        super().tearDown()
+
+    def save_quota(self, event):
+        with self.captureOnCommitCallbacks(execute=True):
+            QuotaFactory(event=event, active=True, manager=self.bet_manager)
+
+    async def communicate(self, *messages):
+        """
+        Opens a websocket connection, sends the messages and returns the
+        communicator once their replies have been received.
+        """
+
+        communicator = ApplicationCommunicator(
+            GraphQLWebSocketApp(),
+            {
+                "type": "websocket",
+                "path": "/graphql",
+                "subprotocols": ["graphql-ws"],
+            },
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(
+            await communicator.receive_output(5),
+            {"type": "websocket.accept", "subprotocol": "graphql-ws"},
+        )
+        for message in messages:
+            await communicator.send_input(
+                {"type": "websocket.receive", "text": json.dumps(message)}
+            )
+        return communicator
+
+    async def receive(self, communicator):
+        message = await communicator.receive_output(5)
+        return json.loads(message["text"]) if "text" in message else message
+
+    async def run_subscription(self):
+        token = await sync_to_async(get_token)(self.bet_manager)
+        communicator = await self.communicate(
+            {
+                "type": "connection_init",
+                "payload": {"Authorization": "Bearer {}".format(token)},
+            },
+            {
+                "type": "start",
+                "id": "1",
+                "payload": {
+                    "query": """
+                        subscription ($eventId: ID) {
+                            quotaChanged(eventId: $eventId) {
+                                id,
+                                coeficient,
+                                event { id, name }
+                            }
+                        }
+                    """,
+                    "variables": {"eventId": self.event.id},
+                },
+            },
+            {"type": "start", "id": "2", "payload": {"query": "{ hello }"}},
+        )
+        self.assertEqual(
+            await self.receive(communicator), {"type": "connection_ack"}
+        )
+        self.assertEqual((await self.receive(communicator))["id"], "2")
+        self.assertEqual(
+            await self.receive(communicator), {"type": "complete", "id": "2"}
+        )
+
+        # Only changes of the subscribed Event are delivered
+        await sync_to_async(self.save_quota)(self.other_event)
+        await sync_to_async(self.save_quota)(self.event)
+        message = await self.receive(communicator)
+        self.assertEqual(message["id"], "1")
+        self.assertNotIn("errors", message["payload"])
+        quota = message["payload"]["data"]["quotaChanged"]
+        self.assertEqual(quota["event"]["name"], self.event.name)
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps({"type": "stop", "id": "1"}),
+            }
+        )
+        self.assertEqual(
+            await self.receive(communicator), {"type": "complete", "id": "1"}
+        )
+        await sync_to_async(self.save_quota)(self.event)
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps({"type": "connection_terminate"}),
+            }
+        )
+        self.assertEqual(
+            await self.receive(communicator), {"type": "websocket.close"}
+        )
+        await communicator.wait(5)
+
+    async def run_invalid_token(self):
+        communicator = await self.communicate(
+            {
+                "type": "connection_init",
+                "payload": {"Authorization": "Bearer invalid"},
+            }
+        )
+        message = await self.receive(communicator)
+        self.assertEqual(message["type"], "connection_error")
+        self.assertEqual(
+            await self.receive(communicator), {"type": "websocket.close"}
+        )
+        await communicator.wait(5)
+
+    def test_01_quota_subscription(self):
+        """
+        This test evaluates subscribing to the changes of the Quotas of an
+        Event, authenticated with a JSON Web Token.
+        """
+
+        async_to_sync(self.run_subscription)()
+        async_to_sync(self.run_invalid_token)()
+
+    def test_02_published_instances(self):
+        """
+        This test evaluates that saved and repriced Quotas are published
+        once committed, and rebuilt from their messages without queries.
+        """
+
+        messages = list()
+        unsubscribe = get_pubsub().subscribe("quota", messages.append)
+        self.quota.probability = Decimal("0.25")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quota.save()
+            self.assertEqual(messages, list())
+        with self.captureOnCommitCallbacks(execute=True):
+            reprice_event(self.event)
+        unsubscribe()
+        self.assertEqual(len(messages), 2)
+        with self.assertNumQueries(0):
+            quota = deserialize_instance(Quota, messages[-1])
+        self.assertEqual(quota.id, self.quota.id)
+        self.assertEqual(quota.probability, Decimal("0.25"))
+        self.assertEqual(serialize_instance(quota), messages[-1])
+
+        # Subscriptions executed out of a websocket receive the instances
+        # right away
+        instances = list()
+        result = schema.execute(
+            "subscription { quotaChanged { id } }", allow_subscriptions=True
+        )
+        subscription = result.subscribe(on_next=instances.append)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quota.save()
+        subscription.dispose()
+        self.assertEqual(len(instances), 1)
+
+    def test_03_benchmark_subscriptions(self):
+        """
+        This test evaluates the subscriptions benchmark command, both with
+        the in-process hub and through a local broker.
+        """
+
+        for broker in (False, True):
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                call_command(
+                    "benchmark_subscriptions",
+                    subscribers=3,
+                    messages=5,
+                    broker=broker,
+                    output=output.name,
+                    stdout=StringIO(),
+                )
+                report = json.load(output)
+            self.assertEqual(report["deliveries"], 15)
+            self.assertGreater(report["deliveries_per_second"], 0)
+        with self.assertRaises(CommandError):
+            call_command("benchmark_subscriptions", subscribers=0)
+
+        # Deliveries with errors fail the benchmark
+        send_result = GraphQLWebSocketConnection.send_result
+
+        def send_errors(connection, operation_id, result):
+            send_result(
+                connection,
+                operation_id,
+                ExecutionResult(errors=[GraphQLError("Failed")]),
+            )
+
+        stdout = StringIO()
+        with patch.object(
+            GraphQLWebSocketConnection, "send_result", send_errors
+        ), self.assertRaises(CommandError):
+            call_command(
+                "benchmark_subscriptions",
+                subscribers=1,
+                messages=2,
+                stdout=stdout,
+            )
+        call_command(
+            "benchmark_subscriptions", subscribers=1, messages=2, stdout=stdout
+        )
+        self.assertIn("in-process: ", stdout.getvalue())
+
+    def test_04_delivery_errors(self):
+        """
+        This test evaluates that failing publications and broker connections
+        are logged instead of raised on the committing thread.
+        """
+
+        broker = Broker().start()
+        hub = BrokerPubSub(port=broker.port)
+        set_pubsub(hub)
+        with patch.object(hub, "publish", side_effect=OSError), self.assertLogs(
+            "bets.pubsub", level="ERROR"
+        ):
+            self.save_quota(self.event)
+        with self.assertLogs("bets.pubsub", level="ERROR") as logs:
+            broker.stop()
+            hub._reader.join(5)
+        self.assertIn("closed by the broker", logs.output[0])
+        self.assertFalse(hub._reader.is_alive())
+        hub.close()
+
+        # Invalid lines and failing subscribers are skipped
+        broker = Broker().start()
+        hub = BrokerPubSub(port=broker.port)
+        delivered = threading.Event()
+        hub.subscribe("quota", Mock(side_effect=ValueError))
+        hub.subscribe("quota", lambda message: delivered.set())
+        with self.assertLogs("bets.pubsub", level="ERROR") as logs:
+            hub._socket.sendall(b"not json\n{}\n")
+            hub.publish("quota", dict(id=1))
+            self.assertTrue(delivered.wait(5))
+        self.assertEqual(len(logs.output), 3)
+        self.assertIn("Invalid broker message", logs.output[0])
+        self.assertIn("Subscriber of quota failed", logs.output[2])
+        hub.close()
+        broker.stop()
+        hub._reader.join(5)
+
+        # Connections reset by the broker are logged, unless closed already
+        server = socket.create_server(("127.0.0.1", 0))
+        connections = list()
+        for _ in range(2):
+            hub = BrokerPubSub(port=server.getsockname()[1])
+            client, _ = server.accept()
+            client.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+            connections.append((hub, client))
+        connections[1][0].close()
+        with self.assertLogs("bets.pubsub", level="ERROR") as logs:
+            for hub, client in connections:
+                client.close()
+                hub._reader.join(5)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Connection to the broker failed", logs.output[0])
+        connections[0][0].close()
+        server.close()
+
+        # The configured hub is loaded again once unset
+        set_pubsub(None)
+        self.assertIsInstance(get_pubsub(), InProcessPubSub)
+
+    async def run_protocol_errors(self):
+        # Operations before connection_init close the connection
+        communicator = await self.communicate({"type": "start", "id": "1"})
+        message = await self.receive(communicator)
+        self.assertEqual(message["type"], "connection_error")
+        self.assertEqual(
+            await self.receive(communicator), {"type": "websocket.close"}
+        )
+        await communicator.wait(5)
+
+        communicator = await self.communicate(
+            {"type": "connection_init"},
+            {"type": "unknown", "id": "1"},
+            {"type": "start", "id": "2", "payload": {"query": "{ unknown }"}},
+        )
+        self.assertEqual(
+            await self.receive(communicator), {"type": "connection_ack"}
+        )
+        message = await self.receive(communicator)
+        self.assertEqual(message["type"], "error")
+        self.assertEqual(message["payload"]["message"], "Unknown message type.")
+        message = await self.receive(communicator)
+        self.assertNotIn("data", message["payload"])
+        self.assertIn("unknown", message["payload"]["errors"][0]["message"])
+        self.assertEqual(
+            await self.receive(communicator), {"type": "complete", "id": "2"}
+        )
+
+        # Fields of messages which can not be resolved are left null
+        await communicator.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps(
+                    {
+                        "type": "start",
+                        "id": "3",
+                        "payload": {
+                            "query": """
+                                subscription {
+                                    eventChanged { id, affair { id } }
+                                }
+                            """
+                        },
+                    }
+                ),
+            }
+        )
+        self.assertTrue(await communicator.receive_nothing())
+        message = serialize_instance(self.event)
+        await sync_to_async(get_pubsub().publish)(
+            "event", dict(message, affair_id=0)
+        )
+        message = await self.receive(communicator)
+        self.assertEqual(message["id"], "3")
+        self.assertEqual(message["payload"]["data"], {"eventChanged": None})
+        # Deliveries which fail are logged, keeping the connection open
+        with self.assertLogs(
+            "j8bet_backend.graphql.websocket", "ERROR"
+        ) as logs:
+            await sync_to_async(get_pubsub().publish)("event", dict(id="x"))
+            for _ in range(500):
+                if logs.records:
+                    break
+                await asyncio.sleep(0.01)
+        await communicator.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps({"type": "stop", "id": "3"}),
+            }
+        )
+        self.assertEqual(
+            await self.receive(communicator), {"type": "complete", "id": "3"}
+        )
+
+        # Disconnected clients stop their operations
+        await communicator.send_input({"type": "websocket.disconnect"})
+        await communicator.wait(5)
+
+        # Connections closed before being accepted are left right away
+        communicator = ApplicationCommunicator(
+            GraphQLWebSocketApp(), {"type": "websocket", "path": "/graphql"}
+        )
+        await communicator.send_input({"type": "websocket.disconnect"})
+        await communicator.wait(5)
+
+    def test_05_protocol_errors(self):
+        """
+        This test evaluates the replies to messages sent out of order, of
+        unknown types or which can not be resolved, and disconnections.
+        """
+
+        async_to_sync(self.run_protocol_errors)()
+
+    async def run_application(self):
+        from j8bet_backend.asgi import application
+
+        # Websockets on /graphql are served without a subprotocol if the
+        # client does not request it
+        communicator = ApplicationCommunicator(
+            application, {"type": "websocket", "path": "/graphql/"}
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(
+            await communicator.receive_output(5), {"type": "websocket.accept"}
+        )
+        await communicator.send_input({"type": "websocket.disconnect"})
+        await communicator.wait(5)
+
+        communicator = ApplicationCommunicator(
+            application, {"type": "websocket", "path": "/other"}
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(
+            await communicator.receive_output(5), {"type": "websocket.close"}
+        )
+
+        communicator = ApplicationCommunicator(
+            application,
+            {
+                "type": "http",
+                "method": "GET",
+                "path": reverse("graphql_cache"),
+                "headers": [(b"host", b"testserver")],
+                "query_string": b"",
+            },
+        )
+        await communicator.send_input({"type": "http.request"})
+        message = await communicator.receive_output(5)
+        self.assertEqual(message["type"], "http.response.start")
+        # Served by Django, which redirects anonymous users to log in
+        self.assertEqual(message["status"], 302)
+
+        with self.assertRaises(ValueError):
+            await GraphQLWebSocketApp()({"type": "http"}, None, None)
+
+    def test_06_asgi_application(self):
+        """
+        This test evaluates the routing of connections by the ASGI
+        application.
+        """
+
+        async_to_sync(self.run_application)()
+
+
+class DocumentCacheTest(TestCase):
+    """
+    This class contains tests performed on the cache of GraphQL documents
+    and persisted queries of the GraphQL endpoint.
+    """
+
+    def setUp(self):
+        self.query = 'query hello { hello(name: "tester") }'
+        self.hash = query_hash(self.query)
+        document_backend.cache.clear()
+        cache.clear()
+        # AUTHENTICATION_BACKENDS is a set, so the backend is chosen here
+        self.client.force_login(UserFactory(), backend=MODEL_BACKEND)
+        super().setUp()
+
+    def post(self, headers=None, **data):
+        return self.client.post(
+            reverse("graphql"),
+            data,
+            content_type="application/json",
+            **(headers or dict())
+        )
+
+    def test_01_document_cache(self):
+        """
+        This test evaluates that repeated queries are parsed and validated
+        only once.
+        """
+
+        with patch(
+            "j8bet_backend.graphql.documents.validate", wraps=validate
+        ) as validate_mock:
+            for _ in range(3):
+                response = self.post(query=self.query)
+                self.assertEqual(
+                    response.json()["data"], {"hello": "Hello tester!"}
+                )
+        self.assertEqual(validate_mock.call_count, 1)
+        stats = document_backend.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+
+        # Invalid documents keep failing from the cache
+        for _ in range(2):
+            response = self.post(query="{ unknownField }")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(
+                "unknownField", response.json()["errors"][0]["message"]
+            )
+        self.assertEqual(document_backend.cache.stats()["hits"], 3)
+        response = self.post(query="{ hello")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(document_backend.cache), 2)
+
+        staff = UserFactory(is_staff=True)
+        self.client.force_login(staff, backend=MODEL_BACKEND)
+        response = self.client.get(reverse("graphql_cache"))
+        self.assertEqual(response.json()["documents"]["size"], 2)
+
+    def test_02_persisted_queries(self):
+        """
+        This test evaluates automatic persisted queries, which are found by
+        their hash once they have been registered.
+        """
+
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": self.hash}}
+        response = self.post(extensions=extensions)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"][0]["message"], "PersistedQueryNotFound"
+        )
+
+        response = self.post(
+            query=self.query,
+            extensions={"persistedQuery": {"version": 1, "sha256Hash": "0"}},
+        )
+        self.assertEqual(
+            response.json()["errors"][0]["message"],
+            "provided sha does not match query",
+        )
+
+        response = self.post(query=self.query, extensions=extensions)
+        self.assertEqual(response.json()["data"], {"hello": "Hello tester!"})
+        response = self.post(extensions=extensions)
+        self.assertEqual(response.json()["data"], {"hello": "Hello tester!"})
+        response = self.client.get(
+            reverse("graphql"),
+            {"extensions": json.dumps(extensions)},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.json()["data"], {"hello": "Hello tester!"})
+
+        # Other processes find the query on the shared cache
+        document_backend.cache.clear()
+        response = self.post(extensions=extensions)
+        self.assertEqual(response.json()["data"], {"hello": "Hello tester!"})
+
+        # Persisted queries expire, and long queries are not persisted
+        with patch("j8bet_backend.graphql.documents.cache.set") as cache_set:
+            self.post(query=self.query, extensions=extensions)
+        cache_set.assert_called_once_with(
+            ANY, self.query, settings.GRAPHQL_PERSISTED_QUERY_TIMEOUT
+        )
+        with self.settings(GRAPHQL_PERSISTED_QUERY_MAX_LENGTH=10):
+            response = self.post(query=self.query, extensions=extensions)
+        self.assertEqual(
+            response.json()["errors"][0]["message"],
+            "Persisted queries can not be longer than 10 characters.",
+        )
+
+    def test_03_query_cost(self):
+        """
+        This test evaluates that the cost of operations is computed from
+        their page sizes and reported on their extensions, and that
+        operations over the limits are rejected before any resolver runs.
+        """
+
+        AffairFactory.create_batch(3)
+        query = """
+            query affairs($first: Int) {
+                allAffairs(first: $first) {
+                    edges { node { id events(first: 3) { edges {
+                        node { id }
+                    } } } }
+                }
+            }
+        """
+        response = self.post(query=query, variables={"first": 2})
+        self.assertEqual(len(response.json()["data"]["allAffairs"]["edges"]), 2)
+        self.assertEqual(
+            response.json()["extensions"]["cost"],
+            {"requested": 24, "depth": 7, "maximum": 50000},
+        )
+        response = self.post(query=query)
+        self.assertEqual(
+            response.json()["extensions"]["cost"]["requested"], 1200
+        )
+        response = self.post(query=self.query)
+        self.assertEqual(
+            response.json()["extensions"]["cost"],
+            {"requested": 0, "depth": 1, "maximum": 50000},
+        )
+
+        # Unbounded nested connections multiply their maximum page sizes
+        query = """
+            {
+                allAffairs { edges { node { events { edges { node {
+                    quotas { edges { node { bets { edges { node {
+                        prizes { edges { node { reward } } }
+                    } } } } } }
+                } } } } } }
+            }
+        """
+        response = self.post(query=query)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("data", response.json())
+        self.assertIn(
+            "exceeds the maximum of 50000",
+            response.json()["errors"][0]["message"],
+        )
+        document = document_backend.document_from_string(schema, query)
+        with self.assertNumQueries(0):
+            result = document.execute(context_value=RequestFactory().get("/"))
+        self.assertTrue(result.invalid)
+        self.assertGreater(result.extensions["cost"]["requested"], 10**9)
+
+        query = "{ allTags(first: 1) { edges { node { id } } } }"
+        with patch.object(cost_analyzer, "max_depth", 4):
+            self.assertEqual(self.post(query=query).status_code, 200)
+        with patch.object(cost_analyzer, "max_depth", 2):
+            response = self.post(query=query)
+        self.assertEqual(
+            response.json()["errors"][0]["message"],
+            "Query depth 4 exceeds the maximum of 2.",
+        )
+
+    def test_04_query_cost_fragments(self):
+        """
+        This test evaluates that fragments cost the same as their fields,
+        that plain lists are bounded by the maximum page size, and that
+        operations over the cost limit are rejected with their cost.
+        """
+
+        fragments = parse(
+            """
+            query affairs {
+                allAffairs(first: 2) { edges { node {
+                    ...events
+                    ... on AffairType { b: events(first: 3) {
+                        edges { node { id } }
+                    } }
+                    ... { id, __typename }
+                } } }
+            }
+            fragment events on AffairType {
+                a: events(first: 3) { edges { node { id } } }
+            }
+            """
+        )
+        fields = parse(
+            """
+            query affairs {
+                allAffairs(first: 2) { edges { node {
+                    a: events(first: 3) { edges { node { id } } }
+                    b: events(first: 3) { edges { node { id } } }
+                    id
+                    __typename
+                } } }
+            }
+            """
+        )
+        cost = cost_analyzer.operation_cost(schema, fragments)
+        self.assertEqual(cost, cost_analyzer.operation_cost(schema, fields))
+        self.assertEqual(cost, (42, 7))
+        self.assertEqual(
+            cost_analyzer.operation_cost(schema, parse("{ allUsers { id } }")),
+            (100, 2),
+        )
+        self.assertIsNone(argument_value(ast.StringValue(value="2"), None))
+
+        query = print_ast(fragments)
+        with patch.object(cost_analyzer, "max_cost", 41):
+            response = self.post(query=query)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"][0]["message"],
+            "Query cost 42 exceeds the maximum of 41.",
+        )
+        self.assertEqual(
+            response.json()["extensions"]["cost"],
+            {"requested": 42, "depth": 7, "maximum": 41},
+        )
+
+        # Operations which can not be found, or while the analyzer is
+        # disabled, are executed without their cost
+        response = self.post(query=query + "query other { hello }")
+        self.assertIn("operation name", response.json()["errors"][0]["message"])
+        self.assertNotIn("extensions", response.json())
+        with patch.object(cost_analyzer, "enabled", False):
+            response = self.post(query=self.query)
+        self.assertEqual(response.json()["data"], {"hello": "Hello tester!"})
+        self.assertNotIn("extensions", response.json())
+
+    # Installed by GRAPHQL_PROFILING, which defaults to DEBUG
+    @patch(
+        "graphene_django.views.graphene_settings.MIDDLEWARE",
+        [JSONWebTokenMiddleware, ProfilingMiddleware],
+    )
+    def test_05_profiling(self):
+        """
+        This test evaluates that resolvers are profiled by path once the
+        middleware is installed, served as Prometheus metrics, and traced on
+        the requests asking for it.
+        """
+
+        resolver_metrics.reset()
+        TagFactory.create_batch(2)
+        # Cached responses would not run any resolver
+        patcher = patch.object(response_cache, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        query = "{ allTags(first: 2) { edges { node { id name } } } }"
+        for _ in range(2):
+            response = self.post(
+                query=query, headers={"HTTP_X_GRAPHQL_TRACE": "1"}
+            )
+            self.assertNotIn("trace", response.json()["extensions"])
+
+        response = self.client.get(reverse("graphql_metrics"))
+        self.assertEqual(response.status_code, 403)
+        with self.settings(METRICS_TOKEN="secret"):
+            response = self.client.get(
+                reverse("graphql_metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+        self.assertEqual(response.status_code, 200)
+        metrics = response.content.decode()
+        self.assertIn(
+            'graphql_resolver_duration_seconds_count{path="allTags"} 2',
+            metrics,
+        )
+        self.assertIn(
+            'graphql_resolver_queries_count{path="allTags.edges.node"} 4',
+            metrics,
+        )
+        self.assertIn(
+            'graphql_resolver_queries_sum{path="allTags.edges.node"} 0',
+            metrics,
+        )
+        self.assertIn(
+            'graphql_resolver_queries_bucket{path="allTags.edges.node",'
+            'le="0"} 4',
+            metrics,
+        )
+        self.assertNotIn('path="allTags.edges.node.name"', metrics)
+        self.assertIn("graphql_documents_cache_hits_total 1", metrics)
+
+        staff = UserFactory(is_staff=True)
+        self.client.force_login(staff, backend=MODEL_BACKEND)
+        response = self.post(query=query, headers={"HTTP_X_GRAPHQL_TRACE": "1"})
+        resolvers = response.json()["extensions"]["trace"]["resolvers"]
+        self.assertEqual(resolvers[0]["path"], ["allTags"])
+        self.assertGreaterEqual(resolvers[0]["queries"], 1)
+        self.assertIn(
+            ["allTags", "edges", 1, "node"],
+            [resolver["path"] for resolver in resolvers],
+        )
+        self.assertEqual(
+            self.client.get(reverse("graphql_metrics")).status_code, 200
+        )
+
+        # Synchronous resolvers are recorded right away, values over every
+        # bucket are only counted, and paths over the maximum are added up
+        resolver_metrics.reset()
+        info = Mock(path=["hello"], context=None)
+        self.assertEqual(
+            ProfilingMiddleware().resolve(lambda root, info: "hi", None, info),
+            "hi",
+        )
+        self.assertIn(
+            'graphql_resolver_duration_seconds_count{path="hello"} 1',
+            resolver_metrics.render(),
+        )
+        metrics = ResolverMetrics(1)
+        metrics.observe("first", 10, 200, 10)
+        metrics.observe("second", 10, 200, 10)
+        lines = metrics.render()
+        self.assertIn(
+            'graphql_resolver_queries_bucket{path="first",le="100"} 0', lines
+        )
+        self.assertIn('graphql_resolver_queries_count{path="first"} 1', lines)
+        self.assertIn(
+            'graphql_resolver_queries_count{path="__other__"} 1', lines
+        )
+
+    def test_06_persisted_query_errors(self):
+        """
+        This test evaluates the errors of invalid persisted queries, and
+        that evicted queries are found on the shared cache until it loses
+        them too.
+        """
+
+        for extensions, message in (
+            ("{", "Extensions are invalid JSON."),
+            (
+                {"persistedQuery": {"version": 2, "sha256Hash": self.hash}},
+                "Unsupported persisted query version.",
+            ),
+            (
+                {"persistedQuery": {"version": 1, "sha256Hash": "0"}},
+                "PersistedQueryNotFound",
+            ),
+        ):
+            response = self.post(extensions=extensions)
+            self.assertEqual(response.status_code, 400)
+            self.assertNotIn("data", response.json())
+            self.assertEqual(response.json()["errors"][0]["message"], message)
+        response = self.post(extensions={"persistedQuery": {"version": 1}})
+        self.assertEqual(
+            response.json()["errors"][0]["message"], "PersistedQueryNotFound"
+        )
+
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": self.hash}}
+        with patch.object(document_backend.cache, "size", 1):
+            self.post(query=self.query, extensions=extensions)
+            self.post(query="{ hello }")
+            self.assertEqual(document_backend.cache.stats()["evictions"], 1)
+            response = self.post(extensions=extensions)
+            self.assertEqual(
+                response.json()["data"], {"hello": "Hello tester!"}
+            )
+            self.post(query="{ hello }")
+            cache.clear()
+            response = self.post(extensions=extensions)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"][0]["extensions"],
+            {"code": "PERSISTED_QUERY_NOT_FOUND"},
+        )
+
+        # Parsed documents are not cached by their hash
+        document = document_backend.document_from_string(
+            schema, parse(self.query)
+        )
+        request = RequestFactory().get("/")
+        request.user = UserFactory()
+        result = document.execute(context_value=request)
+        self.assertEqual(result.data, {"hello": "Hello tester!"})
+        self.assertEqual(len(document_backend.cache), 1)
+
+        # Batches report the status of each operation
+        view = PersistedQueryGraphQLView.as_view(batch=True)
+        request = RequestFactory().post(
+            reverse("graphql"),
+            [{"query": self.query, "id": 1}, {"query": "{ hello"}],
+            content_type="application/json",
+        )
+        request.user = UserFactory()
+        response = json.loads(view(request).content)
+        self.assertEqual(response[0]["id"], 1)
+        self.assertEqual(response[0]["status"], 200)
+        self.assertEqual(response[1]["status"], 400)
+
+
+class RepeatedQueryTest(TestCase):
+    """
+    This class contains tests performed on the detector of GraphQL
+    operations which repeat the same SQL statement.
+    """
+
+    query = "{ allEvents(first: 3) { edges { node { id affair { id } } } } }"
+
+    def setUp(self):
+        EventFactory.create_batch(3)
+        self.backend = RepeatedQueryBackend()
+        for name, value in (("threshold", 2), ("raise_errors", True)):
+            patcher = patch.object(repeated_query_detector, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def execute(self):
+        document = self.backend.document_from_string(schema, self.query)
+        return document.execute(context_value=RequestFactory().get("/"))
+
+    def test_01_statement_shape(self):
+        """
+        This test evaluates that statements sent with different parameters
+        have the same shape.
+        """
+
+        self.assertEqual(
+            statement_shape(
+                'SELECT "id" FROM "bets_event"\n WHERE "id" IN (%s, %s)'
+                " LIMIT 21"
+            ),
+            'SELECT "id" FROM "bets_event" WHERE "id" IN (%s, ...) LIMIT ?',
+        )
+        self.assertEqual(
+            statement_shape('SELECT "id" FROM "a" WHERE "id" IN (%s, %s, %s)'),
+            statement_shape('SELECT "id" FROM "a" WHERE "id" IN (%s, %s)'),
+        )
+
+    def test_02_repeated_queries(self):
+        """
+        This test evaluates that batched operations pass the detector, while
+        operations which query once per object fail with the path of the
+        resolver sending the statements.
+        """
+
+        result = self.execute()
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data["allEvents"]["edges"]), 3)
+
+        # Middleware given as a manager still runs along the detector
+        paths = list()
+
+        def record(next, root, info, **args):
+            paths.append(info.path)
+            return next(root, info, **args)
+
+        document = self.backend.document_from_string(schema, self.query)
+        result = document.execute(
+            context_value=RequestFactory().get("/"),
+            middleware=MiddlewareManager(record),
+        )
+        self.assertIsNone(result.errors)
+        self.assertIn(["allEvents"], paths)
+
+        # Without select_related nor shared DataLoaders, each affair is
+        # fetched on its own
+        with patch(
+            "bets.graphql.fields.optimize_queryset",
+            lambda queryset, info, **kwargs: queryset,
+        ), patch("bets.graphql.loaders.get_loaders", lambda info: Loaders()):
+            with self.assertRaisesMessage(
+                RepeatedQueriesError,
+                "3 statements from allEvents.edges.node.affair: SELECT",
+            ):
+                self.execute()
+            with patch.object(repeated_query_detector, "threshold", 3):
+                self.assertIsNone(self.execute().errors)
+            with patch.object(
+                repeated_query_detector, "raise_errors", False
+            ), self.assertLogs(
+                "j8bet_backend.graphql.repeated_queries", "WARNING"
+            ):
+                self.assertIsNone(self.execute().errors)
+
+
+class ResponseCacheTest(TestCase):
+    """
+    This class contains tests performed on the response cache of catalog
+    queries.
+    """
+
+    def setUp(self):
+        self.bet_manager_group = Group.objects.get(name=BET_MANAGER)
+        self.bet_manager = UserFactory.create(groups=(self.bet_manager_group,))
+        self.event = EventFactory(active=True, manager=self.bet_manager)
+        self.quota = QuotaFactory(
+            event=self.event, active=True, manager=self.bet_manager
+        )
+        self.tag = TagFactory()
+        self.quotas_query = """
+            query quotas {
+                allQuotas(active: true) {
+                    edges { node { id, coeficient, event { name } } }
+                }
+            }
+        """
+        document_backend.cache.clear()
+        response_cache.reset()
+        cache.clear()
+        super().setUp()
+
+    def post(self, query, **variables):
+        response = self.client.post(
+            reverse("graphql"),
+            {"query": query, "variables": variables},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_01_catalog_operations(self):
+        """
+        This test evaluates that only queries listing catalog models are
+        cached.
+        """
+
+        self.assertEqual(
+            catalog_operations(schema, parse(self.quotas_query)),
+            {"quotas": ("bets.Event", "bets.Quota")},
+        )
+        for query in (
+            """{
+                allQuotas { edges { node {
+                    bets { edges { node { id } } }
+                } } }
+            }""",
+            "{ allQuotas { edges { node { manager { id } } } } }",
+            "{ allTags { edges { node { id } } }, hello }",
+            "{ allTags { edges { node { id } } }, __schema { __typename } }",
+            "mutation { deleteQuota(id: 1) { ok } }",
+            "{ allTags { edges { node { __type { name } } } } }",
+        ):
+            self.assertEqual(catalog_operations(schema, parse(query)), dict())
+        self.assertEqual(
+            catalog_operations(
+                schema,
+                parse(
+                    """
+                    query tags {
+                        allTags { edges { node {
+                            ... on TagType { name }
+                            ... { id, __typename }
+                        } } }
+                    }
+                    """
+                ),
+            ),
+            {"tags": ("bets.Tag",)},
+        )
+
+        # Abstract types could resolve to models out of the catalog
+        class Named(Interface):
+            name = String()
+
+        class Query(ObjectType):
+            all_tags = Field(Named)
+
+        self.assertEqual(
+            catalog_operations(
+                Schema(query=Query), parse("{ allTags { name } }")
+            ),
+            dict(),
+        )
+        self.assertEqual(
+            catalog_operations(
+                schema,
+                parse(
+                    """
+                    query tags { allTags { ...tags } }
+                    query other { hello }
+                    fragment tags on TagTypeConnection {
+                        edges { node { name } }
+                    }
+                    """
+                ),
+            ),
+            {"tags": ("bets.Tag",)},
+        )
+
+    def test_02_cached_responses(self):
+        """
+        This test evaluates that catalog responses are served from the
+        cache until the models they list change.
+        """
+
+        first = self.post(self.quotas_query)
+        self.assertNotIn("errors", first)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post(self.quotas_query), first)
+        self.assertEqual(response_cache.stats(), {"hits": 1, "misses": 1})
+
+        # Changes are seen once committed
+        QuotaFactory(event=self.event, active=True, manager=self.bet_manager)
+        self.assertEqual(self.post(self.quotas_query), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            QuotaFactory(
+                event=self.event, active=True, manager=self.bet_manager
+            )
+        self.assertNotEqual(self.post(self.quotas_query), first)
+
+        # Quotas closed along with their Event are invalidated as well
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.active = False
+            self.event.save()
+        self.assertEqual(
+            self.post(self.quotas_query)["data"]["allQuotas"], {"edges": []}
+        )
+
+        tags_query = "{ allTags { edges { node { name } } } }"
+        tags = self.post(tags_query)
+        affair = AffairFactory()
+        with self.captureOnCommitCallbacks(execute=True):
+            affair.tags.add(self.tag)
+        self.assertEqual(response_cache.stats()["misses"], 4)
+        self.assertEqual(self.post(tags_query), tags)
+        self.assertEqual(response_cache.stats()["misses"], 5)
+
+        # Other variables are cached on their own
+        events_query = """
+            query events($name: String) {
+                allEvents(name: $name) { edges { node { name } } }
+            }
+        """
+        events = self.post(events_query, name=self.event.name)["data"]
+        self.assertEqual(len(events["allEvents"]["edges"]), 1)
+        self.assertEqual(
+            self.post(events_query, name="unknown")["data"]["allEvents"],
+            {"edges": []},
+        )
+
+    def test_03_invalidation(self):
+        """
+        This test evaluates that mutations invalidate the cached responses
+        listing their models, and that a disabled cache always executes
+        the operations.
+        """
+
+        self.client.force_login(self.bet_manager, backend=MODEL_BACKEND)
+        first = self.post(self.quotas_query)
+        self.assertEqual(self.post(self.quotas_query), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = self.post(
+                "mutation { deleteQuota(id: %d) { deleted } }" % self.quota.id
+            )
+        self.assertTrue(deleted["data"]["deleteQuota"]["deleted"])
+        self.assertEqual(response_cache.stats(), {"hits": 1, "misses": 1})
+        self.assertEqual(
+            self.post(self.quotas_query)["data"]["allQuotas"], {"edges": []}
+        )
+        self.assertEqual(response_cache.stats(), {"hits": 1, "misses": 2})
+
+        self.client.logout()
+        with patch.object(response_cache, "enabled", False):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    self.post(self.quotas_query)
+        self.assertEqual(response_cache.stats(), {"hits": 1, "misses": 2})
+
+        # Operations of documents with several ones are cached by name
+        query = """
+            query tags { allTags { edges { node { name } } } }
+            query other { hello(name: "tester") }
+        """
+        for _ in range(2):
+            response = self.client.post(
+                reverse("graphql"),
+                {"query": query, "operationName": "tags"},
+                content_type="application/json",
+            )
+            self.assertEqual(
+                response.json()["data"]["allTags"]["edges"],
+                [{"node": {"name": self.tag.name}}],
+            )
+        self.assertEqual(response_cache.stats(), {"hits": 2, "misses": 3})
+
+        # Responses with errors are never cached
+        query = """
+            query tags($first: Int) {
+                allTags(first: $first) { edges { node { name } } }
+            }
+        """
+        for _ in range(2):
+            response = self.client.post(
+                reverse("graphql"),
+                {"query": query, "variables": {"first": 101}},
+                content_type="application/json",
+            )
+            self.assertIn("exceeds", response.json()["errors"][0]["message"])
+        self.assertEqual(response_cache.stats(), {"hits": 2, "misses": 5})
+
+    def test_04_benchmark_catalog(self):
+        """
+        This test evaluates the catalog benchmark command, which must delete
+        the seeded data afterwards.
+        """
+
+        events = Event.objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_catalog",
+                requests=3,
+                events=2,
+                output=output.name,
+                stdout=StringIO(),
+            )
+            report = json.load(output)
+        self.assertEqual(
+            set(report["queries"]),
+            {"allTags", "allAffairs", "allEvents", "allQuotas"},
+        )
+        for query in report["queries"].values():
+            self.assertEqual(query["hit_queries_per_request"], 0)
+            self.assertGreater(query["db_queries_per_request"], 0)
+        self.assertTrue(response_cache.enabled)
+        self.assertEqual(Event.objects.count(), events)
+
+        stdout = StringIO()
+        call_command("benchmark_catalog", requests=1, events=1, stdout=stdout)
+        self.assertIn("allTags: ", stdout.getvalue())
+        with patch.dict(
+            "bets.management.commands.benchmark_catalog.CATALOG_QUERIES",
+            {"allTags": "{ allTags"},
+            clear=True,
+        ), self.assertRaisesMessage(CommandError, "Syntax Error"):
+            call_command("benchmark_catalog", requests=1, events=1)
+        self.assertEqual(Event.objects.count(), events)
+        with self.assertRaises(CommandError):
+            call_command("benchmark_catalog", requests=0)
+        with patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_catalog")
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.affair = AffairFactory(
+            description="Campeonato de liga de fútbol profesional"
+        )
+        self.name_event = EventFactory(
+            affair=self.affair,
+            name="Partido entre Barcelona y Sevilla",
+            description="Se decide el título",
+        )
+        self.description_event = EventFactory(
+            affair=self.affair,
+            name="Final de temporada",
+            description="Último partido del campeonato",
+        )
+        self.other_event = EventFactory(
+            name="Carrera de caballos", description="Gran premio anual"
+        )
+
+    def hit_nodes(self, hits):
+        return [hit.node for hit in hits]
+
+    def test_01_full_text_search(self):
+        """
+        This test evaluates the PostgreSQL search, which matches stemmed
+        Spanish words, ranks names above descriptions and finds parts of
+        words through the trigram indexes.
+        """
+
+        hits = search("partidos")
+        self.assertEqual(
+            self.hit_nodes(hits), [self.name_event, self.description_event]
+        )
+        self.assertGreater(hits[0].rank, hits[1].rank)
+        self.assertEqual(
+            self.hit_nodes(search("campeonatos")),
+            [self.description_event, self.affair],
+        )
+        self.assertEqual(self.hit_nodes(search("Barcel")), [self.name_event])
+        self.assertEqual(len(search("partido", limit=1)), 1)
+        self.assertEqual(search("   "), [])
+
+        # Search vectors follow the changes of each row
+        self.other_event.name = "Partido de tenis"
+        self.other_event.save()
+        self.assertIn(self.other_event, self.hit_nodes(search("partidos")))
+
+        # The timeout of the search does not outlast it
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = '5s'")
+            search("partidos")
+            cursor.execute("SHOW statement_timeout")
+            self.assertEqual(cursor.fetchone(), ("5s",))
+
+    def test_02_fallback_search(self):
+        """
+        This test evaluates the search used on databases without text
+        search, which requires every word and ranks by the matched fields.
+        """
+
+        hits = search_fallback("partido", 10)
+        self.assertEqual(
+            self.hit_nodes(hits), [self.name_event, self.description_event]
+        )
+        self.assertEqual(hits[0].rank, 1.0)
+        self.assertEqual(
+            self.hit_nodes(search_fallback("partido barcelona", 10)),
+            [self.name_event],
+        )
+        self.assertEqual(
+            self.hit_nodes(search_fallback("campeonato", 1)),
+            [self.description_event],
+        )
+
+    def test_03_search_query(self):
+        """
+        This test evaluates the search query of the GraphQL API.
+        """
+
+        result = schema.execute(
+            """
+            query search($query: String!) {
+                search(query: $query) {
+                    rank
+                    node {
+                        id
+                        ... on EventType { name }
+                        ... on AffairType { description }
+                    }
+                }
+            }
+            """,
+            variables={"query": "campeonato"},
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [hit["node"] for hit in result.data["search"]],
+            [
+                {
+                    "id": Node.to_global_id(
+                        "EventType", self.description_event.id
+                    ),
+                    "name": self.description_event.name,
+                },
+                {
+                    "id": Node.to_global_id("AffairType", self.affair.id),
+                    "description": self.affair.description,
+                },
+            ],
+        )
+
+    def test_04_search_timeout(self):
+        """
+        This test evaluates that searches over the statement timeout are
+        cancelled and reported to the client, and that other databases use
+        the fallback search.
+        """
+
+        def slow_search(execute, sql, params, many, context):
+            if sql.startswith('SELECT "bets_'):
+                return execute("SELECT pg_sleep(1)", None, many, context)
+            return execute(sql, params, many, context)
+
+        query = 'query { search(query: "partidos") { rank } }'
+        with self.settings(SEARCH_TIMEOUT=10), connection.execute_wrapper(
+            slow_search
+        ):
+            with self.assertRaises(SearchTimeout):
+                search("partidos")
+            result = schema.execute(query)
+        self.assertEqual(
+            result.errors[0].message,
+            "The search took too long, try a more specific query.",
+        )
+        self.assertIsNone(result.data["search"])
+        self.assertEqual(len(schema.execute(query).data["search"]), 2)
+
+        def failing_search(execute, sql, params, many, context):
+            raise OperationalError("Connection lost")
+
+        with connection.execute_wrapper(failing_search):
+            with self.assertRaisesMessage(OperationalError, "Connection lost"):
+                search("partidos")
+
+        with patch.object(connection, "vendor", "sqlite"):
+            self.assertEqual(
+                self.hit_nodes(search("partido barcelona")), [self.name_event]
+            )
+
+
+class MigrationTest(TransactionTestCase):
+    """
+    This class contains tests performed on data migrations.
+    """
+
+    serialized_rollback = True
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("bets", target)])
+        return executor.loader.project_state(("bets", target)).apps
+
+    def test_01_tag_normalized_name(self):
+        """
+        This test evaluates that Tags whose names only differ on case or
+        spacing are merged when their normalized names are added.
+        """
+
+        apps = self.migrate("0010_keyset_indexes")
+        try:
+            Tag = apps.get_model("bets", "Tag")
+            Affair = apps.get_model("bets", "Affair")
+            manager = apps.get_model("users", "User").objects.create(
+                username="migration-manager"
+            )
+            tags = [
+                Tag.objects.create(name=name)
+                for name in ("Fútbol", " fútbol ", "FÚTBOL", "Tenis")
+            ]
+            affairs = [
+                Affair.objects.create(manager=manager, description=str(number))
+                for number in range(2)
+            ]
+            affairs[0].tags.add(tags[0], tags[1])
+            affairs[1].tags.add(tags[2], tags[3])
+
+            apps = self.migrate("0011_tag_normalized_name")
+            Tag = apps.get_model("bets", "Tag")
+            Affair = apps.get_model("bets", "Affair")
+            self.assertEqual(
+                list(
+                    Tag.objects.order_by("id").values_list(
+                        "id", "normalized_name"
+                    )
+                ),
+                [(tags[0].id, "fútbol"), (tags[3].id, "tenis")],
+            )
+            for affair, tag_ids in zip(
+                affairs, ([tags[0].id], [tags[0].id, tags[3].id])
+            ):
+                self.assertEqual(
+                    list(
+                        Affair.objects.get(id=affair.id)
+                        .tags.order_by("id")
+                        .values_list("id", flat=True)
+                    ),
+                    tag_ids,
+                )
+        finally:
+            loader = MigrationLoader(connection)
+            self.migrate(loader.graph.leaf_nodes("bets")[0][1])
+
+    def test_02_bet_coeficient(self):
+        """
+        This test evaluates that placed Bets take the coefficient their
+        potential earnings were calculated with, even if their Quota was
+        repriced afterwards.
+        """
+
+        apps = self.migrate("0014_exposure_limits")
+        try:
+            user = apps.get_model("users", "User").objects.create(
+                username="migration-user"
+            )
+            affair = apps.get_model("bets", "Affair").objects.create(
+                manager=user, description="Affair"
+            )
+            event = apps.get_model("bets", "Event").objects.create(
+                manager=user,
+                affair=affair,
+                name="Event",
+                description="Event",
+                expiration_date=timezone.now(),
+            )
+            quota = apps.get_model("bets", "Quota").objects.create(
+                manager=user,
+                event=event,
+                probability=Decimal("0.5"),
+                coeficient=Decimal(2),
+                expiration_date=timezone.now(),
+            )
+            Transaction = apps.get_model("bets", "Transaction")
+            Bet = apps.get_model("bets", "Bet")
+            bets = [
+                Bet.objects.create(
+                    transaction=Transaction.objects.create(
+                        user=user, amount=amount, description="Bet placement"
+                    ),
+                    quota=quota,
+                    user=user,
+                    potential_earnings=potential_earnings,
+                )
+                for amount, potential_earnings in (
+                    (Decimal(10), Decimal(30)),
+                    (Decimal(0), Decimal(0)),
+                )
+            ]
+
+            apps = self.migrate("0015_bet_coeficient")
+            Bet = apps.get_model("bets", "Bet")
+            self.assertEqual(
+                [Bet.objects.get(id=bet.id).coeficient for bet in bets],
+                [Decimal(3), Decimal(2)],
+            )
+        finally:
+            loader = MigrationLoader(connection)
+            self.migrate(loader.graph.leaf_nodes("bets")[0][1])
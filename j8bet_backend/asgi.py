@@ -0,0 +1,30 @@
+"""
+ASGI config for j8bet_backend project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``. Websocket connections to /graphql are served by
+GraphQLWebSocketApp, everything else by Django.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "j8bet_backend.settings")
+
+django_application = get_asgi_application()
+
+# Imported once Django is set up, since it loads the models
+from j8bet_backend.graphql.websocket import GraphQLWebSocketApp  # noqa: E402
+
+graphql_websocket_application = GraphQLWebSocketApp()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        if scope["path"].rstrip("/") == "/graphql":
+            return await graphql_websocket_application(scope, receive, send)
+        # Other websocket paths are rejected
+        await receive()
+        return await send({"type": "websocket.close"})
+    return await django_application(scope, receive, send)
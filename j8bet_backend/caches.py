@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedCache:
+    """
+    Bounded, thread safe LRU cache kept in process. Entries may expire after
+    a timeout, and hits, misses and evictions are counted for monitoring.
+
+    :cvar size: Maximum amount of entries kept in the cache
+    :cvar timeout: Seconds after which an entry expires, or None if entries
+        are kept until they are evicted or invalidated
+    """
+
+    def __init__(self, size, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        """
+        Returns the value of a key, or None if it is missing or expired.
+        Must be called holding the lock.
+        """
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < now:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def get_many(self, keys):
+        """
+        Returns the cached values of some keys, by key.
+        """
+
+        found = dict()
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                value = self._get(key, now)
+                if value is not None:
+                    found[key] = value
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        """
+        Caches some values.
+
+        :param values: Dictionary with the value of each key
+        """
+
+        expiration = None
+        if self.timeout is not None:
+            expiration = time.monotonic() + self.timeout
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, expiration)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys=None):
+        """
+        Removes the entries of some keys, or every entry if None is given.
+        """
+
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Returns the counters of the cache, along with its size.
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.size,
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,5 +1,6 @@
 from bets.graphql.schema import Mutations as BetsMutations
 from bets.graphql.schema import Queries as BetsQueries
+from bets.graphql.schema import Subscriptions as BetsSubscriptions
 from graphene_federation import build_schema
 from users.graphql.schema import Mutation as UserMutations
 from users.graphql.schema import Query as UserQueries
@@ -17,4 +18,8 @@ class Mutation(
     pass
 
 
-schema = build_schema(Query, mutation=Mutation)
+class Subscription(BetsSubscriptions,):
+    pass
+
+
+schema = build_schema(Query, mutation=Mutation, subscription=Subscription)
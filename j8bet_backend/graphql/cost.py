@@ -0,0 +1,263 @@
+from django.conf import settings
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, get_named_type
+
+# Cost of resolving a field once, for the fields which cost more than
+# fetching an object. Other fields returning objects cost 1, and scalars 0
+FIELD_COSTS = {
+    "Query.search": 10,
+}
+
+# Arguments which bound the amount of objects returned by a list field
+PAGE_ARGUMENTS = ("first", "last", "limit")
+
+
+class QueryCostError(GraphQLError):
+    """
+    Raised when an operation exceeds GRAPHQL_MAX_COST or GRAPHQL_MAX_DEPTH.
+    """
+
+
+def is_list(field_type):
+    while isinstance(field_type, GraphQLNonNull):
+        field_type = field_type.of_type
+    return isinstance(field_type, GraphQLList)
+
+
+def is_connection(object_type):
+    graphene_type = getattr(object_type, "graphene_type", None)
+    return isinstance(graphene_type, type) and issubclass(
+        graphene_type, Connection
+    )
+
+
+def argument_value(value, variable_values):
+    """
+    Returns the value of an argument node, or None if it is not an integer.
+    """
+
+    if isinstance(value, ast.Variable):
+        value = (variable_values or dict()).get(value.name.value)
+        return value if isinstance(value, int) else None
+    if isinstance(value, ast.IntValue):
+        return int(value.value)
+    return None
+
+
+class QueryCostAnalyzer:
+    """
+    Static analyzer of the cost and depth of GraphQL operations, run on
+    validated documents before any resolver. Every field returning objects
+    costs its FIELD_COSTS, plus the cost of its selections, times the amount
+    of objects it may return: the first, last or limit given to it, or the
+    maximum page size of connections when it is unbounded.
+
+    :cvar max_cost: Maximum cost of an operation
+    :cvar max_depth: Maximum nesting of the fields of an operation
+    """
+
+    def __init__(self, max_cost, max_depth):
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+        self.enabled = True
+
+    def page_size(self, parent_type, field_def, field, variable_values):
+        """
+        Returns the maximum amount of objects returned by a field.
+        """
+
+        max_size = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        sizes = [
+            argument_value(argument.value, variable_values)
+            for argument in field.arguments
+            if argument.name.value in PAGE_ARGUMENTS
+        ]
+        sizes = [size for size in sizes if size is not None and size >= 0]
+        if sizes:
+            return min(sizes + [max_size])
+        if any(name in field_def.args for name in PAGE_ARGUMENTS):
+            return max_size
+        # Edges are bounded by the page size of their connection
+        if is_list(field_def.type) and not is_connection(parent_type):
+            return max_size
+        return 1
+
+    def selection_cost(
+        self, schema, fragments, parent_type, selection_set, variable_values
+    ):
+        """
+        Returns the cost and the depth of a selection set.
+        """
+
+        cost = 0
+        depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = fragments[selection.name.value]
+                fragment_type = schema.get_type(
+                    fragment.type_condition.name.value
+                )
+                fragment_selections = fragment.selection_set
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = (
+                    schema.get_type(selection.type_condition.name.value)
+                    if selection.type_condition
+                    else parent_type
+                )
+                fragment_selections = selection.selection_set
+            else:
+                fragment_type = None
+            if fragment_type is not None:
+                # Fragments on other types are added up as an upper bound
+                fragment_cost, fragment_depth = self.selection_cost(
+                    schema,
+                    fragments,
+                    fragment_type,
+                    fragment_selections,
+                    variable_values,
+                )
+                cost += fragment_cost
+                depth = max(depth, fragment_depth)
+                continue
+            name = selection.name.value
+            # Introspection is not resolved from the database
+            if name.startswith("__"):
+                continue
+            if not selection.selection_set:
+                depth = max(depth, 1)
+                continue
+            field_def = parent_type.fields[name]
+            field_cost, field_depth = self.selection_cost(
+                schema,
+                fragments,
+                get_named_type(field_def.type),
+                selection.selection_set,
+                variable_values,
+            )
+            field_cost += FIELD_COSTS.get(
+                "{}.{}".format(parent_type.name, name), 1
+            )
+            cost += field_cost * self.page_size(
+                parent_type, field_def, selection, variable_values
+            )
+            depth = max(depth, field_depth + 1)
+        return cost, depth
+
+    def operation_cost(
+        self, schema, document_ast, operation_name=None, variable_values=None
+    ):
+        """
+        Returns the cost and the depth of an operation of a valid document.
+
+        :return: Tuple with the cost and the depth, or None if the document
+            does not have the operation
+        """
+
+        operations = [
+            definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.OperationDefinition)
+        ]
+        if operation_name is None and len(operations) == 1:
+            operation = operations[0]
+        else:
+            operation = next(
+                (
+                    definition
+                    for definition in operations
+                    if definition.name
+                    and definition.name.value == operation_name
+                ),
+                None,
+            )
+        if operation is None:
+            return None
+        root_type = {
+            "query": schema.get_query_type,
+            "mutation": schema.get_mutation_type,
+            "subscription": schema.get_subscription_type,
+        }[operation.operation]()
+        fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+        return self.selection_cost(
+            schema,
+            fragments,
+            root_type,
+            operation.selection_set,
+            variable_values,
+        )
+
+    def wrap(self, schema, document_ast, execute):
+        """
+        Returns an execute function for a validated document which rejects
+        operations over the limits before executing them, and reports the
+        cost of the executed ones on the cost extension of their results.
+        """
+
+        def execute_analyzed(
+            root_value=None,
+            context_value=None,
+            operation_name=None,
+            variable_values=None,
+            **options
+        ):
+            analysis = self.operation_cost(
+                schema, document_ast, operation_name, variable_values
+            )
+            if analysis is None or not self.enabled:
+                return execute(
+                    root_value,
+                    context_value,
+                    operation_name=operation_name,
+                    variable_values=variable_values,
+                    **options
+                )
+            cost, depth = analysis
+            extensions = {
+                "cost": {
+                    "requested": cost,
+                    "depth": depth,
+                    "maximum": self.max_cost,
+                }
+            }
+            if cost > self.max_cost:
+                error = QueryCostError(
+                    "Query cost {} exceeds the maximum of {}.".format(
+                        cost, self.max_cost
+                    )
+                )
+            elif depth > self.max_depth:
+                error = QueryCostError(
+                    "Query depth {} exceeds the maximum of {}.".format(
+                        depth, self.max_depth
+                    )
+                )
+            else:
+                result = execute(
+                    root_value,
+                    context_value,
+                    operation_name=operation_name,
+                    variable_values=variable_values,
+                    **options
+                )
+                # Subscriptions return an observable instead
+                if isinstance(result, ExecutionResult):
+                    result.extensions.update(extensions)
+                return result
+            return ExecutionResult(
+                errors=[error], invalid=True, extensions=extensions
+            )
+
+        return execute_analyzed
+
+
+cost_analyzer = QueryCostAnalyzer(
+    settings.GRAPHQL_MAX_COST, settings.GRAPHQL_MAX_DEPTH
+)
@@ -0,0 +1,139 @@
+import hashlib
+from functools import partial
+
+from bets.response_cache import response_cache
+from django.conf import settings
+from django.core.cache import cache
+from graphql import GraphQLError
+from graphql.backend import GraphQLCoreBackend, GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.language.parser import parse
+from graphql.validation import validate
+from j8bet_backend.caches import BoundedCache
+from j8bet_backend.graphql.cost import cost_analyzer
+from j8bet_backend.graphql.repeated_queries import repeated_query_detector
+
+PERSISTED_QUERY_VERSION = 1
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+PERSISTED_QUERY_KEY = "graphql:persisted-query:{}"
+
+
+class PersistedQueryError(GraphQLError):
+    """
+    Raised when a persisted query can not be used.
+    """
+
+
+def query_hash(query):
+    """
+    Returns the SHA-256 hex digest identifying a query document.
+    """
+
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    """
+    Executes a document validated beforehand, reporting its validation
+    errors instead if there were any.
+    """
+
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """
+    GraphQL backend which parses and validates each distinct query once.
+    Later requests with the same query, or with the hash of a persisted one,
+    execute the cached document right away. Documents are kept in an LRU
+    cache keyed by schema and query hash.
+
+    :param size: Maximum amount of documents kept in the cache
+    """
+
+    def __init__(self, size, executor=None):
+        super().__init__(executor=executor)
+        self.cache = BoundedCache(size)
+
+    def document_from_hash(self, schema, sha256_hash):
+        """
+        Returns the document of a persisted query, or None if neither this
+        process nor the shared cache know the hash.
+        """
+
+        document = self.cache.get((id(schema), sha256_hash))
+        if document is not None:
+            return document
+        query = cache.get(PERSISTED_QUERY_KEY.format(sha256_hash))
+        if query is None:
+            return None
+        return self.build_document(schema, query, sha256_hash)
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+        sha256_hash = query_hash(document_string)
+        document = self.cache.get((id(schema), sha256_hash))
+        if document is not None:
+            return document
+        return self.build_document(schema, document_string, sha256_hash)
+
+    def build_document(self, schema, query, sha256_hash):
+        """
+        Parses and validates a query, and caches its document. Syntax errors
+        are raised and not cached. Operations over the cost limits are
+        rejected before executing them, and catalog queries are executed
+        through the response cache.
+        """
+
+        document_ast = parse(query)
+        validation_errors = validate(schema, document_ast)
+        execute = partial(
+            execute_validated,
+            schema,
+            document_ast,
+            validation_errors,
+            **self.execute_params
+        )
+        if not validation_errors:
+            execute = response_cache.wrap(schema, document_ast, execute)
+            execute = cost_analyzer.wrap(schema, document_ast, execute)
+            execute = repeated_query_detector.wrap(execute)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=query,
+            document_ast=document_ast,
+            execute=execute,
+        )
+        self.cache.set((id(schema), sha256_hash), document)
+        return document
+
+    def persist_query(self, schema, query, sha256_hash):
+        """
+        Registers a query under its hash, shared with every process through
+        the Django cache for GRAPHQL_PERSISTED_QUERY_TIMEOUT seconds, after
+        which clients register it again.
+
+        :raise PersistedQueryError: If the hash does not match the query, or
+            the query is longer than GRAPHQL_PERSISTED_QUERY_MAX_LENGTH
+        """
+
+        if len(query) > settings.GRAPHQL_PERSISTED_QUERY_MAX_LENGTH:
+            raise PersistedQueryError(
+                "Persisted queries can not be longer than {} characters.".format(
+                    settings.GRAPHQL_PERSISTED_QUERY_MAX_LENGTH
+                )
+            )
+        if query_hash(query) != sha256_hash:
+            raise PersistedQueryError("provided sha does not match query")
+        cache.set(
+            PERSISTED_QUERY_KEY.format(sha256_hash),
+            query,
+            settings.GRAPHQL_PERSISTED_QUERY_TIMEOUT,
+        )
+        return self.document_from_string(schema, query)
+
+
+document_backend = CachedDocumentBackend(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
@@ -0,0 +1,210 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from graphql.type import (
+    GraphQLInterfaceType,
+    GraphQLObjectType,
+    GraphQLUnionType,
+    get_named_type,
+)
+from promise import Promise, is_thenable
+
+# Paths recorded after GRAPHQL_METRICS_MAX_PATHS are added up on this one
+OTHER_PATH = "__other__"
+
+
+class Histogram:
+    """
+    Prometheus style histogram, counting the observed values of each bucket
+    along with their amount and sum.
+
+    :cvar buckets: Sorted upper bounds of the buckets
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        """
+        Returns the lines of the histogram in the Prometheus text format.
+        """
+
+        lines = list()
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(
+                '{}_bucket{{{},le="{}"}} {}'.format(
+                    name, labels, bound, cumulative
+                )
+            )
+        lines.append(
+            '{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, self.count)
+        )
+        lines.append("{}_sum{{{}}} {}".format(name, labels, self.sum))
+        lines.append("{}_count{{{}}} {}".format(name, labels, self.count))
+        return lines
+
+
+class ResolverMetrics:
+    """
+    Thread safe histograms of the wall time, the amount of database queries
+    and the database time of the resolvers of each path, such as
+    allBets.edges.node.quota.
+
+    :cvar max_paths: Maximum amount of paths recorded separately
+    """
+
+    HISTOGRAMS = (
+        (
+            "graphql_resolver_duration_seconds",
+            "Wall time of the resolvers of a path",
+            (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+        ),
+        (
+            "graphql_resolver_queries",
+            "Database queries sent by the resolvers of a path",
+            (0, 1, 2, 5, 10, 25, 50, 100),
+        ),
+        (
+            "graphql_resolver_query_duration_seconds",
+            "Database time of the resolvers of a path",
+            (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+        ),
+    )
+
+    def __init__(self, max_paths):
+        self.max_paths = max_paths
+        self._paths = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, path, duration, queries, query_duration):
+        with self._lock:
+            histograms = self._paths.get(path)
+            if histograms is None:
+                if len(self._paths) >= self.max_paths:
+                    path = OTHER_PATH
+                histograms = self._paths.setdefault(
+                    path,
+                    [Histogram(buckets) for _, _, buckets in self.HISTOGRAMS],
+                )
+            for histogram, value in zip(
+                histograms, (duration, queries, query_duration)
+            ):
+                histogram.observe(value)
+
+    def render(self):
+        """
+        Returns every histogram in the Prometheus text format.
+        """
+
+        lines = list()
+        with self._lock:
+            for index, (name, description, _) in enumerate(self.HISTOGRAMS):
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} histogram".format(name))
+                for path, histograms in sorted(self._paths.items()):
+                    lines.extend(
+                        histograms[index].samples(
+                            name, 'path="{}"'.format(escape_label(path))
+                        )
+                    )
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._paths.clear()
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper which counts the statements of a resolver and
+    the time spent on them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class ProfilingMiddleware:
+    """
+    Graphene middleware which records the wall time, database queries and
+    database time of root fields and of fields returning objects on
+    resolver_metrics. Scalar fields are not profiled, since they are read
+    from their objects. When the request has a graphql_trace list, each
+    resolver is added to it too. It is installed by the GRAPHQL_PROFILING
+    setting.
+
+    Batched resolvers return promises, whose time is recorded when they are
+    resolved. Queries are recorded on the resolver running when they are
+    sent, like the relations prefetched by its queryset. DataLoaders send
+    their batches after the resolvers loading them have returned, so those
+    queries are not recorded on any path.
+    """
+
+    def resolve(self, next, root, info, **args):
+        if not (
+            len(info.path) == 1
+            or isinstance(
+                get_named_type(info.return_type),
+                (GraphQLObjectType, GraphQLInterfaceType, GraphQLUnionType),
+            )
+        ):
+            return next(root, info, **args)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            result = next(root, info, **args)
+
+        def record(value):
+            path = ".".join(
+                str(key) for key in info.path if not isinstance(key, int)
+            )
+            duration = time.perf_counter() - start
+            resolver_metrics.observe(
+                path, duration, recorder.count, recorder.duration
+            )
+            trace = getattr(info.context, "graphql_trace", None)
+            if trace is not None:
+                trace.append(
+                    {
+                        "path": list(info.path),
+                        "duration": duration,
+                        "queries": recorder.count,
+                        "queryDuration": recorder.duration,
+                    }
+                )
+            return value
+
+        if is_thenable(result):
+            return Promise.resolve(result).then(record)
+        return record(result)
+
+
+resolver_metrics = ResolverMetrics(settings.GRAPHQL_METRICS_MAX_PATHS)
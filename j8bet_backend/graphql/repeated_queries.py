@@ -0,0 +1,151 @@
+import logging
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from graphql.backend import GraphQLCoreBackend
+from graphql.execution import MiddlewareManager
+
+logger = logging.getLogger(__name__)
+
+# Parts of a statement which change between executions of the same query
+PARAMETER_LIST_RE = re.compile(r"\((?:%s, )+%s\)")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Statements which are repeated by design, such as the savepoints of nested
+# atomic blocks
+IGNORED_PREFIXES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class RepeatedQueriesError(AssertionError):
+    """
+    Raised when a GraphQL operation repeats the same statement more times
+    than allowed, which usually means a resolver queries once per object.
+    """
+
+
+def statement_shape(sql):
+    """
+    Returns a statement without the values which change between executions
+    of the same query, such as the amount of parameters of an IN list or
+    the numbers of LIMIT and OFFSET.
+    """
+
+    shape = PARAMETER_LIST_RE.sub("(%s, ...)", sql)
+    shape = NUMBER_RE.sub("?", shape)
+    return WHITESPACE_RE.sub(" ", shape).strip()
+
+
+class OperationLog:
+    """
+    Records the statements of a GraphQL operation, by shape, along with the
+    path of the resolver which sent them. It is both a database execute
+    wrapper and a graphene middleware: statements are attributed to the
+    last resolver called, which also covers lazy querysets evaluated while
+    its value is completed.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.shapes = OrderedDict()
+
+    def resolve(self, next, root, info, **args):
+        self.path = ".".join(
+            str(key) for key in info.path if not isinstance(key, int)
+        )
+        return next(root, info, **args)
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+            self.shapes.setdefault(statement_shape(sql), list()).append(
+                self.path
+            )
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """
+        Returns the shapes sent more than threshold times, with the paths
+        which sent them.
+        """
+
+        return [
+            (shape, paths)
+            for shape, paths in self.shapes.items()
+            if len(paths) > threshold
+        ]
+
+
+class RepeatedQueryDetector:
+    """
+    Detector of GraphQL operations which send the same statement more than
+    threshold times, logging them, or raising a RepeatedQueriesError when
+    raise_errors is set, as done by the tests.
+
+    :cvar threshold: Times a statement can be sent by an operation, 0
+        disables the detector
+    :cvar raise_errors: Whether operations over the threshold fail
+    """
+
+    def __init__(self, threshold, raise_errors=False):
+        self.threshold = threshold
+        self.raise_errors = raise_errors
+
+    def wrap(self, execute):
+        """
+        Returns an execute function which records the statements of each
+        operation and reports the repeated ones.
+        """
+
+        def execute_detected(*args, **options):
+            # Subscriptions resolve their events long after being executed
+            if not self.threshold or options.get("allow_subscriptions"):
+                return execute(*args, **options)
+            log = OperationLog()
+            middleware = options.get("middleware") or list()
+            if isinstance(middleware, MiddlewareManager):
+                middleware = middleware.middlewares
+            options["middleware"] = list(middleware) + [log]
+            with connection.execute_wrapper(log):
+                result = execute(*args, **options)
+            self.report(log)
+            return result
+
+        return execute_detected
+
+    def report(self, log):
+        repeated = log.repeated(self.threshold)
+        if not repeated:
+            return
+        message = "\n".join(
+            "{} statements from {}: {}".format(
+                len(paths),
+                ", ".join(sorted({path or "the operation" for path in paths})),
+                shape,
+            )
+            for shape, paths in repeated
+        )
+        message = "Statements repeated more than {} times:\n{}".format(
+            self.threshold, message
+        )
+        if self.raise_errors:
+            raise RepeatedQueriesError(message)
+        logger.warning(message)
+
+
+class RepeatedQueryBackend(GraphQLCoreBackend):
+    """
+    GraphQL backend which runs every operation through the detector, used
+    as the default backend by the tests.
+    """
+
+    def document_from_string(self, schema, document_string):
+        document = super().document_from_string(schema, document_string)
+        document.execute = repeated_query_detector.wrap(document.execute)
+        return document
+
+
+repeated_query_detector = RepeatedQueryDetector(
+    settings.REPEATED_QUERY_THRESHOLD
+)
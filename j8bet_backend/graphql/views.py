@@ -0,0 +1,168 @@
+import json
+
+from bets.response_cache import response_cache
+from bets.tags import tag_cache
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.crypto import constant_time_compare
+from graphene_django.views import GraphQLView
+from graphql.execution import ExecutionResult
+from j8bet_backend.graphql.documents import (
+    PERSISTED_QUERY_NOT_FOUND,
+    PERSISTED_QUERY_VERSION,
+    PersistedQueryError,
+    document_backend,
+)
+from j8bet_backend.graphql.profiling import resolver_metrics
+
+# Header which asks for the trace of the resolvers of a request
+TRACE_HEADER = "HTTP_X_GRAPHQL_TRACE"
+
+
+class PersistedQueryGraphQLView(GraphQLView):
+    """
+    GraphQLView which caches parsed and validated documents, and accepts
+    automatic persisted queries: a request may send the SHA-256 hash of a
+    query on extensions.persistedQuery instead of the query itself, which
+    fails with PersistedQueryNotFound until the query is sent along with
+    its hash once.
+    """
+
+    def __init__(self, backend=None, **kwargs):
+        super().__init__(backend=backend or document_backend, **kwargs)
+
+    def get_persisted_query(self, request, data, query):
+        """
+        Returns the query of a request, registering it or looking it up by
+        its hash if the request uses a persisted query.
+
+        :raise PersistedQueryError: If the persisted query can not be used
+        """
+
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise PersistedQueryError("Extensions are invalid JSON.")
+        persisted_query = (extensions or dict()).get("persistedQuery")
+        if not persisted_query:
+            return query
+        if persisted_query.get("version") != PERSISTED_QUERY_VERSION:
+            raise PersistedQueryError("Unsupported persisted query version.")
+        sha256_hash = persisted_query.get("sha256Hash") or ""
+        backend = self.get_backend(request)
+        if query:
+            backend.persist_query(self.schema, query, sha256_hash)
+            return query
+        document = backend.document_from_hash(self.schema, sha256_hash)
+        if document is None:
+            raise PersistedQueryError(
+                PERSISTED_QUERY_NOT_FOUND,
+                extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+            )
+        return document.document_string
+
+    def execute_graphql_request(
+        self,
+        request,
+        data,
+        query,
+        variables,
+        operation_name,
+        show_graphiql=False,
+    ):
+        try:
+            query = self.get_persisted_query(request, data, query)
+        except PersistedQueryError as error:
+            return ExecutionResult(errors=[error], invalid=True)
+        # Traces are only given to staff users, or to anyone while debugging
+        if request.META.get(TRACE_HEADER) and (
+            settings.DEBUG or request.user.is_staff
+        ):
+            request.graphql_trace = list()
+        result = super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        trace = getattr(request, "graphql_trace", None)
+        if result and trace is not None:
+            result.extensions["trace"] = {"resolvers": trace}
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        """
+        Returns the response of a request like GraphQLView, along with the
+        extensions of its result, such as the cost of the operation.
+        """
+
+        query, variables, operation_name, id = self.get_graphql_params(
+            request, data
+        )
+        # Never None, since GraphiQL is rendered before executing anything
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        response = dict()
+        status_code = 200
+        if execution_result.errors:
+            response["errors"] = [
+                self.format_error(error) for error in execution_result.errors
+            ]
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+        result = self.json_encode(request, response, pretty=show_graphiql)
+        return result, status_code
+
+
+def document_cache_stats(request):
+    """
+    Returns the counters of the document and response caches of this
+    process.
+    """
+
+    return JsonResponse(
+        {
+            "documents": document_backend.cache.stats(),
+            "responses": response_cache.stats(),
+        }
+    )
+
+
+def metrics(request):
+    """
+    Returns the resolver metrics and the cache counters of this process in
+    the Prometheus text format, to staff users or to requests with the
+    METRICS_TOKEN as bearer token.
+    """
+
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if not (
+        settings.METRICS_TOKEN
+        and constant_time_compare(
+            authorization, "Bearer {}".format(settings.METRICS_TOKEN)
+        )
+    ) and not (request.user.is_active and request.user.is_staff):
+        return HttpResponseForbidden()
+    lines = resolver_metrics.render()
+    for cache_name, stats in (
+        ("documents", document_backend.cache.stats()),
+        ("responses", response_cache.stats()),
+        ("tags", tag_cache.stats()),
+    ):
+        for stat, value in sorted(stats.items()):
+            name = "graphql_{}_cache_{}".format(cache_name, stat)
+            metric_type = "gauge"
+            if stat in ("hits", "misses", "evictions"):
+                name, metric_type = name + "_total", "counter"
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            lines.append("{} {}".format(name, value))
+    return HttpResponse(
+        "\n".join(lines) + "\n", content_type="text/plain; version=0.0.4"
+    )
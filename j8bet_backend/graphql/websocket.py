@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from graphql.execution import ExecutionResult
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.shortcuts import get_user_by_token
+from j8bet_backend.graphql.documents import document_backend
+from promise import Promise
+from rx import Observable
+
+logger = logging.getLogger(__name__)
+
+# Messages of the graphql-ws protocol, as spoken by Apollo clients
+SUBPROTOCOL = "graphql-ws"
+GQL_CONNECTION_INIT = "connection_init"
+GQL_CONNECTION_ACK = "connection_ack"
+GQL_CONNECTION_ERROR = "connection_error"
+GQL_CONNECTION_TERMINATE = "connection_terminate"
+GQL_START = "start"
+GQL_DATA = "data"
+GQL_ERROR = "error"
+GQL_COMPLETE = "complete"
+GQL_STOP = "stop"
+
+
+class SubscriptionContext:
+    """
+    Context of an operation run over a websocket, taking the place of the
+    request of GraphQLView.
+
+    :cvar user: User who opened the connection
+    :cvar loaders: DataLoaders of the operation, see bets.graphql.loaders
+    :cvar dispatch: Callable which runs a function with its arguments on
+        the connection, from any thread, see GraphQLWebSocketConnection
+    """
+
+    def __init__(self, user, dispatch=None):
+        self.user = user
+        self.loaders = None
+        self.dispatch = dispatch
+
+
+def authenticate(payload):
+    """
+    Returns the User of the JSON Web Token sent on connection_init, with the
+    same prefix expected on the Authorization header, or an AnonymousUser.
+
+    :param payload: Payload of the connection_init message
+    """
+
+    token = (payload or dict()).get("Authorization") or ""
+    prefix = "{} ".format(jwt_settings.JWT_AUTH_HEADER_PREFIX)
+    if not token.startswith(prefix):
+        return AnonymousUser()
+    return get_user_by_token(token[len(prefix) :]) or AnonymousUser()
+
+
+class GraphQLWebSocketConnection:
+    """
+    A websocket connection serving GraphQL operations. Published messages
+    are handed from the threads publishing them to the event loop of the
+    connection, which resolves them one at a time on a worker thread and
+    sends the results through a queue.
+    """
+
+    def __init__(self, schema, scope, receive, send):
+        self.schema = schema
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.loop = asyncio.get_running_loop()
+        self.outgoing = asyncio.Queue()
+        self.deliveries = asyncio.Queue()
+        self.operations = dict()
+        self.user = None
+
+    def push(self, message):
+        """
+        Queues a message to the client, or None to close the connection.
+        Safe to call from any thread.
+        """
+
+        self.loop.call_soon_threadsafe(self.outgoing.put_nowait, message)
+
+    def dispatch(self, function, *args):
+        """
+        Queues a call to be run by process_deliveries. Safe to call from any
+        thread, so publishers return without resolving any result.
+        """
+
+        self.loop.call_soon_threadsafe(
+            self.deliveries.put_nowait, (function, args)
+        )
+
+    async def process_deliveries(self):
+        # A single call at a time keeps the order of the messages, and the
+        # DataLoaders of an operation on one thread
+        while True:
+            function, args = await self.deliveries.get()
+            try:
+                await sync_to_async(function)(*args)
+            except Exception:
+                logger.exception("Delivery to a websocket failed")
+
+    async def send_messages(self):
+        while True:
+            message = await self.outgoing.get()
+            if message is None:
+                await self.send({"type": "websocket.close"})
+                return
+            await self.send(
+                {"type": "websocket.send", "text": json.dumps(message)}
+            )
+
+    async def run(self):
+        message = await self.receive()
+        if message["type"] != "websocket.connect":
+            return
+        accept = {"type": "websocket.accept"}
+        if SUBPROTOCOL in self.scope.get("subprotocols", list()):
+            accept["subprotocol"] = SUBPROTOCOL
+        await self.send(accept)
+        sender = asyncio.ensure_future(self.send_messages())
+        processor = asyncio.ensure_future(self.process_deliveries())
+        try:
+            while True:
+                message = await self.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if not await self.handle(
+                    json.loads(message.get("text") or message["bytes"])
+                ):
+                    # Queued after the pending messages, which are sent first
+                    self.push(None)
+                    await sender
+                    break
+        finally:
+            for operation_id in list(self.operations):
+                self.stop(operation_id)
+            processor.cancel()
+            sender.cancel()
+
+    async def handle(self, message):
+        """
+        Handles a message from the client.
+
+        :return: False if the connection has to be closed
+        """
+
+        message_type = message.get("type")
+        operation_id = message.get("id")
+        if message_type == GQL_CONNECTION_INIT:
+            try:
+                self.user = await sync_to_async(authenticate)(
+                    message.get("payload")
+                )
+            except JSONWebTokenError as error:
+                self.push(
+                    {
+                        "type": GQL_CONNECTION_ERROR,
+                        "payload": {"message": str(error)},
+                    }
+                )
+                return False
+            self.push({"type": GQL_CONNECTION_ACK})
+        elif message_type == GQL_CONNECTION_TERMINATE:
+            return False
+        elif self.user is None:
+            self.push(
+                {
+                    "type": GQL_CONNECTION_ERROR,
+                    "payload": {"message": "Connection not initialized."},
+                }
+            )
+            return False
+        elif message_type == GQL_START:
+            await sync_to_async(self.start)(
+                operation_id, message.get("payload") or dict()
+            )
+        elif message_type == GQL_STOP:
+            self.stop(operation_id)
+            self.push({"type": GQL_COMPLETE, "id": operation_id})
+        else:
+            self.push(
+                {
+                    "type": GQL_ERROR,
+                    "id": operation_id,
+                    "payload": {"message": "Unknown message type."},
+                }
+            )
+        return True
+
+    def start(self, operation_id, payload):
+        """
+        Executes an operation. Subscriptions keep sending data until they
+        are stopped, other operations send their single result.
+        """
+
+        self.stop(operation_id)
+        result = self.schema.execute(
+            payload.get("query"),
+            context_value=SubscriptionContext(self.user, self.dispatch),
+            variable_values=payload.get("variables"),
+            operation_name=payload.get("operationName"),
+            backend=document_backend,
+            allow_subscriptions=True,
+        )
+        if not isinstance(result, Observable):
+            self.send_result(operation_id, result)
+            self.push({"type": GQL_COMPLETE, "id": operation_id})
+            return
+        self.operations[operation_id] = result.subscribe(
+            on_next=lambda result: self.send_result(operation_id, result),
+            on_error=lambda error: self.send_result(
+                operation_id, ExecutionResult(errors=[error], invalid=True)
+            ),
+            on_completed=lambda: self.push(
+                {"type": GQL_COMPLETE, "id": operation_id}
+            ),
+        )
+
+    def send_result(self, operation_id, result):
+        # Fields of subscription results are completed as promises, which
+        # only dispatch their DataLoaders once waited for
+        if result.data:
+            try:
+                result.data = {
+                    key: Promise.resolve(value).get()
+                    for key, value in result.data.items()
+                }
+            except Exception as error:  # pragma: no cover
+                # Errors of nullable fields are already caught by graphql
+                result = ExecutionResult(data=None, errors=[error])
+        self.push(
+            {"type": GQL_DATA, "id": operation_id, "payload": result.to_dict()}
+        )
+
+    def stop(self, operation_id):
+        subscription = self.operations.pop(operation_id, None)
+        if subscription is not None:
+            subscription.dispose()
+
+
+class GraphQLWebSocketApp:
+    """
+    ASGI application serving GraphQL operations, subscriptions included,
+    over websockets with the graphql-ws protocol. Users authenticate sending
+    the same Authorization value used with GraphQLView on the payload of
+    connection_init, anonymous connections are accepted otherwise.
+
+    :param schema: GraphQL schema, or None to use the GRAPHENE setting
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            raise ValueError(
+                "GraphQLWebSocketApp can not handle {} connections".format(
+                    scope["type"]
+                )
+            )
+        if self.schema is None:
+            from graphene_django.settings import graphene_settings
+
+            self.schema = graphene_settings.SCHEMA
+        await GraphQLWebSocketConnection(
+            self.schema, scope, receive, send
+        ).run()
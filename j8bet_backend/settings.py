@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 import os
 
 # from datetime import timedelta
+from decimal import Decimal
 from pathlib import Path
 
 import environ
@@ -77,9 +78,18 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Resolver timings and query counts recorded in process by
+# j8bet_backend.graphql.profiling, only while debugging unless set otherwise
+GRAPHQL_PROFILING = ENV.bool("GRAPHQL_PROFILING", default=DEBUG)
+
 GRAPHENE = {
     "SCHEMA": "j8bet_backend.graphql.api.schema",
-    "MIDDLEWARE": ["graphql_jwt.middleware.JSONWebTokenMiddleware",],
+    "MIDDLEWARE": ["graphql_jwt.middleware.JSONWebTokenMiddleware"]
+    + (
+        ["j8bet_backend.graphql.profiling.ProfilingMiddleware"]
+        if GRAPHQL_PROFILING
+        else []
+    ),
 }
 
 AUTHENTICATION_BACKENDS = {
@@ -268,3 +278,92 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
+
+# Group names of each user are cached in process by users.roles
+ROLE_CACHE_SIZE = ENV.int("ROLE_CACHE_SIZE", default=10000)
+ROLE_CACHE_TIMEOUT = ENV.int("ROLE_CACHE_TIMEOUT", default=300)
+
+# Maximum amount of bets placed with a single placeBets mutation
+BET_SLIP_MAX_ENTRIES = ENV.int("BET_SLIP_MAX_ENTRIES", default=100)
+
+# Seconds during which the active odds formula is cached in process by
+# bets.odds
+ODDS_CACHE_TIMEOUT = ENV.int("ODDS_CACHE_TIMEOUT", default=60)
+
+# Publish/subscribe hub fanning out GraphQL subscriptions, see bets.pubsub.
+# bets.pubsub.BrokerPubSub relays them between processes through a broker
+PUBSUB = {
+    "BACKEND": ENV("PUBSUB_BACKEND", default="bets.pubsub.InProcessPubSub"),
+    "OPTIONS": ENV.json("PUBSUB_OPTIONS", default={}),
+}
+
+# Parsed and validated GraphQL documents cached in process by
+# j8bet_backend.graphql.documents
+GRAPHQL_DOCUMENT_CACHE_SIZE = ENV.int(
+    "GRAPHQL_DOCUMENT_CACHE_SIZE", default=1000
+)
+
+# Persisted queries are kept on the Django cache for this many seconds, and
+# longer queries are not persisted, so clients can not fill the cache
+GRAPHQL_PERSISTED_QUERY_TIMEOUT = ENV.int(
+    "GRAPHQL_PERSISTED_QUERY_TIMEOUT", default=86400
+)
+GRAPHQL_PERSISTED_QUERY_MAX_LENGTH = ENV.int(
+    "GRAPHQL_PERSISTED_QUERY_MAX_LENGTH", default=20000
+)
+
+# Cache shared by every process, e.g. rediscache://host:6379/0
+CACHES = {"default": ENV.cache("CACHE_URL", default="locmemcache://")}
+
+# Seconds during which responses of catalog queries are cached by
+# bets.response_cache, unless the models they list change before
+RESPONSE_CACHE_TIMEOUT = ENV.int("RESPONSE_CACHE_TIMEOUT", default=300)
+
+# IDs of the most used Tags cached in process by bets.tags, by normalized name
+TAG_CACHE_SIZE = ENV.int("TAG_CACHE_SIZE", default=10000)
+TAG_CACHE_TIMEOUT = ENV.int("TAG_CACHE_TIMEOUT", default=300)
+
+# Maximum amount of results and milliseconds given to a search query of
+# bets.search
+SEARCH_MAX_RESULTS = ENV.int("SEARCH_MAX_RESULTS", default=50)
+SEARCH_TIMEOUT = ENV.int("SEARCH_TIMEOUT", default=200)
+
+# Limits of the amount of a single bet, and of the stake and liability of
+# the open bets of every Quota, Event and User, enforced on placement by
+# bets.placement. Exposures with their own limits replace the ones of their
+# scope. Empty limits are not enforced
+BET_MIN_AMOUNT = ENV("BET_MIN_AMOUNT", cast=Decimal, default=Decimal("0.01"))
+BET_MAX_AMOUNT = ENV("BET_MAX_AMOUNT", cast=Decimal, default=None)
+EXPOSURE_LIMITS = {
+    "quota": {
+        "stake": ENV("QUOTA_MAX_STAKE", cast=Decimal, default=None),
+        "liability": ENV("QUOTA_MAX_LIABILITY", cast=Decimal, default=None),
+    },
+    "event": {
+        "stake": ENV("EVENT_MAX_STAKE", cast=Decimal, default=None),
+        "liability": ENV("EVENT_MAX_LIABILITY", cast=Decimal, default=None),
+    },
+    "user": {
+        "stake": ENV("USER_MAX_STAKE", cast=Decimal, default=None),
+        "liability": ENV("USER_MAX_LIABILITY", cast=Decimal, default=None),
+    },
+}
+
+# Maximum cost and depth of a GraphQL operation, computed before executing
+# it by j8bet_backend.graphql.cost
+GRAPHQL_MAX_COST = ENV.int("GRAPHQL_MAX_COST", default=50000)
+GRAPHQL_MAX_DEPTH = ENV.int("GRAPHQL_MAX_DEPTH", default=20)
+
+# Resolver metrics of GRAPHQL_PROFILING, served on graphql/metrics to staff
+# users or to requests with the "Authorization: Bearer METRICS_TOKEN" header
+GRAPHQL_METRICS_MAX_PATHS = ENV.int("GRAPHQL_METRICS_MAX_PATHS", default=1000)
+METRICS_TOKEN = ENV("METRICS_TOKEN", default=None)
+
+# GraphQL operations sending the same statement more than this amount of
+# times are logged by j8bet_backend.graphql.repeated_queries, 0 disables it.
+# Tests fail on operations over REPEATED_QUERY_TEST_THRESHOLD instead
+REPEATED_QUERY_THRESHOLD = ENV.int("REPEATED_QUERY_THRESHOLD", default=0)
+REPEATED_QUERY_TEST_THRESHOLD = ENV.int(
+    "REPEATED_QUERY_TEST_THRESHOLD", default=2
+)
+TEST_RUNNER = "j8bet_backend.test_runner.RepeatedQueryTestRunner"
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from graphql.backend import get_default_backend, set_default_backend
+from j8bet_backend.graphql.repeated_queries import (
+    RepeatedQueryBackend,
+    repeated_query_detector,
+)
+
+
+class RepeatedQueryTestRunner(DiscoverRunner):
+    """
+    Test runner which fails every GraphQL operation of the tests sending
+    the same statement more than REPEATED_QUERY_TEST_THRESHOLD times, so
+    tests checking responses catch N+1 queries too.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._detector_settings = (
+            repeated_query_detector.threshold,
+            repeated_query_detector.raise_errors,
+        )
+        self._default_backend = get_default_backend()
+        repeated_query_detector.threshold = (
+            settings.REPEATED_QUERY_TEST_THRESHOLD
+        )
+        repeated_query_detector.raise_errors = True
+        set_default_backend(RepeatedQueryBackend())
+
+    def teardown_test_environment(self, **kwargs):
+        (
+            repeated_query_detector.threshold,
+            repeated_query_detector.raise_errors,
+        ) = self._detector_settings
+        set_default_backend(self._default_backend)
+        super().teardown_test_environment(**kwargs)
@@ -14,15 +14,27 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path("blog/", include("blog.urls"))
 """
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+from j8bet_backend.graphql.views import (
+    PersistedQueryGraphQLView,
+    document_cache_stats,
+    metrics,
+)
 
+# The admin site is mounted at the root, so its catch-all view goes last
 urlpatterns = [
-    path("", admin.site.urls),
     path(
         "graphql",
-        csrf_exempt(GraphQLView.as_view(graphiql=True)),
+        csrf_exempt(PersistedQueryGraphQLView.as_view(graphiql=True)),
         name="graphql",
     ),
+    path(
+        "graphql/cache",
+        staff_member_required(document_cache_stats),
+        name="graphql_cache",
+    ),
+    path("graphql/metrics", metrics, name="graphql_metrics"),
+    path("", admin.site.urls),
 ]
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     name = "users"
     verbose_name = "Usuarios"
+
+    def ready(self):
+        from django.contrib.auth.models import Group
+        from users.models import User
+        from users.roles import invalidate_all_roles, invalidate_group_members
+
+        m2m_changed.connect(
+            invalidate_group_members, sender=User.groups.through
+        )
+        post_save.connect(invalidate_all_roles, sender=Group)
+        post_delete.connect(invalidate_all_roles, sender=Group)
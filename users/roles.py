@@ -0,0 +1,70 @@
+from django.conf import settings
+from j8bet_backend.caches import BoundedCache
+
+# Group names of each user. Entries expire so that memberships changed by
+# another process are eventually seen, while the receivers below drop the
+# ones changed by this process
+role_cache = BoundedCache(settings.ROLE_CACHE_SIZE, settings.ROLE_CACHE_TIMEOUT)
+
+
+def get_roles(user):
+    """
+    Returns the names of the groups of a user.
+    Roles are kept on the user object, which lives as long as the request,
+    and on the process cache, so repeated checks do not query the database.
+
+    :param user: User whose roles are requested
+    :return: Frozenset of group names
+    """
+
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, "_roles", None)
+    if roles is None:
+        roles = role_cache.get(user.pk)
+        if roles is None:
+            roles = frozenset(user.groups.values_list("name", flat=True))
+            role_cache.set(user.pk, roles)
+        user._roles = roles
+    return roles
+
+
+def has_role(user, *roles):
+    """
+    Returns whether a user belongs to any of the given groups.
+
+    :param user: User being checked
+    :param roles: Group names
+    """
+
+    return not get_roles(user).isdisjoint(roles)
+
+
+def invalidate_group_members(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Signal receiver which invalidates cached roles when group memberships
+    change, from either side of the relation.
+    """
+
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        # User.groups changed
+        instance.__dict__.pop("_roles", None)
+        role_cache.invalidate([instance.pk])
+    elif action == "post_clear" or pk_set is None:
+        # Group.user_set was cleared, so its members are not known anymore
+        role_cache.invalidate()
+    else:
+        role_cache.invalidate(pk_set)
+
+
+def invalidate_all_roles(sender, **kwargs):
+    """
+    Signal receiver which invalidates every cached role, used when groups
+    are renamed or deleted.
+    """
+
+    role_cache.invalidate()
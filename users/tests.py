@@ -1,13 +1,16 @@
-from django.contrib.auth.models import Group
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Group
 from django.test import RequestFactory, TestCase
 from django.urls import reverse
 from graphene import Node, Schema
 from graphene.test import Client
 from graphql_jwt.testcases import JSONWebTokenTestCase
-from j8bet_backend.constants import BET_CONSUMER
+from j8bet_backend.caches import BoundedCache
+from j8bet_backend.constants import BET_CONSUMER, BET_MANAGER
 from users.factories import UserFactory
 from users.graphql.schema import Mutation as UserMutation
 from users.graphql.schema import Query as UserQuery
+from users.roles import has_role, role_cache
 
 
 class QueryTest(JSONWebTokenTestCase):
@@ -156,3 +159,81 @@ class CreateUserMutationTest(TestCase):
             executed["data"]["createUser"]["user"]["username"],
         )
         self.assertEqual(email, executed["data"]["createUser"]["user"]["email"])
+
+
+class RoleTest(TestCase):
+    def setUp(self):
+        self.bet_consumer_group = Group.objects.get(name=BET_CONSUMER)
+        self.bet_manager_group = Group.objects.get(name=BET_MANAGER)
+        self.user = UserFactory.create(groups=(self.bet_consumer_group,))
+        role_cache.invalidate()
+        super().setUp()
+
+    def test_01_cached_roles(self):
+        """
+        This test evaluates that roles are loaded once and then served from
+        the request and process caches.
+        """
+
+        with self.assertNumQueries(1):
+            self.assertTrue(has_role(self.user, BET_CONSUMER))
+            self.assertFalse(has_role(self.user, BET_MANAGER))
+        # A new request loads a new User object, which uses the process cache
+        user = get_user_model().objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(user, BET_CONSUMER, BET_MANAGER))
+        self.assertFalse(has_role(AnonymousUser(), BET_CONSUMER))
+
+    def test_02_invalidation(self):
+        """
+        This test evaluates that group membership changes from either side
+        invalidate cached roles.
+        """
+
+        self.assertFalse(has_role(self.user, BET_MANAGER))
+        self.user.groups.add(self.bet_manager_group)
+        self.assertTrue(has_role(self.user, BET_MANAGER))
+
+        self.bet_manager_group.user_set.remove(self.user)
+        user = get_user_model().objects.get(id=self.user.id)
+        self.assertFalse(has_role(user, BET_MANAGER))
+
+        self.bet_consumer_group.user_set.clear()
+        user = get_user_model().objects.get(id=self.user.id)
+        self.assertFalse(has_role(user, BET_CONSUMER))
+
+        self.user.groups.add(self.bet_consumer_group)
+        self.assertTrue(has_role(self.user, BET_CONSUMER))
+        self.bet_consumer_group.name = "Renamed"
+        self.bet_consumer_group.save()
+        self.assertEqual(len(role_cache), 0)
+
+    def test_03_bounded_cache(self):
+        """
+        This test evaluates that the bounded cache of roles, tags and
+        documents evicts the least recently used entries and expires old
+        ones.
+        """
+
+        cache = BoundedCache(size=2, timeout=60)
+        cache.set(1, frozenset())
+        cache.set(2, frozenset())
+        cache.get(1)
+        cache.set(3, frozenset())
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(1))
+        cache.invalidate([1])
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get_many([1, 3]), {3: frozenset()})
+        self.assertEqual(
+            cache.stats(),
+            dict(hits=3, misses=3, evictions=1, size=1, max_size=2),
+        )
+        cache.clear()
+        self.assertEqual(cache.stats()["hits"], 0)
+
+        cache = BoundedCache(size=2, timeout=-1)
+        cache.set(1, frozenset())
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)